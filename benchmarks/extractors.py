@@ -0,0 +1,65 @@
+"""
+Benchmark - site extractors.
+
+Runs every registered extractor (torrench.utilities.extractor) on
+its saved fixture pages (benchmarks/fixtures/<site>_*.html), and
+reports rows/sec of the shared extraction loop.
+Sites without fixture pages are listed as skipped.
+
+Usage: python benchmarks/extractors.py [rounds]
+"""
+import os
+import sys
+import glob
+import time
+import lxml.html
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import torrench.modules.distrowatch
+import torrench.modules.kickasstorrent
+import torrench.modules.linuxtracker
+import torrench.modules.nyaa
+import torrench.modules.skytorrents
+import torrench.modules.thepiratebay
+import torrench.modules.xbit
+from torrench.utilities.extractor import EXTRACTORS
+
+# Site modules; importing one registers its extractor(s) in EXTRACTORS.
+SITE_MODULES = [
+    torrench.modules.distrowatch,
+    torrench.modules.kickasstorrent,
+    torrench.modules.linuxtracker,
+    torrench.modules.nyaa,
+    torrench.modules.skytorrents,
+    torrench.modules.thepiratebay,
+    torrench.modules.xbit,
+]
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def main():
+    """Execution begins here."""
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print("%d site modules, %d extractors, %d rounds\n" % (len(SITE_MODULES), len(EXTRACTORS), rounds))
+    print("%-15s %8s %15s" % ("site", "rows", "rows/s"))
+    for site in sorted(EXTRACTORS):
+        extractor = EXTRACTORS[site]
+        paths = sorted(glob.glob(os.path.join(FIXTURES, '%s_*.html' % (site))))
+        if not paths:
+            print("%-15s %8s %15s" % (site, '-', 'skipped'))
+            continue
+        pages = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                pages.append(lxml.html.fromstring(f.read()))
+        rows = 0
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            for page in pages:
+                rows += len(extractor.extract(page))
+        elapsed = time.perf_counter() - start_time
+        print("%-15s %8d %15.0f" % (site, rows // rounds, rows / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark - TPB result page parsing.
+
+Compares ThePirateBay.parse_page() (lxml, precompiled XPath) with
+parse_page_soup() (BeautifulSoup, the parser it replaced) on saved
+fixture pages (benchmarks/fixtures/tpb_*.html). Both must give the same results.
+
+Rows/sec is given for:
+    - extract:: Extracting results from an already built document.
+    - total:: Building the document (lxml tree / soup) + extracting.
+
+Usage: python benchmarks/tpb_parse.py [rounds]
+"""
+import os
+import sys
+import glob
+import time
+import lxml.html
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from torrench.modules.thepiratebay import ThePirateBay
+from torrench.utilities.result import TorrentResult
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'tpb_*.html')
+PROXY = 'https://thepiratebay.org'
+
+
+def get_parser():
+    """ThePirateBay object for parsing only (no proxy lookup/network)."""
+    tpb = ThePirateBay.__new__(ThePirateBay)
+    tpb.proxy = PROXY
+    tpb.OS_WIN = False
+    return tpb
+
+
+def parse_page_soup(tpb, soup):
+    """
+    Parse one result page (BeautifulSoup).
+
+    Reference implementation of ThePirateBay.parse_page() (the parser
+    it replaced); same results, but several times slower.
+    """
+    content = soup.find('table', id="searchResult")
+    if content is None:
+        return None
+    results = []
+    data = content.find_all('tr')
+    for i in data[1:]:
+        name = i.find('a', class_='detLink').string
+        uploader = i.find('font', class_="detDesc").a
+        if name is None:
+            name = i.find('a', class_='detLink')['title'].split(" ")[2:]
+            name = " ".join(str(x) for x in name)
+        if uploader is None:
+            uploader = i.find('font', class_="detDesc").i.string
+        else:
+            uploader = uploader.string
+        comments = i.find(
+            'img', {'src': '//%s/static/img/icon_comment.gif' % (tpb.proxy.split('/')[2])})
+        # Total number of comments
+        if comments is None:
+            comment = '0'
+        else:
+            comment = comments['alt'].split(" ")[-2]
+        # See if uploader is VIP/Truested/Normal Uploader
+        status = None
+        if i.find('img', {'title': "VIP"}) is not None:
+            status = 'VIP'
+        elif i.find('img', {'title': 'Trusted'}) is not None:
+            status = 'Trusted'
+        categ = i.find('td', class_="vertTh").find_all('a')[0].string
+        sub_categ = i.find('td', class_="vertTh").find_all('a')[1].string
+        seeds = i.find_all('td', align="right")[0].string
+        leeches = i.find_all('td', align="right")[1].string
+        date = i.find('font', class_="detDesc").get_text().split(' ')[1].replace(',', "")
+        size = i.find('font', class_="detDesc").get_text().split(' ')[3].replace(',', "")
+        # Unique torrent id
+        torr_id = i.find('a', {'class': 'detLink'})["href"].split('/')[2]
+        magnet = i.find_all('a', {'title': 'Download this torrent using magnet'})[0]['href']
+        results.append(tpb.make_result(categ + " > " + sub_categ, name, uploader, size,
+                                       seeds, leeches, date, comment, status, torr_id, magnet))
+    return results
+
+
+def values(results):
+    """Comparable values of results (list of TorrentResult)."""
+    return [tuple(getattr(result, name) for name in TorrentResult.__slots__) for result in results]
+
+
+def bench(build, extract, pages, rounds):
+    """Return (rows, extract time, total time) over all rounds."""
+    rows = 0
+    extract_time = 0
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        for raw in pages:
+            document = build(raw)
+            extract_start = time.perf_counter()
+            rows += len(extract(document))
+            extract_time += time.perf_counter() - extract_start
+    return rows, extract_time, time.perf_counter() - start_time
+
+
+def main():
+    """Execution begins here."""
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    pages = []
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    if not pages:
+        sys.exit("No fixture pages found (%s)" % (FIXTURES))
+    tpb = get_parser()
+
+    for raw in pages:
+        expected = values(parse_page_soup(tpb, BeautifulSoup(raw, 'lxml')))
+        if values(tpb.parse_page(lxml.html.fromstring(raw))) != expected:
+            sys.exit("Results differ! (lxml vs BeautifulSoup)")
+
+    print("%d fixture page(s), %d rounds\n" % (len(pages), rounds))
+    print("%-15s %15s %15s" % ("parser", "extract rows/s", "total rows/s"))
+    timings = {}
+    for label, build, extract in [
+            ('BeautifulSoup', lambda raw: BeautifulSoup(raw, 'lxml'),
+                lambda soup: parse_page_soup(tpb, soup)),
+            ('lxml/XPath', lxml.html.fromstring, tpb.parse_page)]:
+        rows, extract_time, total_time = bench(build, extract, pages, rounds)
+        timings[label] = (rows / extract_time, rows / total_time)
+        print("%-15s %15.0f %15.0f" % (label, rows / extract_time, rows / total_time))
+    print("\nSpeed-up: %.1fx (extract), %.1fx (total)" % (
+        timings['lxml/XPath'][0] / timings['BeautifulSoup'][0],
+        timings['lxml/XPath'][1] / timings['BeautifulSoup'][1]))
+
+
+if __name__ == "__main__":
+    main()
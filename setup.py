@@ -21,7 +21,8 @@ setup(
     license="GPL",
     url="https://github.com/kryptxy/torrench",
     packages=['torrench', 'torrench.modules','torrench.utilities'],
-    install_requires=['beautifulsoup4','lxml','requests','tabulate','colorama', 'pyperclip'],
+    install_requires=['beautifulsoup4','lxml','requests','colorama', 'pyperclip'],
+    python_requires='>=3.7',
     long_description=(LONG_DESCRIPTION),
     entry_points={'console_scripts': ['torrench = torrench.__main__:main']},
     zip_safe=False,
@@ -33,9 +34,9 @@ setup(
         "Operating System :: Microsoft :: Windows",
         "Operating System :: POSIX",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
         "Topic :: Utilities",
     ],
 )
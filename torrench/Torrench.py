@@ -1,11 +1,16 @@
 """Torrench Module."""
 
 import os
+import re
 import sys
 import argparse
 import logging
 import click
 from torrench.utilities.config import Config
+import torrench.utilities.cache as cache
+import torrench.utilities.filters as filters
+import torrench.utilities.output as output
+from torrench.utilities.normalize import parse_size
 
 
 logger = logging.getLogger(__name__)
@@ -23,6 +28,7 @@ class Torrench(Config):
         self.input_title = None
         self.page_limit = 0
         self.interactive = False
+        self.batch = None
 
     def remove_temp_files(self):
         """
@@ -60,7 +66,7 @@ class Torrench(Config):
 
     def verify_input(self):
         """To verify if input given is valid or not."""
-        if self.input_title is None and not self.interactive:
+        if self.input_title is None and not self.interactive and self.batch is None:
             logger.debug("Bad input! Input string expected! Got 'None'")
             click.echo("\nInput string expected.\nUse --help for more\n")
             sys.exit(2)
@@ -70,6 +76,22 @@ class Torrench(Config):
             click.echo("Enter valid page input [0<p<=50]")
             sys.exit(2)
 
+    def set_filters(self, sort, min_seeds, max_size, category, regex, top_k):
+        """To set result filters (--sort, --min-seeds, --max-size, --category, --regex, --top-k)."""
+        max_bytes = None
+        if max_size is not None:
+            max_bytes = parse_size(max_size)
+            if max_bytes is None:
+                logger.debug("Invalid max-size entered: %s" % (max_size))
+                click.echo("Enter valid size for --max-size [e.g. 700MB, 4GiB]")
+                sys.exit(2)
+        try:
+            filters.configure(sort, min_seeds, max_bytes, category, regex, top_k)
+        except re.error as e:
+            logger.debug("Invalid regex entered: %s (%s)" % (regex, e))
+            click.echo("Enter valid --regex (%s)" % (e))
+            sys.exit(2)
+
 torrench = Torrench()
 
 
@@ -80,19 +102,32 @@ torrench = Torrench()
 @click.option('-s','--skytorrents', is_flag=True, help='Search SkyTorrents')
 @click.option('-n', '--nyaa', is_flag=True, help='Search Nyaa')
 @click.option('-x', '--xbit', is_flag=True, help='Search XBit.pw')
+@click.option('-a', '--all', 'all_sites', is_flag=True, help='Search all enabled sites at once and merge results')
 @click.option('-i', '--interactive', is_flag=True, help='Enable interactive mode for searches')
 @click.option('--top', is_flag=True, help='Get top torrents [TPB/SkyTorrents]')
 @click.option('--copy', is_flag=True, help='Copy magnetic link to clipboard')
 @click.option('-p', '--page-limit', default=1, help='LIMIT Number of pages to fetch results from (1 page = 30 results). [default: 1] [TPB/KAT/SkyTorrents]')
 @click.option('-c', '--clear-html', is_flag=True, help='Clear all [TPB] torrent description HTML files and exit.')
+@click.option('--no-cache', is_flag=True, help='Do not use cached pages (neither read nor stored).')
+@click.option('--refresh', is_flag=True, help='Ignore cached pages, fetch fresh copies and cache them.')
+@click.option('--sort', type=click.Choice(filters.SORT_KEYS), help='Sort results (largest/newest first).')
+@click.option('--min-seeds', type=int, help='Only results with at least MIN_SEEDS seeds.')
+@click.option('--max-size', help='Only results up to MAX_SIZE (e.g. 700MB, 4GiB).')
+@click.option('--category', help='Only results of CATEGORY (video, audio, applications, games, anime, porn, other; or part of a site\'s own category). Ignored for sites without categories.')
+@click.option('--regex', help='Only results whose name matches REGEX (case-insensitive).')
+@click.option('--top-k', type=click.IntRange(min=1), help='Only the K best results (by --sort, default: seeds). Stops fetching pages early where the site sorts the same way.')
+@click.option('--prefetch-details', type=click.IntRange(min=0), default=0, help='Fetch details of the top N results in background while results are shown, so [g] is immediate. [TPB]')
+@click.option('--batch', 'batch_file', type=click.File('r'), help='Run one search per line of FILE (- for stdin), non-interactively. Results are written as records (--format, default: ndjson). Sites: as selected (several allowed; -a: all; default: linuxtracker).')
+@click.option('--format', 'output_format', type=click.Choice(output.FORMATS), help='Write results as records to stdout (no table, no selection). Messages go to stderr.')
 # @click.option('-v', '--verbose', is_flag=True, help='Print debugs.')
 @click.version_option(Torrench.__version__)
 @click.argument('search', required=False)
 def search(search, distrowatch,
            thepiratebay, kickasstorrent,
-           skytorrents, nyaa, xbit, top,
+           skytorrents, nyaa, xbit, all_sites, top,
            copy, page_limit, clear_html,
-           interactive):
+           interactive, no_cache, refresh,
+           sort, min_seeds, max_size, category, regex, top_k, output_format, batch_file, prefetch_details):
     """Command-line torrent search tool."""
     _PRIVATE_MODULES = (
         thepiratebay,
@@ -106,10 +141,34 @@ def search(search, distrowatch,
     torrench.page_limit = page_limit
     torrench.copy = copy
     torrench.interactive = interactive 
+    torrench.batch = batch_file
+    cache.configure(enabled=not no_cache, refresh=refresh)
+    torrench.set_filters(sort, min_seeds, max_size, category, regex, top_k)
+    if batch_file is not None and output_format is None:
+        output_format = 'ndjson'
+    output.configure(output_format)
 
     if not clear_html and not interactive:
         torrench.verify_input()
-        torrench.input_title = torrench.input_title.replace("'", "")
+        if torrench.input_title is not None:
+            torrench.input_title = torrench.input_title.replace("'", "")
+
+    if batch_file is not None:
+        sites = [('TPB', thepiratebay), ('KAT', kickasstorrent), ('SkyTorrents', skytorrents),
+                 ('Nyaa', nyaa), ('XBit', xbit), ('DistroWatch', distrowatch)]
+        only = [label for label, selected in sites if selected]
+        if all_sites:
+            only = None
+        elif not only:
+            only = ['LinuxTracker']
+        if any(_PRIVATE_MODULES) and not all_sites and not torrench.file_exists():
+            click.echo("\nConfig file not configured. Configure to continue. Read docs for more info.\n")
+            click.echo("Config file either does not exist or is not enabled! Exiting!")
+            sys.exit(2)
+        logger.debug("Using batch mode (sites: %s)" % (only or 'all'))
+        import torrench.utilities.batch as batch
+        batch.main(batch_file, torrench.page_limit, only)
+        return
 
     if clear_html:
         if not thepiratebay:
@@ -117,7 +176,12 @@ def search(search, distrowatch,
             sys.exit(2)
         else:
             torrench.remove_temp_files()
-    if any(_PRIVATE_MODULES):
+    if all_sites:
+        logger.debug("Using meta-search (all sites)")
+        logger.debug("Input title: [%s] ; page_limit: [%s]" % (torrench.input_title, torrench.page_limit))
+        import torrench.utilities.metasearch as metasearch
+        metasearch.main(torrench.input_title, torrench.page_limit)
+    elif any(_PRIVATE_MODULES):
         if not torrench.file_exists():
             click.echo("\nConfig file not configured. Configure to continue. Read docs for more info.\n")
             click.echo("Config file either does not exist or is not enabled! Exiting!")
@@ -131,7 +195,7 @@ def search(search, distrowatch,
                     torrench.page_limit = None
                 logger.debug("Input title: [%s] ; page_limit: [%s]" % (torrench.input_title, torrench.page_limit))
                 import torrench.modules.thepiratebay as tpb
-                tpb.main(torrench.input_title, torrench.page_limit)
+                tpb.main(torrench.input_title, torrench.page_limit, prefetch_details)
             elif kickasstorrent:
                 logger.debug("Using kickasstorrents")
                 logger.debug("Input title: [%s] ; page_limit: [%s]" % (torrench.input_title, torrench.page_limit))
@@ -3,8 +3,23 @@
 import sys
 import logging
 from torrench.utilities.common import Common
+from torrench.utilities.engine import run
+from torrench.utilities.extractor import Extractor, Field, has_class, text
+from torrench.utilities.normalize import parse_date
+from torrench.utilities.result import TorrentResult, format_date, index_cell
 import click
 
+# Torrents table of bittorrent resource page (See Extractor).
+# Field paths are relative to a row (<tr>).
+EXTRACTOR = Extractor(
+    'distrowatch',
+    rows='//tr[td[%s]]' % (has_class('torrent')),
+    fields=[
+        Field('name', 'td[%s]//a' % (has_class('torrent')), lambda links: links[0].text.lower()),
+        Field('url', 'td[%s]//a/@href' % (has_class('torrent')), lambda hrefs: "https://distrowatch.com/" + hrefs[0]),
+        Field('date', 'td[%s]' % (has_class('torrentdate')), text),
+    ])
+
 
 class DistroWatch(Common):
     """
@@ -24,40 +39,57 @@ class DistroWatch(Common):
         Common.__init__(self)
         self.title = title
         self.logger = logging.getLogger('log1')
+        self.cache_site = 'distrowatch'
         self.index = 0
-        self.mylist = []
-        self.urllist = []
         self.url = "https://distrowatch.com/dwres.php?resource=bittorrent"
-        self.output_headers = ['NAME', 'INDEX', 'UPLOADED']
-        self.mapper = []
+        self.columns = [
+            ('NAME', lambda r, i: r.name),
+            ('INDEX', index_cell),
+            ('UPLOADED', lambda r, i: format_date(r.date)),
+        ]
+        self.masterlist = []
         self.soup = None
+        self.torrents = None
+
+    def parse_torrents(self, page):
+        """
+        Parse bittorrent resource page (lxml tree), See EXTRACTOR.
+
+        Returns list of [name, url, date] of all torrents listed.
+        (Page is large; the list is cached and re-used while the page
+        is not modified. See Common.get_parsed())
+        """
+        return [[record['name'], record['url'], record['date']] for record in EXTRACTOR.extract(page)]
+
+    async def get_html_async(self):
+        """
+        Fetch (and parse) bittorrent resource page.
+
+        Parsed list is stored in self.torrents.
+        """
+        self.torrents = await self.call_async(self.get_parsed, self.url, 'torrents', self.parse_torrents, True)
+        return True
+
+    async def search_async(self):
+        """Fetch results (without user interaction)."""
+        return await self.get_html_async()
 
     def fetch_results(self):
         """To fetch results for given input."""
         masterlist = []
         try:
-            torrent = self.soup.find_all('td', 'torrent')
-            torrent_date = self.soup.find_all('td', 'torrentdate')
-            for i, j in zip(torrent, torrent_date):
-                try:
-                    link = i.find('a')
-                    url = "https://distrowatch.com/" + link.get('href')
-                    name = link.string
-                    name = name.lower()
-                    if self.title in name:
-                        date = j.string
-                        self.index += 1
-                        self.mapper.insert(self.index, (name))
-                        self.mylist = [name, "--" + str(self.index) + "--", date]
-                        masterlist.append(self.mylist)
-                        self.urllist.append(url)
-                except AttributeError as e:
-                    self.logger.exception(e)
-                    pass
+            if self.torrents is None:
+                run(self.get_html_async())
+            for name, url, date in self.torrents:
+                if self.title in name:
+                    masterlist.append(TorrentResult(name, 'DistroWatch', date=parse_date(date), link=url))
+            masterlist = self.filter_results(masterlist)
+            self.index = len(masterlist)
             if self.index == 0:
                 click.echo("No results found for give input!")
                 self.logger.debug("\nNo results found for given input! Exiting!")
                 sys.exit(2)
+            self.masterlist = masterlist
             return masterlist
         except Exception as e:
             self.logger.exception(e)
@@ -65,6 +97,20 @@ class DistroWatch(Common):
             click.echo("Something went wrong! See logs for details. Exiting!")
             sys.exit(2)
 
+    def results(self):
+        """
+        Results (list of TorrentResult), for meta-search.
+
+        DistroWatch has no magnetic links, sizes or peers;
+        link is the .torrent file (See get_torrent()).
+        """
+        return self.masterlist
+
+    def get_torrent(self, torrent_url):
+        """Download .torrent file of 'torrent_url'."""
+        torrent_name = torrent_url.split('/')[5]
+        self.download(torrent_url, torrent_name)
+
     def select_torrent(self):
         """
         To select torrent and download.
@@ -89,13 +135,11 @@ class DistroWatch(Common):
                     click.echo("\nBad Input\n")
                     continue
                 else:
-                    selected_torrent = self.mapper[temp-1]
-                    self.logger.debug("selected torrent: %s ; index: %d" % (selected_torrent, temp))
-                    selected_torrent = click.style(selected_torrent, fg="yellow")
-                    torrent_url = self.urllist[temp-1]
-                    torrent_name = torrent_url.split('/')[5]
+                    result = self.masterlist[temp-1]
+                    self.logger.debug("selected torrent: %s ; index: %d" % (result.name, temp))
+                    selected_torrent = click.style(result.name, fg="yellow")
                     click.echo("\nSelected index [%s] - %s" % (temp, selected_torrent))
-                    self.download(torrent_url, torrent_name)
+                    self.get_torrent(result.link)
             except (ValueError, IndexError, KeyError) as e:
                 self.logger.exception(e)
                 click.echo("\nBad Input\n")
@@ -108,11 +152,11 @@ def main(title):
         title = title.lower()
         dw = DistroWatch(title)
         click.echo("Fetching results...")
-        dw.soup = dw.http_request(dw.url)
         masterlist = dw.fetch_results()
         dw.logger.debug("Results fetched successfully!")
-        dw.show_output(masterlist, dw.output_headers)
-        dw.select_torrent()
+        dw.show_results(masterlist, dw.columns)
+        if dw.output_format is None:
+            dw.select_torrent()
     except KeyboardInterrupt as e:
         dw.logger.debug("Keyboard interupt! Exiting!")
         click.echo("\n\nAborted!")
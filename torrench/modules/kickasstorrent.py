@@ -3,10 +3,60 @@
 import sys
 import platform
 import logging
+from urllib.parse import urljoin
 from torrench.utilities.config import Config
+from torrench.utilities.engine import run
+from torrench.utilities.extractor import Extractor, Field, has_class, text
+from torrench.utilities.normalize import parse_int, parse_size, parse_date
+from torrench.utilities.result import (
+    TorrentResult, format_size, format_date, format_count, index_cell)
 import click
 
 
+def link_name(links):
+    """Torrent name (link text, without trailing '[[...]]')."""
+    link = links[0]
+    if link.text is not None and not len(link):
+        return link.text
+    return link.text_content().split("[[")[0]
+
+
+def details_word(position):
+    """Converter: 'position'th word of 'Posted by <uploader> in <category> ...' line."""
+    return lambda spans: spans[0].text_content().split(" ")[position]
+
+
+def center_cell(position):
+    """Converter: text of 'position'th centered cell (size, date, seeds, leeches)."""
+    return lambda cells: cells[position].text_content().strip()
+
+
+# Sort fields of search URL (--sort pushdown, See filters module).
+SORT_CODES = {'seeds': 'seeders', 'size': 'size', 'date': 'time_add'}
+# Categories -> --category values.
+CATEGORY_NAMES = {'movies': 'video', 'tv': 'video', 'music': 'audio', 'applications': 'applications',
+                  'games': 'games', 'anime': 'anime', 'books': 'other', 'xxx': 'porn', 'other': 'other'}
+
+# Results table (See Extractor). Field paths are relative to a row (<tr>).
+EXTRACTOR = Extractor(
+    'kat',
+    table='//table[%s]' % (has_class('data')),
+    rows='(//table[{0}])[1]//tr[{1}]'.format(has_class('data'), has_class('odd')),
+    fields=[
+        Field('name', './/a[%s]' % (has_class('cellMainLink')), link_name),
+        Field('link', './/a[%s]/@href' % (has_class('cellMainLink'))),
+        Field('uploader', './/span[%s]' % (has_class('lightgrey')), details_word(-4)),
+        Field('category', './/span[%s]' % (has_class('lightgrey')), details_word(-2)),
+        Field('verified', './/a[@title="Verified Torrent"]', bool),
+        Field('comments', './/a[%s]' % (has_class('icommentjs')), lambda links: text(links) or 0),
+        Field('size', './/td[%s]' % (has_class('center')), center_cell(0)),
+        Field('date', './/td[%s]' % (has_class('center')), center_cell(1)),
+        Field('seeds', './/td[%s]' % (has_class('center')), center_cell(2)),
+        Field('leeches', './/td[%s]' % (has_class('center')), center_cell(3)),
+        Field('magnet', './/a[@title="Torrent magnet link"]/@href'),
+    ])
+
+
 class KickassTorrents(Config):
     """
     KickassTorrent class.
@@ -36,17 +86,27 @@ class KickassTorrents(Config):
         self.logger = logging.getLogger('log1')
         self.page = 0
         self.proxy = None
+        self.categories = CATEGORY_NAMES
         self.soup = None
-        self.soup_dict = {}
+        self.page_results = {}
         self.OS_WIN = False
         if platform.system() == "Windows":
             self.OS_WIN = True
         self.index = 0
         self.total_fetch_time = 0
-        self.mylist = []
-        self.mapper = []
-        self.output_headers = [
-                'CATEG', 'NAME', 'INDEX', 'UPLOADER', 'SIZE', 'S', 'L', 'DATE', 'C']
+        self.total_page_time = 0
+        self.masterlist = []
+        self.columns = [
+            ('CATEG', lambda r, i: r.category),
+            ('NAME', lambda r, i: r.name),
+            ('INDEX', index_cell),
+            ('UPLOADER', lambda r, i: click.style(r.uploader, fg="yellow") if r.status else r.uploader),
+            ('SIZE', lambda r, i: format_size(r.size)),
+            ('S', lambda r, i: click.style(format_count(r.seeds), fg="green")),
+            ('L', lambda r, i: click.style(format_count(r.leeches), fg="red")),
+            ('DATE', lambda r, i: format_date(r.date)),
+            ('C', lambda r, i: format_count(r.comments)),
+        ]
 
     def check_proxy(self):
         """
@@ -55,27 +115,30 @@ class KickassTorrents(Config):
         Proxy is checked in two steps:
         1. To see if proxy 'website' is available.
 
-        In case of failiur, next proxy is tested with same procedure.
-        This continues until working proxy is found.
+        All proxies are tested concurrently (Config.probe_proxies()).
+        First proxy to pass the test is used.
         If no proxy is found, program exits.
         """
-        count = 0
-        for proxy in self.proxies:
-            click.echo(click.style('Trying %s' % proxy ,fg="yellow"))
-            self.logger.debug("Trying proxy: %s" % (proxy))
-            self.soup = self.http_request(proxy)
-            if self.soup.find('a')['href'] != proxy + "full/" or self.soup == -1:
-                click.echo("Bad proxy!")
-                count += 1
-                if count == len(self.proxies):
-                    self.logger.debug("Proxy list finished! Exiting!")
-                    click.echo("No more proxies found! Exiting...")
-                    sys.exit(2)
-            else:
-                self.logger.debug("Connected to proxy...")
-                click.echo("Available!\n")
-                self.proxy = proxy
-                break
+        if run(self.check_proxy_async()) is None:
+            self.logger.debug("Proxy list finished! Exiting!")
+            click.echo("No more proxies found! Exiting...")
+            sys.exit(2)
+
+    async def check_proxy_async(self):
+        """Coroutine of check_proxy(). Returns proxy (None if no proxy passed)."""
+        self.proxy = await self.probe_proxies_async(self.proxies, self.test_proxy)
+        if self.proxy is not None:
+            self.logger.debug("Connected to proxy...")
+            click.echo("Available!\n")
+        return self.proxy
+
+    def test_proxy(self, proxy):
+        """Test a single proxy (See check_proxy())."""
+        self.logger.debug("Trying proxy: %s" % (proxy))
+        soup, _ = self.fetch_page(proxy, use_cache=False)
+        if soup == -1 or soup.find('a') is None:
+            return False
+        return soup.find('a').get('href') == proxy + "full/"
 
     def get_html(self):
         """
@@ -84,76 +147,104 @@ class KickassTorrents(Config):
         Once proxy is found, the HTML page for
         corresponding search string is fetched.
         Also, the time taken to fetch that page is returned.
-        Uses http_request_time() from Common.py module.
+        Uses fetch_results_async() from Config.py module.
+        Each page is parsed (parse_page()) as soon as it arrives;
+        only its results are kept.
         """
+        try:
+            run(self.get_html_async())
+        except Exception as e:
+            self.logger.exception(e)
+            click.echo("Error message: %s" %(e))
+            click.echo("Something went wrong! See logs for details. Exiting!")
+            sys.exit(2)
+
+    async def get_html_async(self):
+        """Coroutine of get_html()."""
+        click.echo("\nFetching %d page(s)..." % (self.pages))
+        searches = []
+        field, _, self.pushed = self.filter.pushdown(SORT_CODES)
         for self.page in range(self.pages):
-            click.echo("\nFetching from page: %d" % (self.page+1))
-            self.logger.debug("fetching page %d/%d" % (self.page, self.pages))
             search = "usearch/%s/%d/" % (self.title, self.page + 1)
-            self.soup, time = self.http_request_time(self.proxy + search)
-            click.echo("Page fetched!")
-            self.logger.debug("Page fetched in %.2f sec!" % (time))
-            self.total_fetch_time += time
-            self.soup_dict[self.page] = self.soup
+            if field is not None:
+                search += "?field=%s&sorder=desc" % (field)
+            searches.append(search)
+        pages, self.total_fetch_time = await self.fetch_results_async(
+            searches, self.parse_page, stop=self.filter.page_stop(self.pushed, self.categories))
+        for self.page, (results, time) in enumerate(pages):
+            if results == -1:
+                continue
+            self.total_page_time += time
+            self.page_results[self.page] = results
+        click.echo("Pages fetched!")
+
+    async def search_async(self):
+        """
+        Check proxy and fetch result pages (without user interaction).
 
-    def parse_html(self):
+        Returns False if no proxy is available.
         """
-        Parse HTML to get required results.
+        if await self.check_proxy_async() is None:
+            return False
+        await self.get_html_async()
+        return True
 
-        Results are fetched in masterlist list.
-        Also, a mapper[] is used to map 'index'
-        with torrent name, link and magnetic link
+    def parse_page(self, page):
+        """
+        Parse one result page (lxml tree), See EXTRACTOR.
+
+        Runs on engine threads as pages arrive (See get_html_async()),
+        so no attribute is modified.
+        Returns list of TorrentResult.
+        """
+        results = []
+        for record in EXTRACTOR.extract(page) or []:
+            name = record['name']
+            # Handling Unicode characters in windows.
+            if self.OS_WIN:
+                name = name.encode('ascii', 'replace').decode()
+            results.append(TorrentResult(
+                name, 'KAT', size=parse_size(record['size']), seeds=parse_int(record['seeds']),
+                leeches=parse_int(record['leeches']), date=parse_date(record['date']),
+                magnet=record['magnet'], link=urljoin(self.proxy, record['link']),
+                category=record['category'], uploader=record['uploader'],
+                comments=parse_int(record['comments']),
+                status='Verified' if record['verified'] else None))
+        return results
+
+    def parse_html(self, show=True):
+        """
+        Collect parsed results of all pages (See parse_page()).
+
+        Results (TorrentResult) are fetched in masterlist list,
+        in page order; a result's index is its position (from 1).
+        Results are displayed unless show=False.
         """
         masterlist = []
         try:
-            for page in self.soup_dict:
-                self.soup = self.soup_dict[page]
-                content = self.soup.find('table', class_='data')
-                data = content.find_all('tr', class_='odd')
-                for i in data:
-                    name = i.find('a', class_='cellMainLink').string
-                    if name is None:
-                        name = i.find('a', class_='cellMainLink').get_text().split("[[")[0]
-                    # Handling Unicode characters in windows.
-                    if self.OS_WIN:
-                        try:
-                            name = name.encode('ascii', 'replace').decode()
-                        except AttributeError as e:
-                            self.logger.debug(e)
-                            pass
-                    torrent_link = i.find('a', class_='cellMainLink')['href']
-                    uploader_name = i.find('span', class_='lightgrey').get_text().split(" ")[-4]
-                    category = i.find('span', class_='lightgrey').get_text().split(" ")[-2]
-                    verified_uploader = i.find('a', {'title': 'Verified Torrent'})
-                    if verified_uploader is not None:
-                        uploader_name = click.style(uploader_name ,fg="yellow")
-                        comment_count = i.find('a', class_='icommentjs').get_text()
-                    if comment_count == '':
-                        comment_count = 0
-                    misc_details = i.find_all('td', class_='center')
-                    size = misc_details[0].string
-                    date_added = misc_details[1].string
-                    seeds = click.style(misc_details[2].string ,fg="green")
-                    leeches = click.style(misc_details[3].string ,fg="red")
-                    magnet = i.find('a', {'title': 'Torrent magnet link'})['href']
-                    self.index += 1
-                    self.mapper.insert(self.index, (name, magnet, torrent_link))
-
-                    self.mylist = [category, name, '--' + str(self.index) + '--', uploader_name, size, date_added, seeds, leeches, comment_count]
-                    masterlist.append(self.mylist)
+            for page in sorted(self.page_results):
+                masterlist.extend(self.page_results[page])
+            self.page_results = {}
+            masterlist = self.filter_results(masterlist)
+            self.index = len(masterlist)
 
             if masterlist == []:
                 click.echo("\nNo results found for given input!\n")
                 self.logger.debug("\nNo results found for given input! Exiting!")
                 sys.exit(2)
             self.logger.debug("Results fetched successfully!")
-            self.show_output(masterlist, self.output_headers)
+            self.masterlist = masterlist
+            if show:
+                self.show_results(masterlist, self.columns)
         except Exception as e:
             self.logger.exception(e)
             click.echo("Error message: %s" %(e))
             click.echo("Something went wrong! See logs for details. Exiting!")
             sys.exit(2)
 
+    def results(self):
+        """Results (list of TorrentResult), for meta-search."""
+        return self.masterlist
 
     def after_output_text(self):
         """
@@ -168,8 +259,8 @@ class KickassTorrents(Config):
             if has_extra_pages > 0:
                 exact_no_of_pages += 1
             click.echo("\nTotal %d torrents [%d pages]" % (self.index, exact_no_of_pages))
-            click.echo("Total time: %.2f sec" % (self.total_fetch_time))
-            self.logger.debug("fetched ALL results in %.2f sec" % (self.total_fetch_time))
+            click.echo("Total time: %.2f sec (pages: %.2f sec)" % (self.total_fetch_time, self.total_page_time))
+            self.logger.debug("fetched ALL results in %.2f sec (sum of pages: %.2f sec)" % (self.total_fetch_time, self.total_page_time))
             click.echo("\nFurther, torrent can be downloaded using magnetic link\nOR\nTorrent's upstream link can be obtained to be opened in web browser.")
             click.echo("\nEnter torrent's index value (Maximum one index)")
         except Exception as e:
@@ -201,8 +292,9 @@ class KickassTorrents(Config):
                     click.echo("\nBad Input!")
                     continue
                 else:
-                    selected_torrent, req_magnetic_link, req_torr_link = self.mapper[temp-1]
-                    selected_torrent = click.style(selected_torrent ,fg="yellow")
+                    result = self.masterlist[temp-1]
+                    req_magnetic_link, req_torr_link = result.magnet, result.link
+                    selected_torrent = click.style(result.name ,fg="yellow")
                     click.echo("Selected index [%d] - %s\n" % (temp, selected_torrent))
                     self.logger.debug("selected torrent: %s ; index: %d" % (selected_torrent, temp))
                     # Print Magnetic link / load magnet to client
@@ -214,7 +306,7 @@ class KickassTorrents(Config):
                         click.echo("\nMagnet link: {magnet}".format(magnet=click.style(req_magnetic_link ,fg="red")))
                         self.copy_magnet(req_magnetic_link)
                         
-                        upstream_link = click.style(self.proxy + req_torr_link ,fg="yellow")
+                        upstream_link = click.style(req_torr_link ,fg="yellow")
                         click.echo("\n\nUpstream Link: %s \n\n" % (upstream_link))
                     elif temp2 == 'l':
                         try:
@@ -238,8 +330,9 @@ def main(title, page_limit):
         kat.check_proxy()
         kat.get_html()
         kat.parse_html()
-        kat.after_output_text()
-        kat.select_torrent()
+        if kat.output_format is None:
+            kat.after_output_text()
+            kat.select_torrent()
     except KeyboardInterrupt:
         kat.logger.debug("Keyboard interupt! Exiting!")
         click.echo("\n\nAborted!")
@@ -3,9 +3,35 @@
 import sys
 import logging
 from torrench.utilities.common import Common
+from torrench.utilities.engine import run
+from torrench.utilities.extractor import Extractor, Field, has_class, text
+from torrench.utilities.normalize import parse_int, parse_size, parse_date
+from torrench.utilities.result import (
+    TorrentResult, format_size, format_date, format_count, index_cell)
 import click
 
 
+def line_word(line, position):
+    """Converter: 'position'th word of 'line'th line (<tr>) of a result."""
+    return lambda lines: lines[line].text_content().split(' ')[position]
+
+
+# Results table (See Extractor). Field paths are relative to a result.
+# A result is a table of lines: date, size, seeds, leeches, completed.
+EXTRACTOR = Extractor(
+    'linuxtracker',
+    rows='(//table[%s][@width="100%%"])[5]/*' % (has_class('lista')),
+    fields=[
+        Field('name', '(.//font)[1]/descendant::a[1]', text),
+        Field('date', './/tr', line_word(0, -2)),
+        Field('size', '(.//tr)[2]/td[1]/text()', lambda texts: texts[0].replace(' ', '')),
+        Field('seeds', './/tr', line_word(2, -2)),
+        Field('leeches', './/tr', line_word(3, -2)),
+        Field('completed', './/tr', line_word(4, -3)),
+        Field('dload', '(.//td[@align="right"])[1]/descendant::a[2]/@href'),
+    ])
+
+
 class LinuxTracker(Common):
     """
     LinuxTracker class.
@@ -22,14 +48,23 @@ class LinuxTracker(Common):
         Common.__init__(self)
         self.title = title
         self.logger = logging.getLogger('log1')
-        self.output_headers = ['NAME', 'INDEX', 'SIZE', 'S', 'L', 'COMPLETED', 'ADDED', ]
+        self.cache_site = 'linuxtracker'
+        self.columns = [
+            ('NAME', lambda r, i: r.name),
+            ('INDEX', index_cell),
+            ('SIZE', lambda r, i: format_size(r.size)),
+            ('S', lambda r, i: format_count(r.seeds)),
+            ('L', lambda r, i: format_count(r.leeches)),
+            ('COMPLETED', lambda r, i: format_count(r.extra['completed'])),
+            ('ADDED', lambda r, i: format_date(r.date)),
+        ]
         self.categ_url = "http://linuxtracker.org/index.php?page=torrents"
         self.index = 0
         self.categ_url_code = 0
-        self.mylist = []
         self.category_mapper = []
-        self.category_mapper = []
-        self.mapper = []
+        self.masterlist = []
+        self.soup = None
+        self.page = None
         self.url = "http://linuxtracker.org/index.php?page=torrents&search=%s&category=%d&active=1" % (
                         self.title, self.categ_url_code)
 
@@ -78,39 +113,64 @@ class LinuxTracker(Common):
             click.echo("\nBad Input!")
             sys.exit(2)
 
-    def fetch_results(self):
-        """To fetch results for given input."""
+    def get_html(self):
+        """To fetch results page for given input (and selected category)."""
         click.echo("Fetching results...")
         self.logger.debug("Fetching...")
-        masterlist = []
+        if not run(self.get_html_async()):
+            click.echo("Unable to fetch results! See logs for details. Exiting!")
+            sys.exit(2)
+
+    async def get_html_async(self):
+        """
+        Coroutine of get_html().
+
+        Returns False if page could not be fetched.
+        """
+        self.url = "http://linuxtracker.org/index.php?page=torrents&search=%s&category=%d&active=1" % (
+                        self.title, self.categ_url_code)
         self.logger.debug("categ_url_code = %d ; url=%s" % (self.categ_url_code, self.url))
-        soup = self.http_request(self.url)
-        content = soup.find_all('table', {'class': 'lista', 'width': '100%'})
-        search_results = content[4]
-        for i in search_results:
-            try:
-                name = i.font.a.string
-                date = i.find_all('tr')[0].get_text().split(' ')[-2]
-                size = i.find_all('tr')[1].td.find(recursive=False, text=True).replace(' ', '')
-                seeds = i.find_all('tr')[2].get_text().split(' ')[-2]
-                leeches = i.find_all('tr')[3].get_text().split(' ')[-2]
-                completed = i.find_all('tr')[4].get_text().split(' ')[-3]
-                dload = i.find_all('td', {'align': 'right'})[0].find_all('a')[1]['href']
-                self.index += 1
-                # Map torrent name and download link with corresponding index
-                self.mapper.insert(self.index, (name, dload))
-                self.mylist = [name, "--" + str(self.index) + "--", size, seeds, leeches, completed, date]
-                masterlist.append(self.mylist)
-            except AttributeError as e:
-                self.logger.exception(e)
-                pass
+        self.page, _ = await self.fetch_async(self.url, tree=True)
+        return self.page != -1
+
+    async def search_async(self):
+        """Fetch results page (without user interaction)."""
+        return await self.get_html_async()
+
+    def fetch_results(self):
+        """To fetch results for given input."""
+        self.get_html()
+        return self.parse_results()
+
+    def parse_results(self):
+        """
+        To parse fetched results page (See EXTRACTOR).
+
+        Returns list of TorrentResult. LinuxTracker has no magnetic links;
+        link is the download page (See get_torrent()).
+        """
+        masterlist = []
+        for record in EXTRACTOR.extract(self.page):
+            masterlist.append(TorrentResult(
+                record['name'], 'LinuxTracker', size=parse_size(record['size']),
+                seeds=parse_int(record['seeds']), leeches=parse_int(record['leeches']),
+                date=parse_date(record['date']), link="http://linuxtracker.org/" + record['dload'],
+                extra={'completed': parse_int(record['completed'])}))
+        self.page = None
+        masterlist = self.filter_results(masterlist)
+        self.index = len(masterlist)
         if self.index == 0:
             click.echo("No results found for give input!")
             self.logger.debug("\nNo results found for given input! Exiting!")
             sys.exit(2)
         self.logger.debug("Results fetched successfully!")
+        self.masterlist = masterlist
         return masterlist
 
+    def results(self):
+        """Results (list of TorrentResult), for meta-search."""
+        return self.masterlist
+
     def select_torrent(self):
         """
         To select required torrent.
@@ -133,10 +193,10 @@ class LinuxTracker(Common):
                     click.echo("\nBad Input\n")
                     continue
                 else:
-                    selected_index, dload = self.mapper[temp-1]
-                    self.logger.debug("selected torrent: %s ; index: %d" % (selected_index, temp))
-                    click.echo("\nSelected index[%s] - %s" % (temp, click.style(selected_index, fg="yellow")))
-                    self.get_torrent("http://linuxtracker.org/"+dload)
+                    result = self.masterlist[temp-1]
+                    self.logger.debug("selected torrent: %s ; index: %d" % (result.name, temp))
+                    click.echo("\nSelected index[%s] - %s" % (temp, click.style(result.name, fg="yellow")))
+                    self.get_torrent(result.link)
             except (ValueError, IndexError, KeyError) as e:
                 click.echo("\nBad Input\n")
                 self.logger.exception(e)
@@ -167,16 +227,17 @@ def main(title):
     try:
         click.echo("\n[LinuxTracker]\n")
         ltr = LinuxTracker(title)
-        if click.confirm("Display categories? : "):
-            ltr.logger.debug("Display categories: %c" % (temp))
+        if ltr.output_format is None and click.confirm("Display categories? : "):
+            ltr.logger.debug("Display categories: yes")
             ltr.display_categories()
             ltr.select_category()
         else:
             ltr.categ_url_code = 0
             ltr.logger.debug("Not displaying categories.")
         masterlist = ltr.fetch_results()
-        ltr.show_output(masterlist, ltr.output_headers)
-        ltr.select_torrent()
+        ltr.show_results(masterlist, ltr.columns)
+        if ltr.output_format is None:
+            ltr.select_torrent()
     except KeyboardInterrupt:
         ltr.logger.debug("Keyboard interupt! Exiting!")
         click.echo("\n\nAborted!")
@@ -1,12 +1,42 @@
 """nyaa.si module"""
 
-import sys
 import logging
 import platform
 from torrench.utilities.config import Config
+from torrench.utilities.engine import run
+from torrench.utilities.extractor import Extractor, Field, text
+from torrench.utilities.normalize import parse_int, parse_size, parse_date
+from torrench.utilities.result import TorrentResult, format_size, format_count, index_cell
 import click
 
 
+def link_name(links):
+    """Torrent name (link's title, or text)."""
+    return links[-1].get('title') or links[-1].text_content().strip()
+
+
+# Sort/category parameters of search URL (--sort/--category pushdown, See filters module).
+SORT_CODES = {'seeds': 'seeders', 'size': 'size', 'date': 'id'}
+CATEGORY_CODES = {'anime': '1_0', 'audio': '2_0', 'literature': '3_0',
+                  'live action': '4_0', 'pictures': '5_0', 'software': '6_0',
+                  'applications': '6_1', 'games': '6_2'}
+
+# Results table (See Extractor). Field paths are relative to a row (<tr>).
+# Cells: category, name, links, size, date, seeds, leeches, completed
+EXTRACTOR = Extractor(
+    'nyaa',
+    rows='//table//tr[td]',
+    fields=[
+        Field('name', 'td[@colspan="2"]/a[not(contains(@class, "comments"))]', link_name),
+        Field('url', 'td/a[starts-with(@href, "/download/")]/@href', lambda hrefs: 'https://nyaa.si' + hrefs[0]),
+        Field('magnet', 'td/a[starts-with(@href, "magnet:")]/@href'),
+        Field('size', 'td[4]', text),
+        Field('date', 'td[5]', text),
+        Field('seeds', 'td[6]', text),
+        Field('leeches', 'td[7]', text),
+    ])
+
+
 class NyaaTracker(Config):
     """
     Nyaa.si class.
@@ -17,10 +47,8 @@ class NyaaTracker(Config):
 
     Default download location is $HOME/Downloads/torrench
 
-    Known problems:
-    - If the torrent name in the website is too long (200 chars+) the table will be displayed incorrectly in the terminal.
-    Possible fixes:
-    - Cut the name if the name is too big.
+    Long torrent names (200 chars+) are truncated to fit
+    the terminal (See table.TableWriter).
     """
 
     def __init__(self, title: str):
@@ -28,116 +56,99 @@ class NyaaTracker(Config):
         Config.__init__(self)
         self.title = title
         self.logger = logging.getLogger('log1')
-        self.output_headers = ['NAME', 'INDEX', 'SIZE', 'S', 'L']
         self.index = 0
-        self.mapper = []
-        self.proxy = self.check_proxy('nyaa')
-        self.search_parameter = "/?f=0&c=0_0&q={query}&s=seeders&o=desc".format(query=self.title)
-        self.soup = self.http_request(self.proxy+self.search_parameter)
+        self.masterlist = []
+        self.proxy = None
+        self.page = None
+        sort, category, self.pushed = self.filter.pushdown(SORT_CODES, CATEGORY_CODES)
+        self.search_parameter = "/?f=0&c={category}&q={query}&s={sort}&o=desc".format(
+            category=category or '0_0', query=self.title, sort=sort or 'seeders')
         self.OS_WIN = False
         if platform.system() == "Windows":
             self.OS_WIN = True
+        self.columns = [
+            ('NAME', lambda r, i: r.name),
+            ('INDEX', index_cell),
+            ('SIZE', lambda r, i: format_size(r.size) if self.OS_WIN else click.style(format_size(r.size), fg='yellow')),
+            ('S', lambda r, i: click.style(format_count(r.seeds), fg="green")),
+            ('L', lambda r, i: click.style(format_count(r.leeches), fg="red")),
+        ]
+
+    async def search_async(self):
+        """
+        Check proxy and fetch results page (without user interaction).
+        If the page cannot be fetched through the proxy, proxies are
+        probed again once (See Config.proxy_failed()).
+        :returns: False if no proxy is available or page could not be fetched.
+        """
+        self.proxy = await self.check_proxy_async('nyaa')
+        if self.proxy == -1:
+            return False
+        self.page, _ = await self.fetch_async(self.proxy+self.search_parameter, tree=True)
+        if self.page == -1:
+            self.proxy_failed(self.proxy)
+            self.proxy = await self.check_proxy_async('nyaa')
+            if self.proxy == -1:
+                return False
+            self.page, _ = await self.fetch_async(self.proxy+self.search_parameter, tree=True)
+        return self.page != -1
 
     def check_proxy(self, proxy: str):
         """
         Check for proxies in the `config.ini` file.
+        All proxies are tested concurrently, first valid proxy is used.
+        :params: proxy
+        :returns: proxy on success, -1 on error
+        """
+        return run(self.check_proxy_async(proxy))
+
+    async def check_proxy_async(self, proxy: str):
+        """
+        Coroutine of check_proxy().
         :params: proxy
         :returns: proxy on success, -1 on error
         """
         _torrench_proxies = self.get_proxies(proxy)
-        counter = 0
-        if _torrench_proxies:
-            for proxy in _torrench_proxies:
-                click.echo("Testing: {proxy}".format(proxy=click.style(proxy, fg='yellow')))
-                proxy_soup = self.http_request(proxy+'/?f=0&c=0_0&q=hello&s=seeders&o=desc')
-                self.logger.debug("Testing {proxy} as a possible candidate.".format(proxy=proxy))
-                if not proxy_soup.find_all('td', {'colspan': '2'}):
-                    click.echo("{proxy} was a bad proxy. Trying next proxy.".format(proxy=proxy))
-                    counter += 1
-                    if counter == len(_torrench_proxies):
-                        self.logger.debug("Proxy list finished. No valid proxies were found.")
-                        click.echo("Failed to find any valid proxies. Terminating.")
-                        return -1
-                else:
-                    click.echo("Proxy `{proxy}` is available. Connecting.".format(proxy=proxy))
-                    self.logger.debug("Proxy `{proxy}` is a valid proxy.")
-                    return proxy
-        click.echo("No proxies were given.")
-        return -1
+        if not _torrench_proxies:
+            click.echo("No proxies were given.")
+            return -1
+        proxy = await self.probe_proxies_async(_torrench_proxies, self.test_proxy)
+        if proxy is None:
+            self.logger.debug("Proxy list finished. No valid proxies were found.")
+            click.echo("Failed to find any valid proxies. Terminating.")
+            return -1
+        click.echo("Proxy `{proxy}` is available. Connecting.".format(proxy=proxy))
+        self.logger.debug("Proxy `{proxy}` is a valid proxy.".format(proxy=proxy))
+        return proxy
+
+    def test_proxy(self, proxy: str):
+        """
+        Test a single proxy (See check_proxy()).
+        :params: proxy
+        :returns: True if proxy is valid
+        """
+        self.logger.debug("Testing {proxy} as a possible candidate.".format(proxy=proxy))
+        proxy_soup, _ = self.fetch_page(proxy+'/?f=0&c=0_0&q=hello&s=seeders&o=desc', use_cache=False)
+        return proxy_soup != -1 and bool(proxy_soup.find_all('td', {'colspan': '2'}))
 
-    def parse_name(self):
+    def parse_results(self):
         """
-        Parse torrent name
+        Parse results page in a single pass, one record per row (See EXTRACTOR).
+
+        All fields are read from the row itself, so they can never
+        belong to different torrents. Incomplete rows are skipped (and logged).
+        :returns: list of TorrentResult
         """
-        t_names = []
-        for name in self.soup.find_all('td', {'colspan': '2'}):
-            n = name.get_text().replace('\n', '')
+        results = []
+        for record in EXTRACTOR.extract(self.page):
+            name = record['name']
             if self.OS_WIN:
-                n = n.encode('ascii', 'replace').decode()
-            t_names.append(n)
-        if t_names:
-            return t_names
-        click.echo("Unable to parse torrent name.")
-        sys.exit(2)
-
-    def parse_urls(self):
-        t_urls = []
-        for url in self.soup.find_all('a'):
-            try:
-                if url.get('href').startswith('/download/'):
-                    t_urls.append(click.style('https://nyaa.si'+url['href'], fg='yellow'))
-            except AttributeError:
-                pass
-        if t_urls:
-            return t_urls
-        click.echo("Unable to parse torrent URLs.")
-        sys.exit(2)
-
-    def parse_magnets(self):
-        t_magnets = []
-        for url in self.soup.find_all('a'):
-            try:
-                if url['href'].startswith('magnet:'):
-                    t_magnets.append(url['href'])
-            except KeyError:
-                pass
-        if t_magnets:
-            return t_magnets
-        click.echo("Unable to parse magnet links.")
-        sys.exit(2)
-
-    def parse_sizes(self):
-        t_size = []
-        for size in self.soup.find_all('td', {'class': 'text-center'}):
-            if size.get_text().endswith(("GiB", "MiB")):
-                if self.OS_WIN:
-                    t_size.append( size.get_text())
-                else:
-                    t_size.append(click.style(size.get_text(), fg='yellow'))
-            else:
-                pass
-        if t_size:
-            return t_size
-        click.echo("Unable to parse size of files.")
-        sys.exit(2)
-
-    def parse_seeds(self):
-        t_seeds = []
-        for seed in self.soup.find_all('td', {'style': 'color: green;'}):
-            t_seeds.append(click.style(seed.get_text(), fg="green"))
-        if t_seeds:
-            return t_seeds
-        click.echo("Unable to parse seeds")
-        sys.exit(2)
-
-    def parse_leeches(self):
-        t_leeches = []
-        for leech in self.soup.find_all('td', {'style': 'color: red;'}):
-            t_leeches.append(click.style(leech.get_text(), fg="red"))
-        if t_leeches:
-            return t_leeches
-        click.echo("Unable to parse leechers")
-        sys.exit(2)
+                name = name.encode('ascii', 'replace').decode()
+            results.append(TorrentResult(
+                name, 'Nyaa', size=parse_size(record['size']), seeds=parse_int(record['seeds']),
+                leeches=parse_int(record['leeches']), date=parse_date(record['date']),
+                magnet=record['magnet'], link=record['url']))
+        return results
 
     def fetch_results(self):
         """
@@ -149,25 +160,27 @@ class NyaaTracker(Config):
         click.echo("Fetching results")
         self.logger.debug("Fetching...")
         self.logger.debug("URL: %s", self.url)
+        results = []
         try:
-            name = self.parse_name()
-            urls = self.parse_urls()
-            sizes = self.parse_sizes()
-            seeds = self.parse_seeds()
-            leeches = self.parse_leeches()
-            magnets = self.parse_magnets()
-            self.index = len(urls)
-        except (KeyError, AttributeError) as e:
+            results = self.parse_results()
+        except (KeyError, AttributeError, IndexError) as e:
             click.echo("Something went wrong. Logging and terminating.")
             self.logger.exception(e)
             click.echo("OK. Terminating.")
-        if self.index == 0:
+        self.page = None
+        results = self.filter_results(results)
+        if not results:
             click.echo("No results were found for the given query. Terminating")
             self.logger.debug("No results were found for `%s`.", self.title)
             return -1
         self.logger.debug("Results fetched. Showing table.")
-        self.mapper.insert(self.index+1, (name, urls, magnets))
-        return list(zip(name, ["--"+str(idx)+"--" for idx in range(1, self.index+1)], sizes, seeds, leeches))
+        self.masterlist = results
+        self.index = len(results)
+        return self.masterlist
+
+    def results(self):
+        """Results (list of TorrentResult), for meta-search."""
+        return self.masterlist
 
     def select_torrent(self):
         """Select torrent from table using index."""
@@ -179,8 +192,11 @@ class NyaaTracker(Config):
                     click.echo("Bye!")
                     break
                 else:
-                    selected_torrent, download_url, magnet_url = self.mapper[0][0][prompt-1], self.mapper[0][1][prompt-1], self.mapper[0][2][prompt-1]
-                    selected_torrent = click.style(selected_torrent, fg="yellow")
+                    if prompt < 0:
+                        raise IndexError("Negative index: %d" % (prompt))
+                    result = self.masterlist[prompt-1]
+                    download_url, magnet_url = result.link, result.magnet
+                    selected_torrent = click.style(result.name, fg="yellow")
                     click.echo("Selected index [{idx}] - {torrent}\n".format(idx=prompt, torrent=selected_torrent))
                     # Print Magnetic link / load magnet to client
                     prompt2 = click.prompt("1. Print magnetic link [p]\n2. Load magnetic link to client [l]\n\nOption [p/l]: ", type=str)
@@ -190,7 +206,7 @@ class NyaaTracker(Config):
                         self.logger.debug("printing magnetic link and upstream link")
                         click.echo("\nMagnet link: {magnet}".format(magnet=click.style(magnet_url, fg="red")))
                         self.copy_magnet(magnet_url)
-                        click.echo("\n\nUpstream link: {url}\n".format(url=download_url))
+                        click.echo("\n\nUpstream link: {url}\n".format(url=click.style(download_url, fg='yellow')))
                     elif prompt2 == 'l':
                         try:
                             self.logger.debug("Loading torrent to client")
@@ -214,9 +230,14 @@ def main(title):
     try:
         click.echo("\n[Nyaa.si]\n")
         nyaa = NyaaTracker(title)
+        if not run(nyaa.search_async()):
+            return
         results = nyaa.fetch_results()
-        nyaa.show_output([result for result in results], nyaa.output_headers)
-        nyaa.select_torrent()
+        if results == -1:
+            return
+        nyaa.show_results(results, nyaa.columns)
+        if nyaa.output_format is None:
+            nyaa.select_torrent()
     except KeyboardInterrupt:
         nyaa.logger.debug("Interrupt detected. Terminating.")
         click.echo("Terminated")
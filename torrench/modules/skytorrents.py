@@ -3,9 +3,44 @@ import sys
 import platform
 import logging
 from torrench.utilities.config import Config
+from torrench.utilities.engine import run
+from torrench.utilities.extractor import Extractor, Field, text
+from torrench.utilities.normalize import parse_int, parse_size, parse_date
+from torrench.utilities.result import (
+    TorrentResult, format_size, format_date, format_count, index_cell)
 import click
 
 
+def votes(texts):
+    """
+    Up/down votes: '<name> &nbsp;<up> <img> &nbsp;<down> <img>'.
+
+    Returns (upvotes, downvotes); '0' if missing.
+    """
+    cell = "<".join(texts).split("\xa0")
+    upvotes = cell[1].replace(" ", "").split("<")[0] if len(cell) > 1 else '0'
+    downvotes = cell[2].replace(" ", "").split("<")[0] if len(cell) > 2 else '0'
+    return upvotes, downvotes
+
+
+# Results table (See Extractor). Field paths are relative to a row (<tr>).
+# Cells: name (+ links, votes), size, files, uploaded, seeds, leeches
+EXTRACTOR = Extractor(
+    'sky',
+    rows='(//tr)[position() > 1]',
+    fields=[
+        Field('name', 'td[1]/descendant::a[1]', text),
+        Field('votes', 'td[1]//text()', votes),
+        Field('link', 'td[1]/descendant::a[1]/@href'),
+        Field('magnet', 'td[1]/descendant::a[2]/@href'),
+        Field('size', 'td[2]', text),
+        Field('files', 'td[3]', text),
+        Field('uploaded', 'td[4]', text),
+        Field('seeds', 'td[5]', text),
+        Field('leeches', 'td[6]', text),
+    ])
+
+
 class SkyTorrents(Config):
     """
     SkyTorrents class.
@@ -39,15 +74,23 @@ class SkyTorrents(Config):
             self.OS_WIN = True
         self.index = 0
         self.page = 0
-        self.mylist = []
-        self.output_headers = ["NAME  ["+click.style("+UPVOTES", fg="green")+"/"+click.style("-DOWNVOTES", fg="red")+"]",
-                               "INDEX", "SIZE", "FILES", "UPLOADED", "SEEDS", "LEECHES"]
-        self.mapper = []
+        self.columns = [
+            ("NAME  ["+click.style("+UPVOTES", fg="green")+"/"+click.style("-DOWNVOTES", fg="red")+"]",
+                lambda r, i: r.name + self.format_votes(r)),
+            ("INDEX", index_cell),
+            ("SIZE", lambda r, i: format_size(r.size)),
+            ("FILES", lambda r, i: format_count(r.extra['files'])),
+            ("UPLOADED", lambda r, i: format_date(r.date)),
+            ("SEEDS", lambda r, i: format_count(r.seeds)),
+            ("LEECHES", lambda r, i: format_count(r.leeches)),
+        ]
         self.soup = None
         self.top = "/top1000/all/ed/%d/?l=en-us" % (self.page)
         self.file_count = 0
         self.total_fetch_time = 0
-        self.soup_dict = {}
+        self.total_page_time = 0
+        self.page_results = {}
+        self.masterlist = []
 
     def check_proxy(self):
         """
@@ -56,36 +99,32 @@ class SkyTorrents(Config):
         Though skytorrents (as of now) is only using the
         main site, the function is named as check_proxy to
         confirm uniformity across modules.
+        All proxies are tested concurrently (Config.probe_proxies()).
         In case of failiur, program exits.
         """
-        try:
-            count = 0
-            for proxy in self.proxies:
-                click.echo("Trying %s" % (click.style(proxy, fg="yellow")))
-                self.logger.debug("Trying proxy: %s" % (proxy))
-                """
-                Performing test for string hello.
-                """
-                self.logger.debug("Carrying out test for string 'hello'")
-                self.soup = self.http_request(proxy + "/search/all/ed/1/?l=en-us&q=hello")
-                if self.soup.find_all('tr')[1] is None or self.soup is None or self.soup == -1:
-                    click.echo("Bad proxy!")
-                    count += 1
-                    if count == len(self.proxies):
-                        self.logger.debug("Proxy list finished! Exiting!")
-                        click.echo("No more proxies found! Exiting...")
-                        sys.exit(2)
-                else:
-                    self.logger.debug("Passed! Connected to proxy!")
-                    click.echo("Available!")
-                    self.proxy = proxy
-                    break
-        except Exception as e:
-            click.echo("Error message: %s" %(e))
-            click.echo("Something went wrong! See logs for details. Exiting!")
-            self.logger.exception(e)
+        if run(self.check_proxy_async()) is None:
+            self.logger.debug("Proxy list finished! Exiting!")
+            click.echo("No more proxies found! Exiting...")
             sys.exit(2)
 
+    async def check_proxy_async(self):
+        """Coroutine of check_proxy(). Returns proxy (None if no proxy passed)."""
+        self.proxy = await self.probe_proxies_async(self.proxies, self.test_proxy)
+        if self.proxy is not None:
+            self.logger.debug("Passed! Connected to proxy!")
+            click.echo("Available!")
+        return self.proxy
+
+    def test_proxy(self, proxy):
+        """
+        Test a single proxy (See check_proxy()).
+
+        Performing test for string hello.
+        """
+        self.logger.debug("Carrying out test for string 'hello' (%s)" % (proxy))
+        soup, _ = self.fetch_page(proxy + "/search/all/ed/1/?l=en-us&q=hello", use_cache=False)
+        return soup != -1 and len(soup.find_all('tr')) > 1
+
     def get_top_html(self):
         """To get top 1000 torrents."""
         click.echo(click.style("\n\n*Top 1000 SkyTorrents*", fg="green"))
@@ -109,7 +148,9 @@ class SkyTorrents(Config):
         Once proxy is found, the HTML page for
         corresponding search string is fetched.
         Also, the time taken to fetch that page is returned.
-        Uses http_request_time() from Common.py module.
+        Uses fetch_results_async() from Config.py module.
+        Each page is parsed (parse_page()) as soon as it arrives;
+        only its results are kept.
 
         Also, TOP torrents search is resolved here.
         The variable [search] is set accordingly.
@@ -117,89 +158,107 @@ class SkyTorrents(Config):
         checked for --top.
         """
         try:
-            for self.page in range(self.pages):
-                click.echo("\nFetching from page: %d" % (self.page+1))
-                self.logger.debug("fetching page %d/%d" % (self.page+1, self.pages))
-                """
-                If title is none, get TOP torrents.
-                """
-                if self.title is None:
-                    search = "/top1000/all/ed/%d/?l=en-us" % (self.page+1)
-                else:
-                    search = "/search/all/ed/%d/?l=en-us&q=%s" % (self.page+1, self.title)
-                self.soup, time = self.http_request_time(self.proxy + search)
-                click.echo("[in %.2f sec]" % (time))
-                self.logger.debug("page fetched in %.2f sec!" % (time))
-                self.total_fetch_time += time
-                self.soup_dict[self.page] = self.soup
+            run(self.get_html_async())
         except Exception as e:
             click.echo("Error message: %s" %(e))
             click.echo("Something went wrong! See logs for details. Exiting!")
             self.logger.exception(e)
             sys.exit(2)
 
-    def parse_html(self):
+    async def get_html_async(self):
+        """Coroutine of get_html()."""
+        click.echo("\nFetching %d page(s)..." % (self.pages))
+        searches = []
+        for self.page in range(self.pages):
+            """
+            If title is none, get TOP torrents.
+            """
+            if self.title is None:
+                search = "/top1000/all/ed/%d/?l=en-us" % (self.page+1)
+            else:
+                search = "/search/all/ed/%d/?l=en-us&q=%s" % (self.page+1, self.title)
+            searches.append(search)
+        pages, self.total_fetch_time = await self.fetch_results_async(
+            searches, self.parse_page, stop=self.filter.page_stop(self.pushed, self.categories))
+        for self.page, (results, time) in enumerate(pages):
+            if results == -1:
+                continue
+            self.total_page_time += time
+            self.page_results[self.page] = results
+        click.echo("[in %.2f sec]" % (self.total_fetch_time))
+
+    async def search_async(self):
+        """
+        Check proxy and fetch result pages (without user interaction).
+
+        Returns False if no proxy is available.
         """
-        Parse HTML to get required results.
+        if await self.check_proxy_async() is None:
+            return False
+        await self.get_html_async()
+        return True
 
-        Results are fetched in masterlist list.
-        Also, a mapper[] is used to map 'index'
-        with torrent name, link and magnetic link
-        and files_count (counts number of files torrent has)
+    def parse_page(self, page):
+        """
+        Parse one result page (lxml tree), See EXTRACTOR.
+
+        Runs on engine threads as pages arrive (See get_html_async()),
+        so no attribute is modified.
+        Returns list of TorrentResult. File count and votes are
+        in result's extra ('files', 'upvotes', 'downvotes').
+        """
+        results = []
+        for record in EXTRACTOR.extract(page):
+            name = record['name'].encode('ascii', 'replace').decode()
+            upvotes, downvotes = record['votes']
+            results.append(TorrentResult(
+                name, 'SkyTorrents', size=parse_size(record['size']), seeds=parse_int(record['seeds']),
+                leeches=parse_int(record['leeches']), date=parse_date(record['uploaded']),
+                magnet=record['magnet'], link=self.proxy + record['link'],
+                extra={'files': parse_int(record['files']),
+                       'upvotes': parse_int(upvotes), 'downvotes': parse_int(downvotes)}))
+        return results
+
+    def format_votes(self, result):
+        """Votes of result ('  [+up/-down]')."""
+        upvotes = click.style("+%s" % (format_count(result.extra['upvotes'])), fg="green")
+        downvotes = click.style("-%s" % (format_count(result.extra['downvotes'])), fg="red")
+        return "  [%s]" % (upvotes+"/"+downvotes)
+
+    def parse_html(self, show=True):
+        """
+        Collect parsed results of all pages (See parse_page()).
+
+        Results (TorrentResult) are fetched in masterlist list,
+        in page order; a result's index is its position (from 1).
+        Results are displayed unless show=False.
         """
         masterlist = []
         try:
-            for page in self.soup_dict:
-                self.soup = self.soup_dict[page]
-                content = self.soup.find_all("tr")
-                for i in range(len(content)):
-                    if i == 0:
-                        continue
-                    data = content[i]
-                    results = data.find_all("td")
-                    name = results[0].find_all('a')[0].string
-                    name = name.encode('ascii', 'replace').decode()
-                    upvotes = '0'
-                    downvotes = '0'
-                    try:
-                        upvotes = str(results[0]).split("\xa0")[1].replace(" ", "").split("<")[0]
-                    except IndexError as e:
-                        self.logger.exception(e)
-                        pass
-                    try:
-                        downvotes = str(results[0]).split("\xa0")[2].replace(" ", "").split("<")[0]
-                    except IndexError as e:
-                        self.logger.exception(e)
-                        pass
-                    upvotes = click.style(("+"+upvotes), fg="green")
-                    downvotes = click.style(("-"+downvotes), fg="red")
-                    display_votes = "  [%s]" % (upvotes+"/"+downvotes)
-                    link = results[0].find_all('a')[0]['href']
-                    magnet = results[0].find_all('a')[1]['href']
-                    size = results[1].string
-                    self.file_count = results[2].string
-                    uploaded = results[3].string
-                    seeds = results[4].string
-                    leeches = results[5].string
-                    self.index += 1
-
-                    self.mapper.insert(self.index, (name, magnet, link, self.file_count))
-                    #self.mylist = [name + "["+str(upvotes)+"/"+str(downvotes)+"]", "--"+str(self.index)+"--", size, self.file_count, uploaded, seeds, leeches]
-                    self.mylist = [name + display_votes, "--"+str(self.index)+"--", size, self.file_count, uploaded, seeds, leeches]
-                    masterlist.append(self.mylist)
+            for page in sorted(self.page_results):
+                masterlist.extend(self.page_results[page])
+            self.page_results = {}
+            masterlist = self.filter_results(masterlist)
+            self.index = len(masterlist)
 
             if masterlist == []:
                 click.echo("No results found for given input!")
                 self.logger.debug("No results found for given input! Exiting!")
                 sys.exit(2)
             self.logger.debug("Results fetched successfully!")
-            self.show_output(masterlist, self.output_headers)
+            self.masterlist = masterlist
+            if show:
+                self.show_results(masterlist, self.columns)
         except Exception as e:
             click.echo("Error message: %s" %(e))
             click.echo("Something went wrong! See logs for details. Exiting!")
             self.logger.exception(e)
             sys.exit(2)
 
+    def results(self):
+        """Results (list of TorrentResult), for meta-search."""
+        return self.masterlist
+
     def after_output_text(self):
         """
         After output is displayed, Following text is displayed on console.
@@ -213,8 +272,8 @@ class SkyTorrents(Config):
             if has_extra_pages > 0:
                 exact_no_of_pages += 1
             click.echo("\nTotal %d torrents [%d pages]" % (self.index, exact_no_of_pages))
-            click.echo("Total time: %.2f sec" % (self.total_fetch_time))
-            self.logger.debug("fetched ALL results in %.2f sec" % (self.total_fetch_time))
+            click.echo("Total time: %.2f sec (pages: %.2f sec)" % (self.total_fetch_time, self.total_page_time))
+            self.logger.debug("fetched ALL results in %.2f sec (sum of pages: %.2f sec)" % (self.total_fetch_time, self.total_page_time))
             click.echo("\nFurther, torrent can be downloaded using magnetic link\nOR\nTorrent's upstream link can be obtained to be opened in web browser.")
             click.echo("\nEnter torrent's index value to fetch details (Maximum one index)\n")
         except Exception as e:
@@ -247,8 +306,10 @@ class SkyTorrents(Config):
                     click.echo("\nBad Input!")
                     continue
                 else:
-                    selected_torrent, req_magnetic_link, torrent_link, self.file_count = self.mapper[temp-1]
-                    selected_torrent = click.style(selected_torrent, fg="yellow")
+                    result = self.masterlist[temp-1]
+                    req_magnetic_link, torrent_link = result.magnet, result.link
+                    self.file_count = result.extra['files'] or 0
+                    selected_torrent = click.style(result.name, fg="yellow")
                     click.echo("\nSelected index [%d] - %s\n" % (temp, selected_torrent))
                     self.logger.debug("selected torrent: %s ; index: %d" % (selected_torrent, temp))
 
@@ -267,7 +328,7 @@ class SkyTorrents(Config):
                         self.logger.debug("printing magnetic link and upstream link")
                         click.echo("\nMagnet link: {magnet}".format(magnet=click.style(req_magnetic_link, fg="red")))
                         self.copy_magnet(req_magnetic_link)
-                        upstream_link = click.style(self.proxy + torrent_link, fg="yellow")
+                        upstream_link = click.style(torrent_link, fg="yellow")
                         click.echo("\n\nUpstream link: {url}\n".format(url=upstream_link))
                     elif temp2 == 'l':
                         try:
@@ -286,7 +347,7 @@ class SkyTorrents(Config):
         self.logger.debug("Show torrent files selected")
         self.logger.debug("Torrent has %d files" %(int(self.file_count)))
         if int(self.file_count) > 0:
-            soup = self.http_request(self.proxy + torrent_link)
+            soup = self.http_request(torrent_link)
             click.echo("\nTotal %d files" % (int(self.file_count)))
             for i in range(int(self.file_count)):
                 name = soup.find_all("tr")[i+1].find_all('td')[0].string
@@ -306,8 +367,9 @@ def main(title, page_limit):
             sky.get_top_html()
         sky.get_html()
         sky.parse_html()
-        sky.after_output_text()
-        sky.select_torrent()
+        if sky.output_format is None:
+            sky.after_output_text()
+            sky.select_torrent()
     except KeyboardInterrupt:
         sky.logger.debug("Keyboard interupt! Exiting!")
         click.echo("\n\nAborted!")
@@ -5,8 +5,64 @@ import platform
 import logging
 import torrench.modules.tpb_details as tpb_details
 from torrench.utilities.config import Config
+from torrench.utilities.engine import run
+from torrench.utilities.extractor import Extractor, Field, has_class, all_of
+from torrench.utilities.normalize import parse_int, parse_size, parse_date
+from torrench.utilities.result import (
+    TorrentResult, format_size, format_date, format_count, index_cell)
 import click
 
+
+def detlink_name(links):
+    """Torrent name (from link's title if link text is missing)."""
+    link = links[0]
+    if link.text is None or len(link):
+        return " ".join(link.get('title').split(" ")[2:])
+    return link.text
+
+
+def desc_uploader(descs):
+    """Uploader (anonymous uploaders have no link)."""
+    uploader = descs[0].find('.//a')
+    if uploader is None:
+        uploader = descs[0].find('.//i')
+    return uploader.text
+
+
+def desc_part(position):
+    """Converter: 'position'th word of 'Uploaded <date>, Size <size>, ULed by <uploader>'."""
+    return lambda descs: descs[0].text_content().split(' ')[position].replace(',', "")
+
+
+# Order/category codes of search URL (--sort/--category pushdown, See filters module).
+SORT_CODES = {'seeds': 7, 'size': 5, 'date': 3}
+CATEGORY_CODES = {'audio': 100, 'video': 200, 'applications': 300, 'games': 400, 'porn': 500, 'other': 600}
+# Main categories (as in 'Video > Movies') -> --category values.
+CATEGORY_NAMES = {'audio': 'audio', 'video': 'video', 'applications': 'applications',
+                  'games': 'games', 'porn': 'porn', 'other': 'other'}
+
+# Results table (See Extractor). Field paths are relative to a row (<tr>).
+EXTRACTOR = Extractor(
+    'tpb',
+    table='//table[@id="searchResult"]',
+    rows='//table[@id="searchResult"]//tr[td]',
+    fields=[
+        Field('categ', 'td[%s]//a/text()' % (has_class('vertTh')),
+              lambda categs: categs[0] + " > " + categs[1]),
+        Field('name', './/a[%s]' % (has_class('detLink')), detlink_name),
+        Field('uploader', './/font[%s]' % (has_class('detDesc')), desc_uploader),
+        Field('date', './/font[%s]' % (has_class('detDesc')), desc_part(1)),
+        Field('size', './/font[%s]' % (has_class('detDesc')), desc_part(3)),
+        Field('seeds', 'td[@align="right"][1]/text()'),
+        Field('leeches', 'td[@align="right"][2]/text()'),
+        Field('comments', './/img[contains(@src, "/static/img/icon_comment.gif")]/@alt',
+              lambda alts: alts[0].split(" ")[-2] if alts else '0'),
+        Field('status', './/img[@title="VIP" or @title="Trusted"]/@title', all_of),
+        Field('id', './/a[%s]' % (has_class('detLink')), lambda links: links[0].get('href').split('/')[2]),
+        Field('magnet', './/a[@title="Download this torrent using magnet"]/@href'),
+    ])
+
+
 class ThePirateBay(Config):
     """
     ThePirateBay class.
@@ -33,18 +89,28 @@ class ThePirateBay(Config):
         self.logger = logging.getLogger('log1')
         self.page = 0
         self.proxy = None
+        self.categories = CATEGORY_NAMES
         self.soup = None
         self.non_color_name = None
-        self.soup_dict = {}
+        self.page_results = {}
         self.OS_WIN = False
         if platform.system() == "Windows":
             self.OS_WIN = True
         self.index = 0
         self.total_fetch_time = 0
-        self.mylist = []
-        self.mapper = []
-        self.output_headers = [
-                'CATEG', 'NAME', 'INDEX', 'UPLOADER', 'SIZE', 'S', 'L', 'DATE', 'C']
+        self.total_page_time = 0
+        self.masterlist = []
+        self.columns = [
+            ('CATEG', lambda r, i: r.category),
+            ('NAME', lambda r, i: self.colorify_status(r, r.name)),
+            ('INDEX', index_cell),
+            ('UPLOADER', lambda r, i: self.colorify_status(r, r.uploader)),
+            ('SIZE', lambda r, i: format_size(r.size)),
+            ('S', lambda r, i: format_count(r.seeds)),
+            ('L', lambda r, i: format_count(r.leeches)),
+            ('DATE', lambda r, i: format_date(r.date)),
+            ('C', lambda r, i: format_count(r.comments)),
+        ]
 
     def check_proxy(self):
         """
@@ -60,41 +126,38 @@ class ThePirateBay(Config):
         from config file. The Common class consists of commonly used
         methods.
 
-        In case of failiur, next proxy is tested with same procedure.
-        This continues until working proxy is found.
+        All proxies are tested concurrently (Config.probe_proxies()).
+        First proxy to pass the test is used.
         If no proxy is found, program exits.
         """
-        count = 1
-        for proxy in self.proxies:
-            click.echo("Trying %s" % (click.style(proxy, fg="yellow")))
-            self.logger.debug("Trying proxy: %s" % (proxy))
-            self.soup = self.http_request(proxy)
-            try:
-                if self.soup == -1 or self.soup.a.string != 'The Pirate Bay':
-                    click.echo("Bad proxy!")
-                    count += 1
-                    if count == len(self.proxies):
-                        click.echo("No more proxies found! Exiting...")
-                        sys.exit(2)
-                    else:
-                        continue
-                else:
-                    click.echo("Proxy available. Performing test...")
-                    url = proxy+"/search/hello/0/99/0"
-                    self.logger.debug("Carrying out test for string 'hello'")
-                    self.soup = self.http_request(url)
-                    test = self.soup.find('div', class_='detName')
-                    if test is not None:
-                        self.proxy = proxy
-                        click.echo("Pass!")
-                        self.logger.debug("Test passed!")
-                        break
-                    else:
-                        click.echo("Test failed!\nPossibly site not reachable. See logs.")
-                        self.logger.debug("Test failed!")
-            except (AttributeError, Exception) as e:
-                self.logger.exception(e)
-                pass
+        if run(self.check_proxy_async()) is None:
+            click.echo("No more proxies found! Exiting...")
+            sys.exit(2)
+
+    async def check_proxy_async(self):
+        """Coroutine of check_proxy(). Returns proxy (None if no proxy passed)."""
+        self.proxy = await self.probe_proxies_async(self.proxies, self.test_proxy)
+        if self.proxy is not None:
+            click.echo("Pass!")
+            self.logger.debug("Test passed!")
+        return self.proxy
+
+    def test_proxy(self, proxy):
+        """
+        Test a single proxy (See check_proxy()).
+
+        Runs on a worker thread, so only local variables are used.
+        """
+        self.logger.debug("Trying proxy: %s" % (proxy))
+        soup, _ = self.fetch_page(proxy, use_cache=False)
+        if soup == -1 or soup.a is None or soup.a.string != 'The Pirate Bay':
+            return False
+        self.logger.debug("Carrying out test for string 'hello' (%s)" % (proxy))
+        soup, _ = self.fetch_page(proxy + "/search/hello/0/99/0", use_cache=False)
+        if soup == -1 or soup.find('div', class_='detName') is None:
+            self.logger.debug("Test failed! (%s)" % (proxy))
+            return False
+        return True
 
     def get_html(self):
         """
@@ -103,24 +166,46 @@ class ThePirateBay(Config):
         Once proxy is found, the HTML page for
         corresponding search string is fetched.
         Also, the time taken to fetch that page is returned.
-        Uses http_request_time() from Common.py module.
+        Uses fetch_results_async() from Config.py module.
+        Each page is parsed (parse_page()) as soon as it arrives;
+        only its results are kept.
         """
         try:
-            for self.page in range(self.pages):
-                click.echo("\nFetching from page: %d" % (self.page+1))
-                search = "/search/%s/%d/99/0" % (self.title, self.page)
-                self.soup, time = self.http_request_time(self.proxy + search)
-                self.logger.debug("fetching page %d/%d" % (self.page+1, self.pages))
-                click.echo("[in %.2f sec]" % (time))
-                self.logger.debug("page fetched in %.2f sec!" % (time))
-                self.total_fetch_time += time
-                self.soup_dict[self.page] = self.soup
+            run(self.get_html_async())
         except Exception as e:
             self.logger.exception(e)
             click.echo("Error message: %s" %(e))
             click.echo("Something went wrong! See logs for details. Exiting!")
             sys.exit(2)
 
+    async def get_html_async(self):
+        """Coroutine of get_html()."""
+        click.echo("\nFetching %d page(s)..." % (self.pages))
+        searches = []
+        order, category, self.pushed = self.filter.pushdown(SORT_CODES, CATEGORY_CODES)
+        for self.page in range(self.pages):
+            search = "/search/%s/%d/%d/%d" % (self.title, self.page, order or 99, category or 0)
+            searches.append(search)
+        pages, self.total_fetch_time = await self.fetch_results_async(
+            searches, self.parse_page, stop=self.filter.page_stop(self.pushed, self.categories))
+        for self.page, (results, time) in enumerate(pages):
+            if results == -1:
+                continue
+            self.total_page_time += time
+            self.page_results[self.page] = results
+        click.echo("[in %.2f sec]" % (self.total_fetch_time))
+
+    async def search_async(self):
+        """
+        Check proxy and fetch result pages (without user interaction).
+
+        Returns False if no proxy is available.
+        """
+        if await self.check_proxy_async() is None:
+            return False
+        await self.get_html_async()
+        return True
+
     def get_top_html(self):
         """To get top torrents."""
         try:
@@ -129,94 +214,113 @@ class ThePirateBay(Config):
             option = click.prompt("Option: ", type=int)
             if option == 1:
                 self.logger.debug("Selected [TOP-ALL] (Option: %d)" % (option))
-                self.soup, time = self.http_request_time(self.proxy + self.top)
+                url = self.proxy + self.top
             elif option == 2:
                 self.logger.debug("Selected [TOP-48h] (Option: %d)" % (option))
-                self.soup, time = self.http_request_time(self.proxy + self.top48)
+                url = self.proxy + self.top48
             else:
                 click.echo("Bad Input! Exiting!")
                 sys.exit(2)
+            page, time = run(self.fetch_async(url, tree=True))
+            if page == -1:
+                click.echo("Unable to fetch page! Exiting!")
+                sys.exit(2)
             self.total_fetch_time = time
-            self.soup_dict[0] = self.soup
+            self.total_page_time = time
+            self.page_results[0] = self.parse_page(page)
         except ValueError as e:
             click.echo("Bad input! Exiting!")
             self.logger.exception(e)
             sys.exit(2)
 
-    def parse_html(self):
+    def make_result(self, categ, name, uploader, size, seeds, leeches, date, comments, status, torr_id, magnet):
+        """Build TorrentResult out of a result row's (text) values."""
+        if self.OS_WIN:
+            # Handling Unicode characters in windows.
+            name = name.encode('ascii', 'replace').decode()
+        return TorrentResult(
+            name, 'TPB', size=parse_size(size), seeds=parse_int(seeds), leeches=parse_int(leeches),
+            date=parse_date(date), magnet=magnet,
+            # Upstream torrent link
+            link="%s/torrent/%s" % (self.proxy, torr_id),
+            category=categ, uploader=uploader, comments=parse_int(comments), status=status)
+
+    def parse_page(self, page):
         """
-        Parse HTML to get required results.
+        Parse one result page (lxml tree), See EXTRACTOR.
+
+        Runs on engine threads as pages arrive (See get_html()),
+        so no attribute is modified.
+        Returns list of TorrentResult; None if page has no results table.
+        """
+        records = EXTRACTOR.extract(page)
+        if records is None:
+            return None
+        results = []
+        for record in records:
+            # See if uploader is VIP/Truested/Normal Uploader
+            status = None
+            if 'VIP' in record['status']:
+                status = 'VIP'
+            elif 'Trusted' in record['status']:
+                status = 'Trusted'
+            results.append(self.make_result(
+                record['categ'], record['name'], record['uploader'], record['size'], record['seeds'],
+                record['leeches'], record['date'], record['comments'], status, record['id'], record['magnet']))
+        return results
+
+    def colorify_status(self, result, text):
+        """Colour name/uploader by uploader status (VIP: green, Trusted: magenta)."""
+        if result.status == 'VIP':
+            return click.style(text, "green")
+        elif result.status == 'Trusted':
+            return click.style(text, "magenta")
+        return text
 
-        Results are fetched in masterlist list.
-        Also, a mapper[] is used to map 'index'
-        with torrent name, link and magnetic link
+    def parse_html(self, show=True):
+        """
+        Collect parsed results of all pages (See parse_page()).
+
+        Results (TorrentResult) are fetched in masterlist list,
+        in page order; a result's index is its position (from 1).
+        Results are displayed unless show=False.
         """
         masterlist = []
         try:
-            for page in self.soup_dict:
-                self.soup = self.soup_dict[page]
-                content = self.soup.find('table', id="searchResult")
-                if content is None:
+            for page in sorted(self.page_results):
+                results = self.page_results[page]
+                if results is None:
                     click.echo("\nNo results found for given input!")
                     self.logger.debug("No results found for given input! Exiting!")
                     sys.exit(2)
-                data = content.find_all('tr')
-
-                for i in data[1:]:
-                    name = i.find('a', class_='detLink').string
-                    uploader = i.find('font', class_="detDesc").a
-                    if name is None:
-                        name = i.find('a', class_='detLink')['title'].split(" ")[2:]
-                        name = " ".join(str(x) for x in name)
-                    if uploader is None:
-                        uploader = i.find('font', class_="detDesc").i.string
-                    else:
-                        uploader = uploader.string
-                    if self.OS_WIN:
-                        # Handling Unicode characters in windows.
-                        name = name.encode('ascii', 'replace').decode()
-                    comments = i.find(
-                        'img', {'src': '//%s/static/img/icon_comment.gif' % (self.proxy.split('/')[2])})
-                    # Total number of comments
-                    if comments is None:
-                        comment = '0'
-                    else:
-                        comment = comments['alt'].split(" ")[-2]
-                    # See if uploader is VIP/Truested/Normal Uploader
-                    self.non_color_name = name
-                    is_vip = i.find('img', {'title': "VIP"})
-                    is_trusted = i.find('img', {'title': 'Trusted'})
-                    if(is_vip is not None):
-                        name = click.style(name, "green")
-                        uploader = click.style(uploader, "green")
-                    elif(is_trusted is not None):
-                        name = click.style(name, "magenta")
-                        uploader = click.style(uploader, "magenta")
-                    categ = i.find('td', class_="vertTh").find_all('a')[0].string
-                    sub_categ = i.find('td', class_="vertTh").find_all('a')[1].string
-                    seeds = i.find_all('td', align="right")[0].string
-                    leeches = i.find_all('td', align="right")[1].string
-                    date = i.find('font', class_="detDesc").get_text().split(' ')[1].replace(',', "")
-                    size = i.find('font', class_="detDesc").get_text().split(' ')[3].replace(',', "")
-                    # Unique torrent id
-                    torr_id = i.find('a', {'class': 'detLink'})["href"].split('/')[2]
-                    # Upstream torrent link
-                    link = "%s/torrent/%s" % (self.proxy, torr_id)
-                    magnet = i.find_all('a', {'title': 'Download this torrent using magnet'})[0]['href']
-                    self.index += 1
-                    self.mapper.insert(self.index, (name, magnet, link))
-
-                    self.mylist = [categ + " > " + sub_categ, name, "--" +
-                        str(self.index) + "--", uploader, size, seeds, leeches, date, comment]
-                    masterlist.append(self.mylist)
+                masterlist.extend(results)
+            self.page_results = {}
+            masterlist = self.filter_results(masterlist)
+            if not masterlist:
+                click.echo("\nNo results found for given input!")
+                self.logger.debug("No results found for given input! Exiting!")
+                sys.exit(2)
+            self.index = len(masterlist)
             self.logger.debug("Results fetched successfully!")
-            self.show_output(masterlist, self.output_headers)
+            self.masterlist = masterlist
+            if show:
+                self.show_results(masterlist, self.columns)
         except Exception as e:
             self.logger.exception(e)
             click.echo("Error message: %s" % (e))
             click.echo("Something went wrong! See logs for details. Exiting!")
             sys.exit(2)
 
+    def prefetch_details(self, count):
+        """Fetch details of top 'count' results in background (See tpb_details.Prefetcher)."""
+        urls = [result.link for result in self.masterlist[:count]]
+        self.logger.debug("prefetching details of top %d results" % (len(urls)))
+        tpb_details.prefetch(urls)
+
+    def results(self):
+        """Results (list of TorrentResult), for meta-search."""
+        return self.masterlist
+
     def after_output_text(self):
         """
         After output is displayed, Following text is displayed on console.
@@ -233,8 +337,8 @@ class ThePirateBay(Config):
                 if has_extra_pages > 0:
                     exact_no_of_pages += 1
             click.echo("\nTotal %d torrents [%d pages]" % (self.index, exact_no_of_pages))
-            click.echo("Total time: %.2f sec" % (self.total_fetch_time))
-            self.logger.debug("fetched ALL results in %.2f sec" % (self.total_fetch_time))
+            click.echo("Total time: %.2f sec (pages: %.2f sec)" % (self.total_fetch_time, self.total_page_time))
+            self.logger.debug("fetched ALL results in %.2f sec (sum of pages: %.2f sec)" % (self.total_fetch_time, self.total_page_time))
             click.echo("\nFurther, a torrent's details can be fetched (Description, comments, download (Magnetic) Link, etc.)")
             click.echo("Enter torrent's index value to fetch details (Maximum one index)\n")
         except Exception as e:
@@ -267,8 +371,11 @@ class ThePirateBay(Config):
                     click.echo("\nBad Input!")
                     continue
                 else:
-                    selected_torrent, req_magnetic_link, torrent_link = self.mapper[temp-1]
+                    result = self.masterlist[temp-1]
+                    req_magnetic_link, torrent_link = result.magnet, result.link
+                    selected_torrent = self.colorify_status(result, result.name)
                     click.echo("Selected index [%d] - %s\n" % (temp, selected_torrent))
+                    self.non_color_name = result.name
                     self.logger.debug("selected torrent: %s ; index: %d" % (self.non_color_name, temp))
                     temp2 = click.prompt("1. Print magnetic link [p]\n2. Load magnetic link to client [l]\n3. Get torrent details [g]\n\nOption [p/l/g]: ", type=str)
                     temp2 = temp2.lower()
@@ -303,8 +410,13 @@ class ThePirateBay(Config):
                 continue
 
 
-def main(title, page_limit):
-    """Execution begins here."""
+def main(title, page_limit, prefetch=0):
+    """
+    Execution begins here.
+
+    prefetch:: Number of top results whose details are fetched
+    in background while results are shown (--prefetch-details).
+    """
     try:
         click.echo("\n[The Pirate Bay]\n")
         click.echo("Obtaining proxies...")
@@ -315,11 +427,16 @@ def main(title, page_limit):
         else:
             tpb.get_html()
         tpb.parse_html()
-        tpb.after_output_text()
-        tpb.select_torrent()
+        if tpb.output_format is None:
+            if prefetch:
+                tpb.prefetch_details(prefetch)
+            tpb.after_output_text()
+            tpb.select_torrent()
     except KeyboardInterrupt:
         tpb.logger.debug("Keyboard interupt! Exiting!")
         click.echo("\n\nAborted!")
+    finally:
+        tpb_details.cancel_prefetch()
 
 
 if __name__ == "__main__":
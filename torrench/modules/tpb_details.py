@@ -2,14 +2,28 @@
 # Details are saved in a custom HTML page
 # HTML files are saved in ~/.torrench/temp directory
 # HTML files can be cleared with (-c) argument [To be used with -t ]
+# Parsed details are cached by torrent id (TTL: cache.SITE_TTL['tpb_details']),
+# so viewing a torrent again does not touch the network.
+# Details of the top results can be prefetched in background (--prefetch-details N),
+# See Prefetcher.
+# HTML files are evicted (least recently viewed first) once they exceed
+# TEMP_SIZE or TEMP_AGE, See TempStore.
 
 from bs4 import BeautifulSoup
-import requests
 import os
 import time
+import json
 import platform
-import io
+import queue
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from string import Template
 import click
+import torrench.utilities.cache as cache
+from torrench.utilities.engine import get_engine, run
+from torrench.utilities.session import get_session, get_setting, DEFAULT_MAX_WORKERS
 
 home = os.path.expanduser(os.path.join('~', '.torrench'))
 temp_dir = os.path.expanduser(os.path.join(home, 'temp'))
@@ -19,170 +33,631 @@ if platform.system() == 'Windows':
 else:
     charset = "<meta charset='utf-8'>"
 
+logger = logging.getLogger('log1')
 
-def get_details(url, index):
-    initial_time = time.time()
-    raw = requests.get(url)
-    initial_end_time = time.time() - initial_time
-    raw = raw.content
-    unique_id = url.split('/')[-1]
-    soup = BeautifulSoup(raw, "lxml")
+# Cache key of parsed details of a torrent (by id; same for every proxy).
+DETAILS_KEY = "tpb-details:%s"
 
-    content = soup.find('div', id="details")
-    nfo = str(content.find_all('div', class_="nfo")[0])
-    dt = content.find_all('dt')  # Torrent info table headers
-    dd = content.find_all('dd')  # info table values
-    title = "(Index: " + index + ") - " + str(soup.find('div', id="title").string)
-    name = str(soup.find('div', id="title"))
-    magnet = soup.find('div', class_="download").a["href"]
+# Prefetch limits (torrench.ini: PREFETCH_WORKERS, PREFETCH_RATE in KB/sec; 0: unlimited,
+# PREFETCH_WAIT in sec: max. wait for a prefetch in progress)
+DEFAULT_PREFETCH_WORKERS = 2
+DEFAULT_PREFETCH_RATE = 256
+DEFAULT_PREFETCH_WAIT = 10
+_prefetcher = None
 
-    # FETCHING COMMENTS
-    comments_list = []
-    commenter_list = []
+# Bounds of temp_dir (torrench.ini: TEMP_SIZE in MB, TEMP_AGE in days)
+TEMP_INDEX = '.index.json'
+# Files the index does not list are looked for at most this often (sec), See TempStore.load().
+TEMP_SWEEP = '.swept'
+TEMP_SWEEP_INTERVAL = 86400
+DEFAULT_TEMP_SIZE = 20
+DEFAULT_TEMP_AGE = 7
+_temp_store = None
 
-    # Fetching comments of base (default) page
+# Page templates (compiled once). A page is rendered into one string
+# and written with a single call (See render_details()).
+STYLE = ("<style> pre {white-space: pre-wrap; text-align: left} h2, .center {text-align: center;} "
+         ".vip {color: #32CD32} .trusted {color: #FF00CC}  body {margin:0 auto; width:70%;} "
+         "table, td, th {border: 1px solid black;} td, th {text-align: center; vertical-align: middle; "
+         "font-size: 15px; padding: 6px} .boxed{border: 1px solid black; padding: 3px} </style> ")
+PAGE = Template(
+    "<!DOCTYPE html><html><head>" + charset + "<meta http-equiv='Content-type'> "
+    "<title>$title</title>" + STYLE + "</head><body>"
+    "<h2><u><a href=$url target='_blank'>$name</a></u></h2><br />"
+    "<table align='center'><tr>$info_headers</tr>\n<tr>\n$info_values</tr></table>"
+    "$status<br />"
+    "<div class='center'><a href=$magnet target='_blank'>[Magnetic Link (Download)]</a></div><br />"
+    "<div class='boxed'><h2><u> DESCRIPTION </u></h2><pre>$nfo</pre></div>"
+    "<div class='boxed'><h2><u> COMMENTS </u></h2>$comments</div><br />"
+    "<br /><div class='center'><a href=$magnet target='_blank'>[Magnetic Link (Download)]</a></div><br /><br />"
+    "</body></html>")
+INFO_HEADER = Template("<th>$text</th>")
+INFO_VALUE = Template("<td>$text</td>")
+STATUS_VALUE = Template("<div class='$status'>$text</div>")
+STATUS = {
+    'vip': "<div class='vip'> *VIP Uploader </div>",
+    'trusted': "<div class='trusted'> *Trusted Uploader </div>",
+}
+COMMENT = Template("<tr><th>$commenter</th><td><pre>$comment</pre></td></tr>")
+COMMENTS = Template("<table align='center'>$rows</table><br />"
+                    "<div class=center> (Total $count comments) </div><br />")
+NO_COMMENTS = "<pre class='center'>No comments found!</pre>"
+
+
+def parse_comments(soup):
+    """Comments of a details/comment page, as [commenter, comment] pairs."""
     comments = soup.find_all('div', class_='comment')
     commenter = soup.find(id="comments").find_all('p')
-    comments_list.append(comments)
-    commenter_list.append(commenter)
+    return [[str(i.get_text()), str(j.get_text())] for i, j in zip(commenter, comments)]
 
-    # Determine if any other comment pages are present.
-    total_comments_pages = soup.find('div', class_='browse-coms')  # Total number of comment pages
-    opt = ''
-    total_time = 0
-    if total_comments_pages is not None:
-        total_comments_pages = int(soup.find('div', class_='browse-coms').strong.string)
-        click.echo("\n%d comment pages (1 page = 25 comments (MAX))" % (total_comments_pages))
-        temp = True
-        pg_count = 0
-        if(total_comments_pages > 2):  # If more than 3 comment pages are present, ask user what to do.
-            while(temp):
-                opt = click.prompt("Fetch all pages? May take longer [y/n/display anyway[d]]: ", type=str)
-                if opt == 'y' or opt == 'Y':
-                    pg_count = 0
-                    temp = False
-                elif opt == 'n' or opt == 'N':
-                    pg_inp = click.prompt("Number of pages to fetch comments from? [0 < n < %d]: " % (total_comments_pages), type=int);
-                    if pg_inp == '':
-                        click.echo("Bad Input")
-                    else:
-                        pg_inp = int(pg_inp)
-                        if pg_inp < total_comments_pages and pg_inp > 0:
-                            pg_count = total_comments_pages - pg_inp
-                            temp = False
-                        else:
-                            click.echo("Bad Input")
-                elif opt == 'd' or opt == 'D':
-                    pg_count = total_comments_pages
-                    temp = False
-                else:
-                    click.echo("Bad Input")
 
-        click.echo("\nLast page (%d) [Already fetched]" % (total_comments_pages))
-        total_comments_pages -= 1  # Since last page is already fetched. So start from (n-1)th page
+def parse_details(soup):
+    """
+    Parse details page (soup).
 
-        while(total_comments_pages > pg_count):
-            start_time = time.time()
-            raw = requests.get(url, params={'page': total_comments_pages})
-            end_time = time.time() - start_time
-            click.echo("Page " + str(total_comments_pages) + " [%.2f sec]" % (end_time))
-            raw = raw.content
-            soup2 = BeautifulSoup(raw, "lxml")
-            comments = soup2.find_all('div', class_='comment')
-            commenter = soup2.find(id="comments").find_all('p')
-            comments_list.append(comments)
-            commenter_list.append(commenter)
-            total_time += end_time
-            total_comments_pages -= 1
-
-    torrent_hash = soup.find('div', class_="download").a["href"].split('&')[0].split(':')[-1]
-    torrent_hash = torrent_hash.upper()
+    Returns details (dict; JSON serializable, so it can be cached):
+    title, name, info table (headers/values), uploader status, magnet,
+    NFO and comments of the page.
+    """
+    content = soup.find('div', id="details")
+    dt = content.find_all('dt')  # Torrent info table headers
+    dd = content.find_all('dd')  # info table values
+    magnet = soup.find('div', class_="download").a["href"]
 
     # Set torrent hash explicitly as it is not fetched directly as other dd elements
-    dd[-1].string = torrent_hash
+    torrent_hash = magnet.split('&')[0].split(':')[-1]
+    dd[-1].string = torrent_hash.upper()
 
     # Check Uploader-Status
-    style_tag = "<style> pre {white-space: pre-wrap; text-align: left} h2, .center {text-align: center;} .vip {color: #32CD32} .trusted {color: #FF00CC}  body {margin:0 auto; width:70%;} table, td, th {border: 1px solid black;} td, th {text-align: center; vertical-align: middle; font-size: 15px; padding: 6px} .boxed{border: 1px solid black; padding: 3px} </style> "
-    begin_tags = "<!DOCTYPE html><html><head>" + charset + "<meta http-equiv='Content-type'> <title>" + title + "</title>" + style_tag + "</head><body>"
-    end_tags = "</body></html>"
-
-    # File opens here
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-
-    html_file = os.path.join(temp_dir, unique_id + ".html")
-    f = io.open(html_file, "w", encoding="utf-8")
-    f.write(begin_tags)
-    f.write("<h2><u><a href=" + url + " target='_blank'>" + name + "</a></u></h2><br />")
-    f.write("<table align='center'>")
-
-    # Torrent info table
-    for i in dt:
-        dt_str = str(i.get_text()).replace(":", "")
-        f.write("<th>" + dt_str + "</th>")
-    f.write("</tr>\n<tr>\n")
     status = ""
+    values = []
     for j in dd:
-        dd_str = str(j.get_text()).replace(":", "")
+        value = [str(j.get_text()).replace(":", ""), None]
         if j.img is not None:
             if j.img['title'] == 'VIP':
-                dd_str = "<div class='vip'>" + dd_str + "</div>"
-                status = 'vip'
+                value[1] = status = 'vip'
             elif j.img['title'] == 'Trusted':
-                dd_str = "<div class='trusted'>" + dd_str + "</div>"
-                status = 'trusted'
-        f.write("<td>" + dd_str + "</td>")
-    f.write("</tr></table>")
-
-    if status == 'vip':
-        f.write("<div class='vip'> *VIP Uploader </div>")
-    elif status == 'trusted':
-        f.write("<div class='trusted'> *Trusted Uploader </div>")
-
-    f.write("<br />")
-
-    # Magnetic link[1]
-    f.write("<div class='center'><a href=" + magnet + " target='_blank'>[Magnetic Link (Download)]</a></div><br />")
-
-    # Printing Description
-    f.write("<div class='boxed'>")
-    f.write("<h2><u> DESCRIPTION </u></h2>")
-    f.write("<pre>")
-    f.write(nfo)
-    f.write("</pre></div>")
-    f.write("<div class='boxed'>")
-    f.write("<h2><u> COMMENTS </u></h2>")
-    # End Description
-
-    count = 0
-
-    # Printing Comments
-    if commenter_list != [] and commenter_list[0] != []:
-        f.write("<table align='center'>")
-        for k in range(len(commenter_list)):
-            for i, j in zip(commenter_list[k], comments_list[k]):
-                f.write("<tr><th>" + str(i.get_text()) + "</th>")
-                f.write("<td><pre>" + str(j.get_text()) + "</pre></td></tr>")
-                count += 1
-        f.write("<div class=center> (Total %d comments) </div><br />" % (count))
-        f.write("</table><br />")
-        f.write("<div class=center> (Total %d comments) </div><br />" % (count))
+                value[1] = status = 'trusted'
+        values.append(value)
+
+    return {
+        'title': str(soup.find('div', id="title").string),
+        'name': str(soup.find('div', id="title")),
+        'headers': [str(i.get_text()).replace(":", "") for i in dt],
+        'values': values,
+        'status': status,
+        'magnet': magnet,
+        'nfo': str(content.find_all('div', class_="nfo")[0]),
+        'comments': [parse_comments(soup)],  # One list per comment page fetched
+        'comment_pages': 1,
+    }
+
+
+def fetch_comment_page(url, page):
+    """
+    Fetch comment page 'page' of 'url' (blocking; run on engine threads).
+
+    Returns comments of the page (See parse_comments()).
+    Raises on errors (HTTP error status included).
+    """
+    raw = get_session().get(url, params={'page': page})
+    raw.raise_for_status()
+    return parse_comments(BeautifulSoup(raw.content, "lxml"))
+
+
+async def fetch_comment_pages_async(url, pages):
+    """
+    Fetch comment 'pages' (page numbers) of 'url' concurrently.
+
+    At most MAX_WORKERS pages are in flight at a time.
+    Time taken by each page is displayed as it arrives.
+    Returns list of comments per page, in the same order as 'pages';
+    a failed page is None.
+    """
+    results = [None] * len(pages)
+    limit = asyncio.Semaphore(max(1, min(get_setting('MAX_WORKERS', DEFAULT_MAX_WORKERS), len(pages))))
+
+    async def fetch(index, page):
+        async with limit:
+            start_time = time.time()
+            try:
+                results[index] = await get_engine().call(fetch_comment_page, url, page)
+            except Exception as e:
+                logger.exception(e)
+                click.echo("Page %d [failed after %.2f sec]" % (page, time.time() - start_time))
+                return
+        click.echo("Page %d [%.2f sec]" % (page, time.time() - start_time))
+
+    await asyncio.gather(*[fetch(index, page) for index, page in enumerate(pages)])
+    return results
+
+
+def comment_pages_to_fetch(total_comments_pages):
+    """
+    Ask which comment pages to fetch (if more than 2).
+
+    Returns (pages, opt): page numbers, last page first (it is already
+    fetched, being the details page itself), and user's option.
+    """
+    click.echo("\n%d comment pages (1 page = 25 comments (MAX))" % (total_comments_pages))
+    opt = ''
+    temp = True
+    pg_count = 0
+    if(total_comments_pages > 2):  # If more than 3 comment pages are present, ask user what to do.
+        while(temp):
+            opt = click.prompt("Fetch all pages? May take longer [y/n/display anyway[d]]: ", type=str)
+            if opt == 'y' or opt == 'Y':
+                pg_count = 0
+                temp = False
+            elif opt == 'n' or opt == 'N':
+                pg_inp = click.prompt("Number of pages to fetch comments from? [0 < n < %d]: " % (total_comments_pages), type=int);
+                if pg_inp == '':
+                    click.echo("Bad Input")
+                else:
+                    pg_inp = int(pg_inp)
+                    if pg_inp < total_comments_pages and pg_inp > 0:
+                        pg_count = total_comments_pages - pg_inp
+                        temp = False
+                    else:
+                        click.echo("Bad Input")
+            elif opt == 'd' or opt == 'D':
+                pg_count = total_comments_pages
+                temp = False
+            else:
+                click.echo("Bad Input")
+
+    click.echo("\nLast page (%d) [Already fetched]" % (total_comments_pages))
+    # Pages (n-1) down to (pg_count+1); last page is already fetched.
+    return list(range(total_comments_pages - 1, pg_count, -1)), opt
+
+
+def fetch_details(url):
+    """
+    Fetch and parse details (and comment pages) of torrent at 'url'.
+
+    Returns (details, opt, time taken, failed): time taken by details and
+    comment pages (not by the user's answer), and number of comment
+    pages that failed (left out of details).
+    """
+    initial_time = time.time()
+    raw = get_session().get(url)
+    fetch_time = time.time() - initial_time
+    soup = BeautifulSoup(raw.content, "lxml")
+    details = parse_details(soup)
+
+    # Determine if any other comment pages are present.
+    opt = ''
+    failed = 0
+    total_comments_pages = soup.find('div', class_='browse-coms')  # Total number of comment pages
+    if total_comments_pages is not None:
+        details['comment_pages'] = int(total_comments_pages.strong.string)
+        pages, opt = comment_pages_to_fetch(details['comment_pages'])
+        if pages:
+            start_time = time.time()
+            comments = run(fetch_comment_pages_async(url, pages))
+            fetch_time += time.time() - start_time
+            failed = comments.count(None)
+            details['comments'].extend(page for page in comments if page is not None)
+    return details, opt, fetch_time, failed
 
+
+def load_details(unique_id):
+    """Cached details of torrent 'unique_id' (None if missing/expired, or --no-cache/--refresh)."""
+    content = cache.lookup(DETAILS_KEY % (unique_id))
+    if content is None:
+        return None
+    try:
+        return json.loads(content.decode('utf-8'))
+    except ValueError as e:
+        logger.exception(e)
+        return None
+
+
+def store_details(unique_id, details):
+    """Cache details of torrent 'unique_id' (no-op if --no-cache)."""
+    cache.store(DETAILS_KEY % (unique_id), json.dumps(details).encode('utf-8'), 'tpb_details')
+
+
+class Prefetcher:
+    """
+    Prefetcher class.
+
+    Fetches details (and all comment pages) of torrents in background,
+    on daemon threads, while user reads the results table.
+    At most 'workers' torrents are fetched at a time, and downloads are
+    throttled to 'rate' bytes/sec (0: unlimited) all together.
+    Details are cached (See store_details()) and kept in memory for
+    get_details() (so they are used even with --no-cache/--refresh).
+    A torrent asked for before its prefetch started is dropped from the
+    queue (fetched directly instead); one being fetched is waited for,
+    at most 'wait' seconds.
+
+    methods:
+    -- start():: Start fetching.
+    -- get():: Details of a torrent (waits, if it is being fetched).
+    -- cancel():: Stop fetching; work in flight is dropped.
+    """
+
+    def __init__(self, urls, workers, rate, wait=DEFAULT_PREFETCH_WAIT):
+        """Initialisations."""
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.details = {}
+        # Torrents being/been fetched; torrents dropped from queue (See get()).
+        self.started = set()
+        self.dropped = set()
+        self.wait = wait
+        for url in urls:
+            self.queue.put(url)
+            self.pending[url.split('/')[-1]] = threading.Event()
+        self.workers = max(1, min(workers, len(urls)))
+        self.rate = rate
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.received = 0
+        self.start_time = 0
+
+    def start(self):
+        """Start worker threads."""
+        logger.debug("prefetching details of %d torrents (%d workers ; %d bytes/sec)" % (
+            len(self.pending), self.workers, self.rate))
+        self.start_time = time.time()
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    def throttle(self, size):
+        """Account 'size' bytes received; sleep while over rate."""
+        if not self.rate:
+            return
+        with self.lock:
+            self.received += size
+            delay = self.received / self.rate - (time.time() - self.start_time)
+        if delay > 0:
+            self.cancelled.wait(delay)
+
+    def fetch_page(self, url, params=None):
+        """Fetch page (soup); None if cancelled."""
+        if self.cancelled.is_set():
+            return None
+        raw = get_session().get(url, params=params)
+        self.throttle(len(raw.content))
+        if self.cancelled.is_set():
+            return None
+        return BeautifulSoup(raw.content, "lxml")
+
+    def fetch(self, url):
+        """Fetch details of torrent at 'url' (all comment pages). None if cancelled."""
+        soup = self.fetch_page(url)
+        if soup is None:
+            return None
+        details = parse_details(soup)
+        total_comments_pages = soup.find('div', class_='browse-coms')
+        if total_comments_pages is not None:
+            details['comment_pages'] = int(total_comments_pages.strong.string)
+            for page in range(details['comment_pages'] - 1, 0, -1):
+                soup = self.fetch_page(url, {'page': page})
+                if soup is None:
+                    return None
+                details['comments'].append(parse_comments(soup))
+        return details
+
+    def worker(self):
+        """Fetch queued torrents until queue is empty (or cancelled)."""
+        while not self.cancelled.is_set():
+            try:
+                url = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            unique_id = url.split('/')[-1]
+            with self.lock:
+                if unique_id in self.dropped:
+                    continue
+                self.started.add(unique_id)
+            try:
+                details = load_details(unique_id)
+                if details is None:
+                    details = self.fetch(url)
+                    if details is not None:
+                        store_details(unique_id, details)
+                        logger.debug("prefetched details of torrent %s" % (unique_id))
+                self.details[unique_id] = details
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                self.pending[unique_id].set()
+
+    def get(self, unique_id):
+        """
+        Prefetched details of torrent 'unique_id'.
+
+        None if not prefetched: not queued, not started yet (then it is
+        dropped from queue), or not done within self.wait seconds.
+        """
+        event = self.pending.get(unique_id)
+        if event is None or self.cancelled.is_set():
+            return None
+        with self.lock:
+            if unique_id not in self.started:
+                self.dropped.add(unique_id)
+                logger.debug("prefetch of torrent %s not started; dropped" % (unique_id))
+                return None
+        if not event.is_set():
+            click.echo("Waiting for details being prefetched...")
+            if not event.wait(self.wait):
+                logger.debug("prefetch of torrent %s not done within %d sec" % (unique_id, self.wait))
+                return None
+        return self.details.get(unique_id)
+
+    def cancel(self):
+        """Stop fetching."""
+        if not self.cancelled.is_set():
+            self.cancelled.set()
+            logger.debug("prefetch cancelled (%d of %d done)" % (
+                len(self.details), len(self.pending)))
+
+
+def prefetch(urls):
+    """Start prefetching details of torrents at 'urls' (See Prefetcher)."""
+    global _prefetcher
+    cancel_prefetch()
+    _prefetcher = Prefetcher(urls, get_setting('PREFETCH_WORKERS', DEFAULT_PREFETCH_WORKERS),
+                             get_setting('PREFETCH_RATE', DEFAULT_PREFETCH_RATE) * 1024,
+                             get_setting('PREFETCH_WAIT', DEFAULT_PREFETCH_WAIT))
+    _prefetcher.start()
+
+
+def cancel_prefetch():
+    """Cancel prefetching (if any)."""
+    if _prefetcher is not None:
+        _prefetcher.cancel()
+
+
+class TempStore:
+    """
+    TempStore class.
+
+    HTML files of temp_dir, bounded in total size and age.
+
+    An index (TEMP_INDEX) keeps size and last view of every file, least
+    recently viewed first, so eviction never lists or stats the directory.
+    Files are evicted as new ones are written (See write()): those older
+    than max_age, then least recently viewed ones while over max_size.
+    Index is shared by all torrench processes: on save, it is merged with
+    the index on disk. Files it does not list (e.g. written by a process
+    killed before saving) are added to it on load, at most once every
+    TEMP_SWEEP_INTERVAL, so they are evicted too.
+
+    methods:
+    -- write():: Write a file (and evict others, if needed).
+    -- sweep():: Add files of directory not listed in index.
+    -- evict():: Remove expired / least recently viewed files.
+    -- save():: Write index to disk (merged with index on disk).
+    """
+
+    def __init__(self, directory, max_size, max_age):
+        """Initialisations."""
+        self.directory = directory
+        self.index_file = os.path.join(directory, TEMP_INDEX)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.index = OrderedDict()
+        self.size = 0
+        # Files updated/removed by this process since index was last saved.
+        self.changed = set()
+        self.removed = set()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.load()
+
+    def _read_index(self):
+        """Index on disk; None if missing/corrupt."""
+        try:
+            with open(self.index_file, 'r') as f:
+                return json.load(f)
+        except (ValueError, OSError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.exception(e)
+            return None
+
+    def _set_index(self, entries):
+        """Set index to 'entries' (ordered by access time)."""
+        self.index = OrderedDict(sorted(entries, key=lambda entry: entry[1]['accessed']))
+        self.size = sum(entry['size'] for entry in self.index.values())
+
+    def load(self):
+        """
+        Load index from disk.
+
+        Without (a valid) index, it is built once from the files
+        present (e.g. written by an older version). Otherwise, files it
+        does not list are added if last sweep is older than
+        TEMP_SWEEP_INTERVAL (See sweep()).
+        """
+        index = self._read_index()
+        if index is None:
+            self.index = self.scan()
+            self.size = sum(entry['size'] for entry in self.index.values())
+            self.changed.update(self.index)
+            self.swept()
+        else:
+            self._set_index(index.items())
+            if self.sweep_due():
+                self.sweep()
+                self.swept()
+
+    def sweep_due(self):
+        """True if last sweep is older than TEMP_SWEEP_INTERVAL."""
+        try:
+            last = os.path.getmtime(os.path.join(self.directory, TEMP_SWEEP))
+        except OSError:
+            return True
+        return time.time() - last > TEMP_SWEEP_INTERVAL
+
+    def swept(self):
+        """Record time of sweep."""
+        try:
+            with open(os.path.join(self.directory, TEMP_SWEEP), 'w'):
+                pass
+        except OSError as e:
+            logger.exception(e)
+
+    def scan(self):
+        """Index of files in directory (ordered by access time)."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.html'):
+                stat = entry.stat()
+                entries.append((entry.name, {'size': stat.st_size, 'accessed': stat.st_atime}))
+        logger.debug("indexed %d files of %s" % (len(entries), self.directory))
+        return OrderedDict(sorted(entries, key=lambda entry: entry[1]['accessed']))
+
+    def save(self):
+        """
+        Write index to disk (atomically, through a temp file).
+
+        Index on disk is re-read first and only entries updated/removed
+        by this process are applied to it, so other processes' entries
+        are kept. Merged index becomes the in-memory index.
+        """
+        if not self.changed and not self.removed:
+            return
+        index = self._read_index() or {}
+        for name in self.removed:
+            index.pop(name, None)
+        for name in self.changed:
+            if name in self.index:
+                index[name] = self.index[name]
+        temp_file = self.index_file + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(index, f)
+            os.replace(temp_file, self.index_file)
+        except OSError as e:
+            logger.exception(e)
+            return
+        self._set_index(index.items())
+        self.changed.clear()
+        self.removed.clear()
+
+    def sweep(self):
+        """Add files of directory the index does not list (so they can be evicted)."""
+        unlisted = self.scan()
+        for name in self.index:
+            unlisted.pop(name, None)
+        if not unlisted:
+            return
+        logger.debug("adding %d unlisted files of %s" % (len(unlisted), self.directory))
+        self.changed.update(unlisted)
+        self._set_index(list(self.index.items()) + list(unlisted.items()))
+
+    def write(self, name, text):
+        """Write 'text' to file 'name' (in one call); returns its path."""
+        path = os.path.join(self.directory, name)
+        data = text.encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(data)
+        old = self.index.pop(name, None)
+        if old is not None:
+            self.size -= old['size']
+        self.index[name] = {'size': len(data), 'accessed': time.time()}
+        self.size += len(data)
+        self.changed.add(name)
+        self.evict(keep=name)
+        self.save()
+        return path
+
+    def _remove(self, name):
+        entry = self.index.pop(name)
+        self.size -= entry['size']
+        self.changed.discard(name)
+        self.removed.add(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def evict(self, keep=None):
+        """Remove files older than max_age, then least recently viewed ones while over max_size."""
+        expired = time.time() - self.max_age
+        for name in list(self.index):
+            entry = self.index[name]
+            if name == keep:
+                continue
+            if entry['accessed'] >= expired and self.size <= self.max_size:
+                break
+            logger.debug("evicting temp file %s" % (name))
+            self._remove(name)
+
+
+def get_temp_store():
+    """
+    Return the temp_dir store.
+
+    Store is loaded on first use and reused afterwards.
+    """
+    global _temp_store
+    if _temp_store is None:
+        _temp_store = TempStore(temp_dir,
+                                get_setting('TEMP_SIZE', DEFAULT_TEMP_SIZE) * 1024 * 1024,
+                                get_setting('TEMP_AGE', DEFAULT_TEMP_AGE) * 86400)
+    return _temp_store
+
+
+def render_details(details, url, index):
+    """Render details page (HTML string) of 'details'."""
+    values = []
+    for text, status in details['values']:
+        if status is not None:
+            text = STATUS_VALUE.substitute(status=status, text=text)
+        values.append(INFO_VALUE.substitute(text=text))
+    rows = [COMMENT.substitute(commenter=commenter, comment=comment)
+            for page in details['comments'] for commenter, comment in page]
+    if rows:
+        comments = COMMENTS.substitute(rows="".join(rows), count=len(rows))
+    else:
+        comments = NO_COMMENTS
+    return PAGE.substitute(
+        title="(Index: " + index + ") - " + details['title'],
+        url=url,
+        name=details['name'],
+        info_headers="".join(INFO_HEADER.substitute(text=text) for text in details['headers']),
+        info_values="".join(values),
+        status=STATUS.get(details['status'], ""),
+        magnet=details['magnet'],
+        nfo=details['nfo'],
+        comments=comments)
+
+
+def get_details(url, index):
+    initial_time = time.time()
+    unique_id = url.split('/')[-1]
+    details = None
+    if _prefetcher is not None:
+        details = _prefetcher.get(unique_id)
+    if details is None:
+        details = load_details(unique_id)
+    if details is not None:
+        logger.debug("details of torrent %s from cache" % (unique_id))
+        opt = 'cached'
+        if len(details['comments']) < details['comment_pages']:
+            click.echo("\nComments of %d of %d pages cached (--refresh to fetch again)" % (
+                len(details['comments']), details['comment_pages']))
     else:
-        f.write("<pre class='center'>No comments found!</pre></div>")
-    f.write("</div><br />")
-    # End Comments
+        details, opt, fetch_time, failed = fetch_details(url)
+        if failed:
+            # Not cached, so next view fetches failed pages again.
+            click.echo("\n%d comment page(s) failed (not cached)" % (failed))
+            logger.debug("details of torrent %s not cached (%d pages failed)" % (unique_id, failed))
+        else:
+            store_details(unique_id, details)
 
-    # Magnetic link[2]
-    f.write(end_tags)
-    f.write("<br /><div class='center'><a href=" + magnet + " target='_blank'>[Magnetic Link (Download)]</a></div><br /><br />")
-    f.close()
+    html_file = get_temp_store().write(unique_id + ".html", render_details(details, url, index))
 
     file_url = "file://" + html_file
-    if opt == 'd' or opt == 'D' or opt == '':
-        click.echo("\n[in %.2f sec]" % (initial_end_time))
+    if opt == 'cached':
+        click.echo("\n[from cache in %.2f sec]" % (time.time() - initial_time))
     else:
-        click.echo("\n[in %.2f sec]" % (total_time))
+        click.echo("\n[in %.2f sec]" % (fetch_time))
     return file_url
 
 
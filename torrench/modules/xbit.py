@@ -1,13 +1,30 @@
 """xbit.pw module."""
 
-import requests
+import json
 import logging
 import sys
 import time
 import platform
 from torrench.utilities.config import Config
+from torrench.utilities.engine import run
+from torrench.utilities.extractor import JSONExtractor, Field
+from torrench.utilities.normalize import parse_size, parse_date
+from torrench.utilities.result import TorrentResult, format_size, format_date, index_cell
 import click
 
+# Results of JSON API (See JSONExtractor).
+# Last result of the API is empty; it is skipped (missing fields).
+EXTRACTOR = JSONExtractor(
+    'xbit',
+    rows='dht_results',
+    fields=[
+        Field('id', 'ID'),
+        Field('name', 'NAME'),
+        Field('magnet', 'MAGNET'),
+        Field('size', 'SIZE'),
+        Field('discovered', 'DISCOVERED'),
+    ])
+
 
 class XBit(Config):
     """
@@ -37,13 +54,18 @@ class XBit(Config):
         self.logger = logging.getLogger('log1')
         self.index = 0
         self.total_fetch_time = 0
-        self.mylist = []
-        self.mapper = []
+        self.masterlist = []
         self.data = {}
+        self.OS_WIN = False
         if platform.system() == "Windows":
             self.OS_WIN = True
-        self.output_headers = [
-                'ID', 'NAME', 'INDEX', 'SIZE', 'DISCOVERED']
+        self.columns = [
+            ('ID', lambda r, i: r.extra['id']),
+            ('NAME', lambda r, i: r.name),
+            ('INDEX', index_cell),
+            ('SIZE', lambda r, i: format_size(r.size)),
+            ('DISCOVERED', lambda r, i: format_date(r.date)),
+        ]
 
     def get_data(self):
         """
@@ -51,45 +73,67 @@ class XBit(Config):
 
         At max. 100 torrents can be fetched for given input query.
         """
+        run(self.get_data_async())
+
+    async def get_data_async(self):
+        """Coroutine of get_data()."""
         search = "api?search=%s&limit=100" % (self.title)
         start_time = time.time()
-        raw = requests.get(self.proxy+search).json()
+        raw = await self.call_async(self.get_content, self.proxy+search)
         self.total_fetch_time = time.time() - start_time
-        self.data = raw
+        self.data = json.loads(raw.decode('utf-8'))
+
+    async def search_async(self):
+        """Fetch results (without user interaction)."""
+        await self.get_data_async()
+        return True
 
-    def parse_data(self):
+    def parse_data(self, show=True):
         """
         Parsing JSON.
 
-        Torrent id, name, magnet, size and date are fetched.
+        Torrent id, name, magnet, size and date are fetched (See EXTRACTOR).
+        Results are displayed unless show=False.
         """
         try:
             masterlist = []
-            results = self.data['dht_results']
-            if results == [{}]:
+            results = EXTRACTOR.extract(self.data)
+            if not results:
                 click.echo("\nNo results found for given input!\n")
                 self.logger.debug("No results fetched!")
                 sys.exit(2)
-            for result in results[:-1]:
-                torrent_id = result['ID']
-                torrent_name = result['NAME']
+            for result in results:
+                torrent_name = result['name']
                 # Handling Unicode characters in windows.
                 if self.OS_WIN:
                     torrent_name = torrent_name.encode('ascii', 'replace').decode()
-                magnet = result['MAGNET']
-                torrent_size = result['SIZE']
-                torrent_discovered = result['DISCOVERED']
-                self.index += 1
-                self.mapper.insert(self.index, (torrent_name, magnet, torrent_id))
-                self.mylist = [torrent_id, torrent_name, "--"+str(self.index)+"--", torrent_size, torrent_discovered]
-                masterlist.append(self.mylist)
-            self.show_output(masterlist, self.output_headers)
+                masterlist.append(TorrentResult(
+                    torrent_name, 'XBit', size=parse_size(result['size']),
+                    date=parse_date(result['discovered']), magnet=result['magnet'],
+                    extra={'id': result['id']}))
+            masterlist = self.filter_results(masterlist)
+            if not masterlist:
+                click.echo("\nNo results found for given input!\n")
+                self.logger.debug("No results left after filters!")
+                sys.exit(2)
+            self.index = len(masterlist)
+            self.masterlist = masterlist
+            if show:
+                self.show_results(masterlist, self.columns)
         except Exception as e:
             self.logger.exception(e)
             click.echo("Error message: %s" % (e))
             click.echo("Something went wrong! See logs for details. Exiting!")
             sys.exit(2)
 
+    def results(self):
+        """
+        Results (list of TorrentResult), for meta-search.
+
+        (XBit does not provide seeds/leeches)
+        """
+        return self.masterlist
+
     def after_output_text(self):
         """
         Text to be displayed after results are displayed.
@@ -129,7 +173,8 @@ class XBit(Config):
                     click.echo("\nBad Input!")
                     continue
                 else:
-                    selected_torrent, req_magnetic_link, torrent_id = self.mapper[temp-1]
+                    result = self.masterlist[temp-1]
+                    selected_torrent, req_magnetic_link = result.name, result.magnet
                     click.echo("Selected index [%d] - %s\n" % (temp, click.style(selected_torrent, fg="yellow")))
                     self.logger.debug("selected torrent: %s ; index: %d" % (selected_torrent, temp))
                     temp2 = click.prompt("1. Print magnetic link [p]\n2. Load magnetic link to client [l]\n\nOption [p/l]: ", type=str)
@@ -161,8 +206,9 @@ def main(title):
         click.echo("Fetching results...")
         xb.get_data()
         xb.parse_data()
-        xb.after_output_text()
-        xb.select_torrent()
+        if xb.output_format is None:
+            xb.after_output_text()
+            xb.select_torrent()
     except KeyboardInterrupt:
         xb.logger.debug("Keyboard interupt! Exiting!")
         click.echo("\n\nAborted!")
@@ -1,17 +1,27 @@
 """Common Module - Used by all torrent-fetching modules."""
 import time
 import os
-import sys
+import tempfile
 import platform
 import requests
 from bs4 import BeautifulSoup
-from tabulate import tabulate
+import lxml.html
 import logging
 import subprocess
+import asyncio
 import webbrowser
 import pyperclip
 from configparser import SafeConfigParser
 import click
+import torrench.utilities.cache as cache
+from torrench.utilities.engine import get_engine, run
+from torrench.utilities.filters import get_filter
+from torrench.utilities.output import get_format, write_results
+from torrench.utilities.result import render, format_size
+from torrench.utilities.table import TableWriter
+from torrench.utilities.session import get_session, get_setting, DEFAULT_MAX_WORKERS
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
 
 class Common:
@@ -21,12 +31,18 @@ class Common:
     This class consists common methods that are used by all the modules.
 
     methods:
+    -- get_content():: Returns body of URL (from cache, if fresh).
+    -- get_parsed():: Returns data parsed out of URL (re-used while page is unchanged).
     -- http_request_time():: Returns 'self.soup' as well as time taken to fetch URL.
     -- http_request():: Same as above. Only does not return time taken
     Also, time taken to fetch URL is returned.
+    -- fetch_async():: Coroutine fetching a page on the engine (See engine.py).
+    -- fetch_pages():: Fetch several pages concurrently (bounded by MAX_WORKERS).
     -- download():: To download .torrent file in $HOME/Downloads/torrench dir.
     -- colorify():: To return colored self.output
-    -- show_output():: To display search results self.output (self.output table)
+    -- show_output():: To display search results table (streamed, row by row)
+    -- filter_results():: To filter/sort results (--sort, --min-seeds, ...).
+    -- show_results():: To display results (TorrentResult) in given columns (or --format records).
     -- copy_magnet():: To copy magnetic link to clipboard.
     --load_torrent():: To load torrent magnetic link to client.
     """
@@ -40,15 +56,89 @@ class Common:
         self.torrench_config_file = os.path.join(self.full_config_dir, self.config_file_name)
         self.raw = None
         self.soup = None
-        self.output = None
         self.start_time = 0
         self.page_fetch_time = 0
+        self.session = get_session()
+        # Filters (See filters module); 'pushed' are those the site applied itself.
+        self.filter = get_filter()
+        self.pushed = set()
+        # Site's category labels -> --category values; None: site has no categories.
+        self.categories = None
+        # Machine-readable output (--format); None: tables and interactive selection.
+        self.output_format = get_format()
+        self.max_workers = get_setting('MAX_WORKERS', DEFAULT_MAX_WORKERS)
+        self.cache_site = None
         self.colors = {}
         self.logger = logging.getLogger('log1')
         self.OS_WIN = False
         if platform.system() == "Windows":
             self.OS_WIN = True
 
+    def _get_content(self, url, use_cache=True):
+        """
+        Fetch 'url' (See get_content()).
+
+        Returns (body, unchanged); 'unchanged' is True if body came
+        from cache (fresh entry, or server answered 304 Not Modified).
+        """
+        headers = {}
+        if use_cache:
+            content = cache.lookup(url)
+            if content is not None:
+                self.logger.debug("cache hit for url %s" % (url))
+                return content, True
+            headers = cache.revalidation_headers(url)
+        raw = self.session.get(url, headers=headers)
+        self.logger.debug("returned status code: %d for url %s" % (raw.status_code, url))
+        if raw.status_code == 304 and headers:
+            content = cache.not_modified(url, self.cache_site)
+            if content is not None:
+                self.logger.debug("not modified: %s" % (url))
+                return content, True
+            raw = self.session.get(url)
+        if use_cache and raw.status_code == 200:
+            cache.store(url, raw.content, self.cache_site, raw.headers)
+        return raw.content, False
+
+    def get_content(self, url, use_cache=True):
+        """
+        get_content method.
+
+        Returns body (bytes) of 'url'.
+        If a fresh copy is cached (see cache.py), it is returned
+        without touching network. An expired copy is revalidated
+        (If-None-Match / If-Modified-Since) and re-used if not modified.
+        Otherwise 'url' is fetched through the shared session, and
+        successful responses are cached with the TTL of self.cache_site.
+        Network errors are raised (requests exceptions).
+        """
+        return self._get_content(url, use_cache)[0]
+
+    def get_parsed(self, url, name, parse, tree=False):
+        """
+        get_parsed method.
+
+        Returns parse(soup) of 'url'.
+        While the page is unchanged (fresh in cache, or not modified
+        on revalidation), the result of the previous parse is re-used
+        and the page is not parsed again.
+        Result of 'parse' must be JSON serializable; it is cached as 'name'.
+        'parse' gets an lxml tree if tree=True, else a soup.
+        Network errors are raised (requests exceptions).
+        """
+        content, unchanged = self._get_content(url)
+        if unchanged:
+            data = cache.get_derived(url, name)
+            if data is not None:
+                self.logger.debug("re-using parsed '%s' for url %s" % (name, url))
+                return data
+        if tree:
+            data = parse(lxml.html.fromstring(content))
+        else:
+            data = parse(BeautifulSoup(content, 'lxml'))
+        cache.put_derived(url, name, data)
+        return data
+
     def http_request_time(self, url):
         """
         http_request_time method.
@@ -56,49 +146,155 @@ class Common:
         Used to fetch 'url' page and prepare soup.
         It also gives the time taken to fetch url.
         """
-        try:
-            try:
-                self.start_time = time.time()
-                self.raw = requests.get(url, timeout=15)
-                self.page_fetch_time = time.time() - self.start_time
-                self.logger.debug("returned status code: %d for url %s" % (self.raw.status_code, url))
-            except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout) as e:
-                self.logger.error(e)
-                self.logger.exception("Stacktrace...")
-                return -1
-            except KeyboardInterrupt as e:
-                self.logger.exception(e)
-                click.echo("\nAborted!\n")
-            self.raw = self.raw.content
-            self.soup = BeautifulSoup(self.raw, 'lxml')
-            return self.soup, self.page_fetch_time
-        except KeyboardInterrupt as e:
-            click.echo("Aborted!")
-            self.logger.exception(e)
-            sys.exit(2)
+        self.soup, self.page_fetch_time = run(self.fetch_async(url))
+        if self.soup == -1:
+            return -1
+        return self.soup, self.page_fetch_time
 
-    def http_request(self, url):
+    def http_request(self, url, use_cache=True):
         """
         http_request method.
 
         This method does not calculate time.
         Only fetches URL and prepares self.soup
         """
+        self.soup, _ = run(self.fetch_async(url, use_cache))
+        return self.soup
+
+    def fetch_page(self, url, use_cache=True, tree=False):
+        """
+        fetch_page method.
+
+        Blocking fetch of 'url'. Run on engine threads (See fetch_async()).
+        Does not modify any attribute, so it is thread-safe.
+        Returns (soup, time taken), or (-1, time taken) on error.
+        If tree=True, page is parsed into an lxml tree instead of a soup
+        (for modules with XPath parsers).
+        """
+        start_time = time.time()
         try:
+            raw = self.get_content(url, use_cache)
+        except requests.exceptions.RequestException as e:
+            self.logger.error(e)
+            self.logger.exception("Stacktrace...")
+            return -1, time.time() - start_time
+        if tree:
             try:
-                self.raw = requests.get(url, timeout=15)
-                self.logger.debug("returned status code: %d for url %s" % (self.raw.status_code, url))
-            except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout) as e:
-                self.logger.error(e)
-                self.logger.exception("Stacktrace...")
-                return -1
-            self.raw = self.raw.content
-            self.soup = BeautifulSoup(self.raw, 'lxml')
-            return self.soup
-        except KeyboardInterrupt as e:
-            click.echo("Aborted!")
-            self.logger.exception(e)
-            sys.exit(2)
+                return lxml.html.fromstring(raw), time.time() - start_time
+            except lxml.etree.ParserError as e:
+                # Empty document
+                self.logger.error("%s (url %s)" % (e, url))
+                return -1, time.time() - start_time
+        soup = BeautifulSoup(raw, 'lxml')
+        return soup, time.time() - start_time
+
+    async def call_async(self, func, *args):
+        """
+        Await blocking func(*args) on the engine.
+
+        Raises asyncio.TimeoutError if deadline passes.
+        """
+        return await get_engine().call(func, *args)
+
+    async def fetch_async(self, url, use_cache=True, tree=False):
+        """
+        fetch_async method.
+
+        Coroutine fetching 'url' (See fetch_page()).
+        Returns (soup, time taken), or (-1, time taken) on error
+        or if deadline passes.
+        """
+        start_time = time.time()
+        try:
+            return await self.call_async(self.fetch_page, url, use_cache, tree)
+        except asyncio.TimeoutError:
+            self.logger.error("deadline passed for url %s" % (url))
+            return -1, time.time() - start_time
+
+    async def fetch_pages_async(self, urls, parse=None, tree=False, stop=None):
+        """
+        fetch_pages_async method.
+
+        Fetches all 'urls' concurrently. At most self.max_workers
+        pages are in flight at a time.
+        Time taken by each page is displayed as it arrives.
+
+        If 'parse' is given, each page is parsed (parse(soup), on the
+        engine) as soon as it arrives, and its soup is dropped; only the
+        parsed results are kept. So at most self.max_workers soups are
+        held at a time, however many pages are fetched.
+        If tree=True, pages are lxml trees instead of soups (See fetch_page()).
+
+        If 'stop' is given, stop(index, page) is called for each page in
+        page order (as soon as all previous pages arrived). Once it returns
+        True, later pages are no longer fetched (those in flight are
+        cancelled). See filters.ResultFilter.page_stop() (--top-k).
+
+        Returns (pages, wall-clock time), where pages is a list of
+        (soup or parse(soup), time taken) in the same order as 'urls'
+        (up to the page 'stop' stopped at).
+        Failed pages are (-1, time taken).
+        """
+        pages = [None] * len(urls)
+        start_time = time.time()
+        workers = max(1, min(self.max_workers, len(urls)))
+        limit = asyncio.Semaphore(workers)
+        # Next page to check (stop), and page fetching stopped at.
+        checked = [0]
+        stopped = [len(urls)]
+        self.logger.debug("fetching %d pages (%d workers)" % (len(urls), workers))
+
+        def check():
+            while stopped[0] == len(urls) and checked[0] < len(urls) and pages[checked[0]] is not None:
+                index = checked[0]
+                checked[0] += 1
+                if stop(index, pages[index][0]):
+                    stopped[0] = index
+                    # Only pages still pending are skipped (cancelled).
+                    skipped = 0
+                    for later in range(index+1, len(urls)):
+                        if pages[later] is None and not tasks[later].done():
+                            tasks[later].cancel()
+                            skipped += 1
+                    click.echo("Page %d is the last page needed [%d later page(s) skipped]" % (
+                        index+1, skipped))
+                    self.logger.debug("stopped after page %d/%d (%d pending pages cancelled)" % (
+                        index+1, len(urls), skipped))
+                    return
+
+        async def fetch(index, url):
+            async with limit:
+                soup, page_time = await self.fetch_async(url, tree=tree)
+                if soup != -1 and parse is not None:
+                    soup = await self.call_async(parse, soup)
+                pages[index] = soup, page_time
+            if soup == -1:
+                click.echo("Page %d [failed after %.2f sec]" % (index+1, page_time))
+            elif parse is not None and soup is not None:
+                click.echo("Page %d [%d results in %.2f sec]" % (index+1, len(soup), page_time))
+            else:
+                click.echo("Page %d [in %.2f sec]" % (index+1, page_time))
+            self.logger.debug("page %d/%d fetched in %.2f sec" % (index+1, len(urls), page_time))
+            if stop is not None:
+                check()
+
+        tasks = [asyncio.ensure_future(fetch(index, url)) for index, url in enumerate(urls)]
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # Pages after 'stop' were cancelled; others are awaited (and their errors raised).
+            if stopped[0] == len(urls):
+                raise
+            for task in tasks[:stopped[0]+1]:
+                await task
+        pages = pages[:stopped[0]+1]
+        wall_time = time.time() - start_time
+        self.logger.debug("fetched %d pages in %.2f sec" % (len(pages), wall_time))
+        return pages, wall_time
+
+    def fetch_pages(self, urls, parse=None, tree=False, stop=None):
+        """Synchronous facade of fetch_pages_async()."""
+        return run(self.fetch_pages_async(urls, parse, tree, stop))
 
     def download(self, dload_url, torrent_name):
         """
@@ -106,7 +302,15 @@ class Common:
 
         Used to download .torrent file.
         Torrent is downloaded in ~/Downloads/torrench/
+
+        Body is streamed to a temp file in chunks (DOWNLOAD_CHUNK_SIZE),
+        so memory use stays flat. The temp file is renamed to
+        'torrent_name' only once the download is complete (and matches
+        Content-Length, if sent); otherwise it is removed, so no
+        truncated file is left behind. Parallel downloads never share
+        a temp file.
         """
+        temp_path = None
         try:
             self.logger.debug("Download begins...")
             home = os.path.expanduser(os.path.join('~', 'Downloads'))
@@ -114,30 +318,91 @@ class Common:
             self.logger.debug("Default download directory: %s", (downloads_dir))
             if not os.path.exists(downloads_dir):
                 self.logger.debug("download directory does not exist.")
-                os.makedirs(downloads_dir)
+                os.makedirs(downloads_dir, exist_ok=True)
                 self.logger.debug("created directory: %s", (downloads_dir))
 
-            with open(os.path.join(downloads_dir, torrent_name), "wb") as file:
-                click.echo("Downloading torrent...")
-                response = requests.get(dload_url)
-                file.write(response.content)
-                self.logger.debug("Download complete!")
-                click.echo("Download complete!")
-                click.echo("\nSaved in %s\n" %(downloads_dir))
-                self.logger.debug("Saved in %s", (downloads_dir))
+            start_time = time.time()
+            with self.session.get(dload_url, stream=True) as response:
+                response.raise_for_status()
+                expected = response.headers.get('Content-Length')
+                expected = int(expected) if expected and expected.isdigit() else None
+                fd, temp_path = tempfile.mkstemp(prefix=".%s." % (torrent_name), suffix=".part", dir=downloads_dir)
+                with os.fdopen(fd, "wb") as file:
+                    with click.progressbar(length=expected or 0, label="Downloading torrent") as bar:
+                        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            file.write(chunk)
+                            bar.update(len(chunk))
+                # Bytes over the wire (Content-Length is of the encoded body).
+                received = response.raw.tell()
+            if expected is not None and received != expected:
+                self.logger.debug("Download incomplete: %d of %d bytes" % (received, expected))
+                click.echo("Download incomplete (%s of %s)! Exiting!" % (
+                    format_size(received), format_size(expected)))
+                return
+            path = os.path.join(downloads_dir, torrent_name)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+            temp_path = None
+            self.logger.debug("Download complete! (%d bytes in %.2f sec)" % (
+                os.path.getsize(path), time.time() - start_time))
+            click.echo("Download complete! [%s in %.2f sec]" % (
+                format_size(os.path.getsize(path)), time.time() - start_time))
+            click.echo("\nSaved in %s\n" %(downloads_dir))
+            self.logger.debug("Saved in %s", (downloads_dir))
+        except requests.exceptions.RequestException as e:
+            self.logger.exception(e)
+            click.echo("Download failed: %s" % (e))
         except KeyboardInterrupt as e:
             self.logger.exception(e)
             click.echo("\nAborted!\n")
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
 
     def show_output(self, masterlist, headers):
-        """To display tabular output of torrent search."""
+        """
+        To display tabular output of torrent search.
+
+        Rows (any iterable) are written as they come (See table.TableWriter).
+        """
         try:
-            self.output = tabulate(masterlist, headers=headers, tablefmt="grid")
-            click.echo("\n%s" %(self.output))
+            TableWriter(headers).write(masterlist)
         except KeyboardInterrupt as e:
             self.logger.exception(e)
             click.echo("\nAborted!\n")
 
+    def filter_results(self, results):
+        """
+        To filter and sort results (list of TorrentResult).
+
+        Filters pushed down to the site's query (self.pushed) are skipped.
+        So is --category if the site has no categories (self.categories).
+        """
+        if not self.filter.active():
+            return results
+        if (self.filter.category is not None and 'category' not in self.pushed
+                and self.categories is None and results):
+            click.echo("[%s has no categories: --category ignored]" % (results[0].site))
+            self.logger.debug("--category ignored: %s has no categories" % (results[0].site))
+        filtered = self.filter.apply(results, self.pushed, self.categories)
+        if len(filtered) < len(results):
+            click.echo("[%d of %d results kept (filters)]" % (len(filtered), len(results)))
+        self.logger.debug("filters: %d of %d results kept" % (len(filtered), len(results)))
+        return filtered
+
+    def show_results(self, results, columns):
+        """
+        To display results (list of TorrentResult).
+
+        Results are formatted only here (See result.render()).
+        With --format, records are written instead (See output module).
+        """
+        if self.output_format is not None:
+            write_results(results)
+            return
+        rows, headers = render(results, columns)
+        self.show_output(rows, headers)
+
     def copy_magnet(self, link):
         """Copy magnetic link to clipboard."""
         from torrench.Torrench import Torrench
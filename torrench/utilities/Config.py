@@ -1,8 +1,13 @@
 """ Config module."""
 import os
+import time
+import asyncio
 import logging
+import click
 from configparser import SafeConfigParser
 from .common import Common
+from torrench.utilities.proxy_store import get_proxy_store
+from torrench.utilities.engine import run
 
 
 class Config(Common):
@@ -13,6 +18,12 @@ class Config(Common):
     Also, this class manages TPB/KAT proxies; That is,
     obtains TPB/KAT URL and fetches proxies thorugh those URL.
     Proxies are stored as list and returned.
+    Proxies can be probed concurrently (probe_proxies()),
+    first proxy to pass the module's test is used.
+    Probe results are kept across runs (ProxyStore); a recently
+    verified proxy is used without probing. If it then fails to fetch
+    results, the failure is recorded and proxies are probed again
+    (See fetch_results_async()).
 
     By default, Config files is checked in $XDG_CONFIG_HOME/torrench/ and
     fallback to $HOME/.config/torrench/ directory (linux)
@@ -32,6 +43,8 @@ class Config(Common):
         self.url = None
         self.name = None
         self.urllist = []
+        self.proxy_site = None
+        self.proxy_store = get_proxy_store()
         self.logger = logging.getLogger('log1')
         self._is_verbose = False
 
@@ -59,6 +72,8 @@ class Config(Common):
             'nyaa': 'NYAA_URL'
         }
         self.logger.debug("getting proxies for '%s'" % (name))
+        self.proxy_site = name
+        self.cache_site = name
         temp = []
         self.config.read(self.config_file)
 
@@ -67,11 +82,126 @@ class Config(Common):
         self.url = self.config.get('Torrench-Config', key_name)
         self.urllist = self.url.split()
         if key_name == 'TPB_URL':
-            soup = self.http_request(self.urllist[-1])
-            link = soup.find_all('td', class_='site')
+            temp = self.proxy_store.get_list(name)
+            if temp is not None:
+                self.logger.debug("using cached proxy list")
+            else:
+                temp = self.get_parsed(self.urllist[-1], 'proxies', self.parse_proxy_list)
+                if temp:
+                    self.proxy_store.set_list(name, temp)
+                    self.proxy_store.save()
+                else:
+                    # Proxy-list page blocked/changed; try again next run.
+                    self.logger.debug("no proxies found on proxy-list page (not cached)")
             del self.urllist[-1]
-            for i in link:
-                temp.append(i.a["href"])
             self.urllist.extend(temp)
+        self.urllist = self.proxy_store.rank(name, self.urllist)
         self.logger.debug("got %d proxies!" % (len(self.urllist)))
         return self.urllist
+
+    def parse_proxy_list(self, soup):
+        """Parse TPB proxy-list page. Returns list of proxies."""
+        temp = []
+        link = soup.find_all('td', class_='site')
+        for i in link:
+            temp.append(i.a["href"])
+        return temp
+
+    async def probe_proxies_async(self, proxies, test):
+        """
+        Probe proxies concurrently.
+
+        'test' is a (blocking) callable taking a proxy and returning True
+        if the proxy is usable. It is run for every proxy at once on the
+        engine; first proxy to pass is returned immediately and remaining
+        probes are cancelled.
+        Returns None if no proxy passed.
+
+        If a proxy was verified recently (see ProxyStore), it is
+        returned straight away without probing.
+        Probe results are recorded in the store.
+        """
+        if self.proxy_site is not None:
+            proxy = self.proxy_store.fresh_proxy(self.proxy_site, proxies)
+            if proxy is not None:
+                click.echo("Using %s [verified recently]" % (click.style(proxy, fg="yellow")))
+                self.logger.debug("using recently verified proxy %s" % (proxy))
+                return proxy
+
+        async def probe(proxy):
+            start_time = time.time()
+            try:
+                passed = await self.call_async(test, proxy)
+            except asyncio.TimeoutError:
+                self.logger.debug("deadline passed for proxy %s" % (proxy))
+                passed = False
+            except Exception as e:
+                self.logger.exception(e)
+                passed = False
+            return proxy, passed, time.time() - start_time
+
+        self.logger.debug("probing %d proxies" % (len(proxies)))
+        click.echo("Probing %d proxies..." % (len(proxies)))
+        pending = [asyncio.ensure_future(probe(proxy)) for proxy in proxies]
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    proxy, passed, elapsed = task.result()
+                    if passed:
+                        click.echo("Using %s [in %.2f sec]" % (click.style(proxy, fg="yellow"), elapsed))
+                        self.logger.debug("proxy %s passed in %.2f sec" % (proxy, elapsed))
+                        if self.proxy_site is not None:
+                            self.proxy_store.record_success(self.proxy_site, proxy, elapsed)
+                        return proxy
+                    click.echo("Bad proxy: %s" % (proxy))
+                    self.logger.debug("proxy %s failed in %.2f sec" % (proxy, elapsed))
+                    if self.proxy_site is not None:
+                        self.proxy_store.record_failure(self.proxy_site, proxy)
+            self.logger.debug("Proxy list finished! No proxy passed.")
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            if self.proxy_site is not None:
+                self.proxy_store.save()
+
+    def probe_proxies(self, proxies, test):
+        """Synchronous facade of probe_proxies_async()."""
+        return run(self.probe_proxies_async(proxies, test))
+
+    def proxy_failed(self, proxy):
+        """
+        'proxy' failed to fetch results (though it passed a probe).
+
+        Failure is recorded in the store, so the proxy is no longer used
+        without probing (neither by this run nor the next ones), and
+        it is dropped from the proxies of this run.
+        """
+        click.echo("Proxy %s failed to fetch results. Probing proxies again..." % (proxy))
+        self.logger.debug("proxy %s failed to fetch results" % (proxy))
+        if self.proxy_site is not None:
+            self.proxy_store.record_failure(self.proxy_site, proxy)
+            self.proxy_store.save()
+        if proxy in self.urllist:
+            self.urllist.remove(proxy)
+
+    async def fetch_results_async(self, searches, parse, stop=None):
+        """
+        Fetch result pages 'searches' (paths) through self.proxy.
+
+        Pages are fetched and parsed as they arrive (See
+        Common.fetch_pages_async(); pages are lxml trees).
+        If every page fails, the proxy is given up (See proxy_failed())
+        and proxies are probed again (module's check_proxy_async());
+        pages are then fetched once more through the new proxy.
+        Returns (pages, wall-clock time).
+        """
+        pages, fetch_time = await self.fetch_pages_async(
+            [self.proxy + search for search in searches], parse, tree=True, stop=stop)
+        if pages and all(results == -1 for results, _ in pages):
+            self.proxy_failed(self.proxy)
+            if await self.check_proxy_async() is not None:
+                pages, fetch_time = await self.fetch_pages_async(
+                    [self.proxy + search for search in searches], parse, tree=True, stop=stop)
+        return pages, fetch_time
@@ -0,0 +1,160 @@
+"""
+Batch Module.
+
+Runs many queries (--batch FILE, or '-' for stdin; one title per line)
+through one process, non-interactively.
+
+Each query is a meta-search of the selected sites (See metasearch
+module); its results are written as records (--format, default: ndjson),
+each carrying the 'query' it answers, as soon as the query completes.
+
+Everything set up once is re-used by all queries: the HTTP pool
+(session), the page cache, the proxy store and normalizer caches.
+The first query of a site finds its proxy; other queries of that
+site wait for it, then re-use the verified proxy without probing.
+
+Concurrency:
+    - BATCH_CONCURRENCY (torrench.ini, default: 8):: Queries in flight.
+    - BATCH_SITE_CONCURRENCY (torrench.ini, default: 4):: Searches in
+      flight per site, so no site gets more than that many at once.
+"""
+import sys
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+import click
+import torrench.utilities.output as output
+from torrench.utilities.config import Config
+from torrench.utilities.engine import run
+from torrench.utilities.metasearch import MetaSearch
+from torrench.utilities.session import get_setting
+
+DEFAULT_BATCH_CONCURRENCY = 8
+DEFAULT_BATCH_SITE_CONCURRENCY = 4
+
+
+class SiteLimits:
+    """
+    SiteLimits class.
+
+    Per-site limits shared by all queries of a batch.
+
+    methods:
+    -- slot():: Async context of a site's search (See below).
+    """
+
+    def __init__(self, concurrency):
+        """Initialisations."""
+        self.semaphores = defaultdict(lambda: asyncio.Semaphore(concurrency))
+        self.locks = defaultdict(asyncio.Lock)
+        self.ready = set()
+
+    @asynccontextmanager
+    async def slot(self, label):
+        """
+        Search slot of site 'label'.
+
+        At most 'concurrency' searches of a site run at once.
+        Until first search of a site is done (and its proxy verified),
+        other searches of the site wait for it.
+        """
+        async with self.semaphores[label]:
+            if label not in self.ready:
+                async with self.locks[label]:
+                    if label not in self.ready:
+                        try:
+                            yield
+                        finally:
+                            self.ready.add(label)
+                        return
+            yield
+
+
+class BatchSearch(Config):
+    """
+    BatchSearch class.
+
+    methods:
+    -- search_async():: Search all titles, writing records as queries complete.
+
+    self.failed counts failed searches: queries that failed, and
+    sites that failed or were skipped (deadline) within a query.
+    """
+
+    def __init__(self, titles, page_limit, only=None):
+        """Initialisations."""
+        Config.__init__(self)
+        self.titles = titles
+        self.pages = page_limit
+        self.only = only
+        self.logger = logging.getLogger('log1')
+        self.concurrency = get_setting('BATCH_CONCURRENCY', DEFAULT_BATCH_CONCURRENCY)
+        self.limits = SiteLimits(get_setting('BATCH_SITE_CONCURRENCY', DEFAULT_BATCH_SITE_CONCURRENCY))
+        self.writer = output.get_writer(query=True)
+        self.queries = 0
+        self.records = 0
+        self.failed = 0
+
+    async def search_title(self, title):
+        """Search one title; write its records."""
+        meta = MetaSearch(title, self.pages, self.only, self.limits)
+        try:
+            await meta.search_async()
+        except Exception as e:
+            self.logger.exception(e)
+            click.echo("[%s] failed: %s" % (title, e))
+            self.failed += 1
+            return
+        self.records += self.writer.write(meta.masterlist, query=title)
+        self.queries += 1
+        self.failed += len(meta.failed)
+        if meta.failed:
+            click.echo("[%s] %d results (failed/skipped: %s)" % (
+                title, len(meta.masterlist), ", ".join(meta.failed)))
+        else:
+            click.echo("[%s] %d results" % (title, len(meta.masterlist)))
+
+    async def search_async(self):
+        """Search all titles (at most self.concurrency at a time)."""
+        titles = iter(self.titles)
+
+        async def worker():
+            for title in titles:
+                await self.search_title(title)
+
+        workers = max(1, min(self.concurrency, len(self.titles)))
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        self.writer.close()
+
+
+def read_titles(source):
+    """Titles out of file object (one per line; blank lines are skipped)."""
+    titles = []
+    for line in source:
+        title = line.strip().replace("'", "")
+        if title:
+            titles.append(title)
+    return titles
+
+
+def main(source, page_limit, only=None):
+    """Execution begins here."""
+    batch = None
+    try:
+        titles = read_titles(source)
+        if not titles:
+            click.echo("No titles given! Exiting!")
+            sys.exit(2)
+        click.echo("[Batch] %d queries" % (len(titles)))
+        start_time = time.time()
+        batch = BatchSearch(titles, page_limit, only)
+        run(batch.search_async())
+        click.echo("[Batch] %d queries, %d records, %d failed searches [in %.2f sec]" % (
+            batch.queries, batch.records, batch.failed, time.time() - start_time))
+    except BrokenPipeError:
+        output.closed_pipe()
+    except KeyboardInterrupt:
+        logging.getLogger('log1').debug("Keyboard interupt! Exiting!")
+        click.echo("\n\nAborted!")
@@ -0,0 +1,482 @@
+"""
+Cache Module.
+
+On-disk cache for fetched pages, so repeating a search
+(or re-reading the DistroWatch torrent page) is served from
+disk instead of the network.
+
+- Entries are keyed by normalized URL.
+- Every site has its own TTL (SITE_TTL). Expired entries are not used.
+- Total size is bounded by CACHE_SIZE (torrench.ini, in MB, default: 50).
+  Least recently used entries are evicted first. Files no index entry
+  lists (e.g. left by a killed process) are removed on load, at most
+  once every ORPHAN_SWEEP_INTERVAL.
+- Index is kept in memory and saved in batches (every SAVE_BATCH
+  changes or SAVE_INTERVAL sec) and at exit, merged with the index on
+  disk, so several torrench processes can share the cache.
+- Cache can be bypassed (--no-cache) or refreshed (--refresh).
+- Expired entries are revalidated (If-None-Match / If-Modified-Since)
+  instead of being downloaded again. If the server answers
+  304 (Not Modified), cached body is reused; so is anything parsed out
+  of it earlier (see put_derived()), which saves re-parsing the page.
+
+Cache is stored in the torrench data directory
+($XDG_DATA_HOME/torrench/cache, fallback: $HOME/.local/share/torrench/cache).
+"""
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from torrench.utilities.logger import log_directory
+from torrench.utilities.session import get_setting
+
+CACHE_DIR = os.path.join(log_directory, 'cache')
+INDEX_FILE = 'index.json'
+# Files not in index are only removed once older than this (sec), so a
+# body just written by another process is not removed before its index
+# entry is saved.
+ORPHAN_GRACE = 300
+ORPHAN_SWEEP_INTERVAL = 3600
+SWEEP_FILE = '.swept'
+# Index is saved once this many entries changed, or this many sec passed.
+SAVE_BATCH = 32
+SAVE_INTERVAL = 60
+DEFAULT_CACHE_SIZE = 50  # MB
+DEFAULT_TTL = 900
+SITE_TTL = {
+    'tpb': 900,
+    'kat': 900,
+    'sky': 900,
+    'nyaa': 900,
+    'xbit': 900,
+    'linuxtracker': 3600,
+    'distrowatch': 6 * 3600,
+    # Parsed TPB torrent details (See tpb_details module), by torrent id.
+    'tpb_details': 3600,
+}
+
+logger = logging.getLogger('log1')
+_lock = threading.Lock()
+_cache = None
+# Set through configure() (--no-cache / --refresh)
+_enabled = True
+_refresh = False
+
+
+def normalize_url(url):
+    """
+    Normalize URL to be used as cache key.
+
+    Scheme and host are lower-cased, default ports and
+    fragment are dropped and query parameters are sorted.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc[-3:]) == ('http', ':80') or (scheme, netloc[-4:]) == ('https', ':443'):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    path = parts.path or '/'
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def ttl_for(site):
+    """TTL (sec) for pages of 'site'."""
+    return SITE_TTL.get(site, DEFAULT_TTL)
+
+
+class ResponseCache:
+    """
+    ResponseCache class.
+
+    methods:
+    -- get():: Return cached body of URL (None if missing/expired).
+    -- get_stale():: Return cached body and entry of URL, even if expired.
+    -- touch():: Mark an expired entry fresh again (after a 304 response).
+    -- put():: Store body of URL.
+    -- get_derived() / put_derived():: Data parsed out of a cached body.
+    -- evict():: Remove least recently used entries until cache fits its budget.
+    -- remove_orphans():: Remove files no index entry lists.
+    -- save():: Write index to disk (merged with index on disk).
+    -- save_batch():: save(), once enough changes are pending (See SAVE_BATCH).
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        """Initialisations."""
+        self.directory = directory
+        self.index_file = os.path.join(directory, INDEX_FILE)
+        self.max_size = get_setting('CACHE_SIZE', DEFAULT_CACHE_SIZE) * 1024 * 1024
+        self.lock = threading.Lock()
+        self.index = {}
+        self.size = 0
+        # Keys updated/removed by this process since index was last saved.
+        self.changed = set()
+        self.removed = set()
+        self.saved = time.time()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.load()
+
+    def _read_index(self):
+        """Index on disk. A missing/corrupt index gives an empty index."""
+        try:
+            with open(self.index_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as e:
+            logger.exception(e)
+            return {}
+
+    def load(self):
+        """
+        Load index from disk.
+
+        Orphan files are removed if last sweep is older than
+        ORPHAN_SWEEP_INTERVAL (See remove_orphans()).
+        """
+        self.index = self._read_index()
+        self.size = sum(entry['size'] for entry in self.index.values())
+        sweep_file = os.path.join(self.directory, SWEEP_FILE)
+        try:
+            due = time.time() - os.path.getmtime(sweep_file) > ORPHAN_SWEEP_INTERVAL
+        except OSError:
+            due = True
+        if due:
+            self.remove_orphans()
+            try:
+                with open(sweep_file, 'w'):
+                    pass
+            except OSError as e:
+                logger.exception(e)
+
+    def save(self):
+        """
+        Write index to disk (atomically, through a temp file).
+
+        Index on disk is re-read first and only entries updated/removed
+        by this process are applied to it, so other processes' entries
+        are kept. Merged index becomes the in-memory index.
+        """
+        with self.lock:
+            if not self.changed and not self.removed:
+                return
+            index = self._read_index()
+            for key in self.removed:
+                index.pop(key, None)
+            for key in self.changed:
+                if key in self.index:
+                    index[key] = self.index[key]
+            temp_file = self.index_file + '.%d.%d.tmp' % (os.getpid(), threading.get_ident())
+            try:
+                with open(temp_file, 'w') as f:
+                    json.dump(index, f)
+                os.replace(temp_file, self.index_file)
+            except OSError as e:
+                logger.exception(e)
+                return
+            self.index = index
+            self.size = sum(entry['size'] for entry in index.values())
+            self.changed.clear()
+            self.removed.clear()
+            self.saved = time.time()
+
+    def save_batch(self):
+        """save(), if SAVE_BATCH changes are pending or last save is SAVE_INTERVAL old."""
+        with self.lock:
+            pending = len(self.changed) + len(self.removed)
+            due = pending >= SAVE_BATCH or (pending and time.time() - self.saved >= SAVE_INTERVAL)
+        if due:
+            self.save()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.bin')
+
+    @staticmethod
+    def key(url):
+        """Cache key of 'url'."""
+        return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """Return cached body of 'url', or None if missing/expired."""
+        key = self.key(url)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None or entry['expires'] < time.time():
+                return None
+            entry['accessed'] = time.time()
+            self.changed.add(key)
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError as e:
+            logger.exception(e)
+            self._remove(key)
+            return None
+
+    def get_stale(self, url):
+        """Return (body, entry) of 'url', even if expired. (None, None) if missing."""
+        key = self.key(url)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None, None
+            entry = dict(entry)
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read(), entry
+        except OSError as e:
+            logger.exception(e)
+            self._remove(key)
+            return None, None
+
+    def touch(self, url, ttl):
+        """Extend expiry of 'url' by 'ttl' seconds (page was not modified)."""
+        key = self.key(url)
+        now = time.time()
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is not None:
+                entry['expires'] = now + ttl
+                entry['accessed'] = now
+                self.changed.add(key)
+        self.save_batch()
+
+    def _derived_path(self, key, name):
+        return os.path.join(self.directory, '%s.%s.json' % (key, name))
+
+    def get_derived(self, url, name):
+        """Return data 'name' derived from cached body of 'url' (None if missing)."""
+        key = self.key(url)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None or name not in entry.get('derived', []):
+                return None
+        try:
+            with open(self._derived_path(key, name), 'r') as f:
+                return json.load(f)
+        except (ValueError, OSError) as e:
+            logger.exception(e)
+            return None
+
+    def put_derived(self, url, name, data):
+        """
+        Store data 'name' derived from cached body of 'url'.
+
+        'data' must be JSON serializable. It is dropped along with the
+        entry, or when a new body is stored for 'url'.
+        """
+        key = self.key(url)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return
+        try:
+            with open(self._derived_path(key, name), 'w') as f:
+                json.dump(data, f)
+        except OSError as e:
+            logger.exception(e)
+            return
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is not None and name not in entry.setdefault('derived', []):
+                entry['derived'].append(name)
+                self.changed.add(key)
+        self.save_batch()
+
+    def _remove_derived(self, key, names):
+        for name in names:
+            try:
+                os.remove(self._derived_path(key, name))
+            except OSError:
+                pass
+
+    def put(self, url, content, ttl, headers=None):
+        """
+        Store 'content' (bytes) of 'url' for 'ttl' seconds.
+
+        ETag / Last-Modified are picked from response 'headers' (if given)
+        for later revalidation.
+        """
+        headers = headers or {}
+        key = self.key(url)
+        temp_file = self._path(key) + '.%d.tmp' % (threading.get_ident())
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(content)
+            os.replace(temp_file, self._path(key))
+        except OSError as e:
+            logger.exception(e)
+            return
+        now = time.time()
+        with self.lock:
+            old = self.index.get(key)
+            if old is not None:
+                self.size -= old['size']
+            self.index[key] = {
+                'url': url,
+                'size': len(content),
+                'expires': now + ttl,
+                'accessed': now,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'derived': [],
+            }
+            self.size += len(content)
+            self.changed.add(key)
+        if old is not None:
+            self._remove_derived(key, old.get('derived', []))
+        self.evict()
+        self.save_batch()
+
+    def _remove(self, key):
+        with self.lock:
+            entry = self.index.pop(key, None)
+            if entry is None:
+                return
+            self.size -= entry['size']
+            self.changed.discard(key)
+            self.removed.add(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+        self._remove_derived(key, entry.get('derived', []))
+
+    def remove_orphans(self):
+        """
+        Remove files no index entry lists.
+
+        Such files are left when an index entry is dropped (e.g. by
+        another process) or never saved (process killed).
+        Files newer than ORPHAN_GRACE are kept (See ORPHAN_GRACE).
+        Lists and stats the whole directory: only run on load (See load()).
+        """
+        now = time.time()
+        with self.lock:
+            keys = set(self.index)
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            logger.exception(e)
+            return
+        for name in names:
+            if name == INDEX_FILE or name.startswith('.') or name.split('.', 1)[0] in keys:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > ORPHAN_GRACE:
+                    logger.debug("removing orphan cache file %s" % (name))
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Remove least recently used entries until cache fits in max_size (index only)."""
+        if self.size <= self.max_size:
+            return
+        with self.lock:
+            by_age = sorted(self.index, key=lambda k: self.index[k]['accessed'])
+        for key in by_age:
+            if self.size <= self.max_size:
+                break
+            logger.debug("evicting cache entry %s" % (key))
+            self._remove(key)
+
+
+def configure(enabled=True, refresh=False):
+    """
+    Set cache behaviour.
+
+    enabled=False:: Cache is neither read nor written (--no-cache).
+    refresh=True:: Cache is not read (nor revalidated), but fresh responses
+                   are stored (--refresh).
+    """
+    global _enabled, _refresh
+    _enabled = enabled
+    _refresh = refresh
+
+
+def get_cache():
+    """
+    Return the shared cache.
+
+    Returns None if cache is disabled.
+    """
+    global _cache
+    if not _enabled:
+        return None
+    with _lock:
+        if _cache is None:
+            _cache = ResponseCache()
+            atexit.register(_cache.save)
+        return _cache
+
+
+def lookup(url):
+    """Return cached body of 'url', or None (also if --no-cache/--refresh)."""
+    cache = get_cache()
+    if cache is None or _refresh:
+        return None
+    return cache.get(url)
+
+
+def revalidation_headers(url):
+    """
+    Return conditional request headers for 'url'.
+
+    Headers (If-None-Match / If-Modified-Since) are built from the
+    validators of the cached (possibly expired) entry.
+    Empty if there is nothing to revalidate (or --no-cache / --refresh:
+    a forced refresh always downloads and re-parses the page).
+    """
+    cache = get_cache()
+    if cache is None or _refresh:
+        return {}
+    content, entry = cache.get_stale(url)
+    if content is None:
+        return {}
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def not_modified(url, site=None):
+    """
+    Server answered 304 for 'url'.
+
+    Entry is marked fresh again (TTL of 'site') and its body returned.
+    """
+    cache = get_cache()
+    content, _ = cache.get_stale(url)
+    cache.touch(url, ttl_for(site))
+    return content
+
+
+def store(url, content, site=None, headers=None):
+    """Store body of 'url' with TTL of 'site' (no-op if --no-cache)."""
+    cache = get_cache()
+    if cache is not None:
+        cache.put(url, content, ttl_for(site), headers)
+
+
+def get_derived(url, name):
+    """Return data 'name' derived from cached body of 'url' (None if missing, or --refresh)."""
+    cache = get_cache()
+    if cache is None or _refresh:
+        return None
+    return cache.get_derived(url, name)
+
+
+def put_derived(url, name, data):
+    """Store data 'name' derived from cached body of 'url' (no-op if --no-cache)."""
+    cache = get_cache()
+    if cache is not None:
+        cache.put_derived(url, name, data)
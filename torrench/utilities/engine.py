@@ -0,0 +1,127 @@
+"""
+Engine Module.
+
+asyncio engine that all modules run their network work on.
+
+- Blocking work (requests, parsing) runs on daemon threads and is
+  awaited as a coroutine (call()), so many fetches (pages, proxies,
+  even several sites) can be in flight from one process.
+- Every call has a deadline (DEADLINE in torrench.ini, default: 30 sec).
+- run() is the synchronous facade used by the (synchronous) module
+  code. On Ctrl-C all pending work is cancelled and KeyboardInterrupt
+  is raised to the caller (module's main()).
+"""
+import asyncio
+import logging
+import threading
+from torrench.utilities.session import get_setting
+
+DEFAULT_DEADLINE = 30.0
+
+logger = logging.getLogger('log1')
+_lock = threading.Lock()
+_engine = None
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, exception):
+    if not future.done():
+        future.set_exception(exception)
+
+
+class Engine:
+    """
+    Engine class.
+
+    methods:
+    -- run():: Run a coroutine to completion (synchronous facade).
+    -- call():: Await a blocking function (run on a daemon thread) with a deadline.
+    -- cancel():: Cancel all pending tasks.
+    """
+
+    def __init__(self, deadline=DEFAULT_DEADLINE):
+        """Initialisations."""
+        self.loop = asyncio.new_event_loop()
+        self.deadline = deadline
+
+    def _in_thread(self, func, *args):
+        """
+        Run func(*args) on a daemon thread.
+
+        Returns a future of the loop. If the future is cancelled (or its
+        deadline passes), the thread finishes in background and its result
+        is dropped. Being a daemon thread, it never delays exit.
+        """
+        future = self.loop.create_future()
+
+        def worker():
+            try:
+                result = func(*args)
+            except BaseException as e:
+                callback = (_set_exception, future, e)
+            else:
+                callback = (_set_result, future, result)
+            try:
+                self.loop.call_soon_threadsafe(*callback)
+            except RuntimeError:
+                # Loop closed; nobody is waiting for this result.
+                pass
+
+        threading.Thread(target=worker, daemon=True).start()
+        return future
+
+    async def call(self, func, *args, deadline=None):
+        """
+        Await func(*args).
+
+        Raises asyncio.TimeoutError if it does not finish within
+        'deadline' seconds (default: self.deadline).
+        """
+        if deadline is None:
+            deadline = self.deadline
+        return await asyncio.wait_for(self._in_thread(func, *args), deadline)
+
+    def run(self, coro):
+        """
+        Run coroutine 'coro' and return its result.
+
+        On Ctrl-C, everything pending is cancelled and
+        KeyboardInterrupt is raised.
+        """
+        task = self.loop.create_task(coro)
+        try:
+            return self.loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            logger.debug("Keyboard interrupt! Cancelling pending tasks.")
+            self.cancel()
+            raise
+
+    def cancel(self):
+        """Cancel all pending tasks (and wait for them to acknowledge)."""
+        tasks = [t for t in asyncio.all_tasks(self.loop) if not t.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+
+def get_engine():
+    """
+    Return the shared engine.
+
+    Engine is created on first use and reused afterwards.
+    """
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = Engine(get_setting('DEADLINE', DEFAULT_DEADLINE))
+        return _engine
+
+
+def run(coro):
+    """Run coroutine 'coro' on the shared engine (See Engine.run())."""
+    return get_engine().run(coro)
@@ -0,0 +1,171 @@
+"""
+Extractor Module.
+
+Declarative extraction of search results.
+
+Each site module declares its results table once, at import:
+    - rows:: XPath selecting result rows.
+    - fields:: Field(name, xpath, convert) relative to a row.
+    - table:: (optional) XPath that must match for page to have results.
+XPath expressions are compiled when the spec is declared, and every
+site is run by the same loop (Extractor.extract()), so that single
+hot loop is what gets optimized and benchmarked (See benchmarks/).
+Fields sharing an XPath (e.g. several values out of one cell)
+evaluate it once per row.
+
+Field values:
+    The XPath result (always a list) is passed to 'convert'.
+    Default converter is first() (first match, None if no match);
+    for JSON APIs (JSONExtractor) it is the value itself.
+    A required field that converts to None, or a converter that
+    fails, skips the row (it is logged, never fatal).
+
+Registered extractors: get_extractor(site).
+"""
+import logging
+from lxml import etree
+
+logger = logging.getLogger('log1')
+EXTRACTORS = {}
+
+# Errors of converters on unexpected markup; the row is skipped.
+ROW_ERRORS = (IndexError, KeyError, ValueError, AttributeError, TypeError)
+
+
+def has_class(name):
+    """XPath predicate: element has class 'name' (same as BeautifulSoup's class_=)."""
+    return 'contains(concat(" ", normalize-space(@class), " "), " %s ")' % (name)
+
+
+def first(values):
+    """First match (None if none)."""
+    return values[0] if values else None
+
+
+def text(values):
+    """Stripped text content of first matched element (None if none)."""
+    return values[0].text_content().strip() if values else None
+
+
+def strip(values):
+    """First match, stripped (None if none)."""
+    return values[0].strip() if values else None
+
+
+def all_of(values):
+    """All matches (list)."""
+    return values
+
+
+class Field:
+    """
+    Field class.
+
+    A field of a result row: name, XPath (relative to row)
+    and converter (See module docstring).
+    """
+
+    def __init__(self, name, path, convert=None, required=True):
+        """Initialisations."""
+        self.name = name
+        self.path = path
+        self.convert = convert
+        self.required = required
+
+
+class Extractor:
+    """
+    Extractor class.
+
+    Compiled extractor of a site's results.
+
+    methods:
+    -- extract():: Return list of records (dicts) of a page (lxml tree).
+    """
+
+    default_convert = staticmethod(first)
+
+    def __init__(self, site, rows, fields, table=None):
+        """Initialisations (XPath expressions are compiled here)."""
+        self.site = site
+        self.rows = self.compile(rows, strings=False)
+        self.table = self.compile(table, strings=False) if table is not None else None
+        paths = []
+        self.fields = []
+        for f in fields:
+            if f.path not in paths:
+                paths.append(f.path)
+            self.fields.append((f.name, paths.index(f.path), f.convert or self.default_convert, f.required))
+        self.paths = [self.compile(path) for path in paths]
+        EXTRACTORS[site] = self
+
+    def compile(self, path, strings=True):
+        """Compile XPath 'path'. String results are plain str (they do not keep tree alive)."""
+        return etree.XPath(path, smart_strings=False) if strings else etree.XPath(path)
+
+    def select(self, page):
+        """Return result rows of 'page'."""
+        return self.rows(page)
+
+    def field(self, row, path):
+        """Evaluate field 'path' on 'row'."""
+        return path(row)
+
+    def extract(self, page):
+        """
+        Return records of 'page', one dict per row.
+
+        Returns None if page has no results table ('table' spec).
+        Rows with a missing required field are skipped.
+        """
+        if self.table is not None and not self.table(page):
+            return None
+        records = []
+        skipped = 0
+        field = self.field
+        for row in self.select(page):
+            record = {}
+            try:
+                values = [field(row, path) for path in self.paths]
+                for name, path, convert, required in self.fields:
+                    value = convert(values[path])
+                    if value is None and required:
+                        raise ValueError("missing field '%s'" % (name))
+                    record[name] = value
+            except ROW_ERRORS as e:
+                skipped += 1
+                logger.debug("[%s] skipped row: %s" % (self.site, e))
+                continue
+            records.append(record)
+        if skipped:
+            logger.debug("[%s] %d rows extracted, %d skipped" % (self.site, len(records), skipped))
+        return records
+
+
+class JSONExtractor(Extractor):
+    """
+    JSONExtractor class.
+
+    Same as Extractor, for JSON APIs: 'rows' is the key of the
+    results list, field paths are keys of a result. Converters get
+    the value (None if key is missing).
+    """
+
+    default_convert = staticmethod(lambda value: value)
+
+    def compile(self, path, strings=True):
+        """Keys are used as they are."""
+        return path
+
+    def select(self, page):
+        """Return results list of 'page' (decoded JSON)."""
+        return page.get(self.rows) or []
+
+    def field(self, row, path):
+        """Value of key 'path' of 'row'."""
+        return row.get(path)
+
+
+def get_extractor(site):
+    """Return registered extractor of 'site' (KeyError if none)."""
+    return EXTRACTORS[site]
@@ -0,0 +1,252 @@
+"""
+Filters Module.
+
+Sorting and filtering of results (--sort, --min-seeds, --max-size,
+--category, --regex), for every site.
+
+Filters are set once from command line (See configure()), and
+read by modules through get_filter(). A site that can filter/sort
+itself gets the filter pushed down into its query URL (e.g. TPB's
+order and category codes, Nyaa's s=/o=/c= parameters); the rest is
+applied locally on parsed results (See ResultFilter.apply()).
+
+Categories (--category) are the common values of CATEGORIES. Each site
+maps its own category labels to them (its 'categories', e.g. KAT's
+'Movies' and 'TV' are 'video'); other values are matched as a part of
+the site's label (e.g. 'movies' matches TPB's 'Video > Movies').
+A site without category data (categories=None) is not filtered by
+category (See Common.filter_results()).
+
+Values are compared as numbers (See normalize module).
+A result whose value is unknown (e.g. no seeds on DistroWatch)
+does not pass a filter on that value; when sorting, it comes last.
+
+Top-K (--top-k N):
+    Only the N best results (by --sort, default: seeds) are kept,
+    in a bounded heap (See TopK). If the site sorts by the same key
+    (pushed down), pages arrive best-first, so fetching stops at the
+    first page whose worst result cannot enter the heap
+    (See ResultFilter.page_stop(), Common.fetch_pages_async()).
+"""
+import re
+import heapq
+import logging
+
+SORT_KEYS = ['seeds', 'size', 'date']
+CATEGORIES = ['video', 'audio', 'applications', 'games', 'anime', 'porn', 'other']
+
+logger = logging.getLogger('log1')
+_filter = None
+
+
+def sort_value(result, key):
+    """Sort value of result: unknown values are lower than any known value."""
+    value = getattr(result, key)
+    return (value is not None, value or 0)
+
+
+class TopK:
+    """
+    TopK class.
+
+    Bounded min-heap of the k best results (by 'key'); the heap's
+    smallest entry (floor) is the one evicted first.
+    Results of equal value keep their order (earlier wins).
+
+    methods:
+    -- push():: Add a result (kept only if it beats the floor).
+    -- page_done():: Add a page of results; True if no later page can beat the floor.
+    -- results():: Return kept results, best first.
+    """
+
+    def __init__(self, k, key, accept=None):
+        """Initialisations ('accept' is the filter results must pass)."""
+        self.k = k
+        self.key = key
+        self.accept = accept
+        self.heap = []
+        self.count = 0
+
+    def full(self):
+        """True if heap holds k results."""
+        return len(self.heap) >= self.k
+
+    def push(self, result):
+        """Add a result."""
+        if self.accept is not None and not self.accept(result):
+            return
+        self.count += 1
+        entry = (sort_value(result, self.key), -self.count, result)
+        if not self.full():
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+    def page_done(self, results):
+        """
+        Add a page of results, in site's order (best first).
+
+        Returns True if heap is full and page's worst result (filtered
+        or not) is no better than the floor: later pages cannot beat it.
+        """
+        for result in results:
+            self.push(result)
+        if not results or not self.full():
+            return False
+        worst = min(sort_value(result, self.key) for result in results)
+        return worst <= self.heap[0][0]
+
+    def results(self):
+        """Return kept results, best first."""
+        return [entry[2] for entry in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+class ResultFilter:
+    """
+    ResultFilter class.
+
+    methods:
+    -- active():: True if any filter/sort is set.
+    -- pushdown():: Return site's query parameters for filters it can apply itself.
+    -- filter():: Return results that pass filters.
+    -- sort():: Sort results (in place).
+    -- select():: Sort results, keeping top-k only (--top-k).
+    -- page_stop():: Return early-stop check of paginated fetches (--top-k).
+    -- apply():: filter() + select().
+    """
+
+    def __init__(self, sort=None, min_seeds=None, max_size=None, category=None, regex=None, top_k=None):
+        """Initialisations (max_size in bytes; regex is matched case-insensitively)."""
+        if top_k is not None and sort is None:
+            sort = 'seeds'
+        self.top_k = top_k
+        self.sort_key = sort
+        self.min_seeds = min_seeds
+        self.max_size = max_size
+        self.category = category.lower() if category else None
+        self.regex = re.compile(regex, re.IGNORECASE) if regex else None
+
+    def active(self):
+        """True if any filter/sort is set."""
+        return any(value is not None for value in [
+            self.sort_key, self.min_seeds, self.max_size, self.category, self.regex])
+
+    def pushdown(self, sort_codes=None, category_codes=None):
+        """
+        Return (sort code, category code, pushed) for a site.
+
+        sort_codes/category_codes map --sort/--category values to the
+        site's own codes; None if site does not support it (or value is unknown).
+        pushed:: Names of filters the site applies itself (skipped by filter()).
+        """
+        sort_code = (sort_codes or {}).get(self.sort_key)
+        category_code = (category_codes or {}).get(self.category)
+        pushed = set()
+        if sort_code is not None:
+            pushed.add('sort')
+        if category_code is not None:
+            pushed.add('category')
+        return sort_code, category_code, pushed
+
+    def match_category(self, label, categories):
+        """
+        True if category 'label' (site's own) is --category.
+
+        'categories' maps site's labels (lower-cased; TPB: main category,
+        as in 'Video > Movies') to CATEGORIES. Without a mapping,
+        --category must be a part of the label.
+        """
+        if label is None:
+            return False
+        label = label.lower()
+        main = label.split('>')[0].strip()
+        return categories.get(main) == self.category or self.category in label
+
+    def accept(self, result, pushed=(), categories=None):
+        """
+        True if result passes all filters (except 'pushed' ones).
+
+        'categories':: Site's category mapping (See match_category());
+        None if site has no category data (category filter is skipped).
+        """
+        if self.min_seeds is not None and (result.seeds is None or result.seeds < self.min_seeds):
+            return False
+        if self.max_size is not None and (result.size is None or result.size > self.max_size):
+            return False
+        if self.category is not None and 'category' not in pushed and categories is not None:
+            if not self.match_category(result.category, categories):
+                return False
+        if self.regex is not None and self.regex.search(result.name) is None:
+            return False
+        return True
+
+    def filter(self, results, pushed=(), categories=None):
+        """Return results that pass filters (See accept())."""
+        if not self.active():
+            return results
+        return [result for result in results if self.accept(result, pushed, categories)]
+
+    def sort(self, results):
+        """
+        Sort results (in place), largest/newest first.
+
+        Results are sorted even if site sorted them: pages are merged,
+        and meta-search merges sites.
+        """
+        if self.sort_key is None:
+            return results
+        key = self.sort_key
+        results.sort(key=lambda result: sort_value(result, key), reverse=True)
+        return results
+
+    def select(self, results):
+        """Return sorted results; only the best top_k if set (See TopK)."""
+        if self.top_k is None:
+            return self.sort(list(results))
+        top = TopK(self.top_k, self.sort_key)
+        for result in results:
+            top.push(result)
+        return top.results()
+
+    def page_stop(self, pushed=(), categories=None):
+        """
+        Return early-stop check of paginated fetches, or None.
+
+        Only with --top-k, and only if site sorts by the same key
+        ('sort' pushed down): pages then arrive best-first.
+        The check is called with each page's results, in page order
+        (See Common.fetch_pages_async()); True means stop fetching.
+        """
+        if self.top_k is None or 'sort' not in pushed:
+            return None
+        top = TopK(self.top_k, self.sort_key, lambda result: self.accept(result, pushed, categories))
+
+        def stop(index, results):
+            if results is None or results == -1:
+                return False
+            return top.page_done(results)
+        return stop
+
+    def apply(self, results, pushed=(), categories=None):
+        """Return filtered and sorted results (See filter(), select())."""
+        results = self.filter(results, pushed, categories)
+        if self.sort_key is not None:
+            results = self.select(results)
+        return results
+
+
+def configure(sort=None, min_seeds=None, max_size=None, category=None, regex=None, top_k=None):
+    """Set filters for all searches (command line options)."""
+    global _filter
+    _filter = ResultFilter(sort, min_seeds, max_size, category, regex, top_k)
+    if _filter.active():
+        logger.debug("filters: sort=%s min_seeds=%s max_size=%s category=%s regex=%s top_k=%s" % (
+            _filter.sort_key, min_seeds, max_size, category, regex, top_k))
+
+
+def get_filter():
+    """Return configured filter (no filtering if not configured)."""
+    global _filter
+    if _filter is None:
+        _filter = ResultFilter()
+    return _filter
@@ -0,0 +1,159 @@
+"""
+Merge Module.
+
+Cross-site de-duplication of results.
+
+The same torrent listed on several sites has the same infohash
+(taken from its magnetic link). Results are merged on it:
+the merged result keeps max. seeds/leeches, all trackers (union)
+and the list of sites it was found on.
+
+Merging uses a hash index (infohash -> result), so adding n results
+is O(n) however many sites/pages they come from.
+"""
+import base64
+import binascii
+from urllib.parse import urlsplit, parse_qs, quote
+
+
+def infohash(magnet):
+    """
+    Return canonical infohash (upper-case hex) of magnetic link.
+
+    Both hex (40 chars) and base32 (32 chars) forms of
+    xt=urn:btih:<hash> are accepted. Returns None if there is none.
+    """
+    return parse_magnet(magnet)[0]
+
+
+def parse_magnet(magnet):
+    """
+    Parse magnetic link.
+
+    Returns (infohash, trackers); (None, []) if magnet is not valid.
+    """
+    if not magnet or not magnet.startswith('magnet:'):
+        return None, []
+    params = parse_qs(urlsplit(magnet).query)
+    trackers = params.get('tr', [])
+    for xt in params.get('xt', []):
+        if not xt.lower().startswith('urn:btih:'):
+            continue
+        value = xt[9:]
+        if len(value) == 40:
+            try:
+                binascii.unhexlify(value)
+                return value.upper(), trackers
+            except (binascii.Error, ValueError):
+                continue
+        elif len(value) == 32:
+            try:
+                return binascii.hexlify(base64.b32decode(value.upper())).decode().upper(), trackers
+            except (binascii.Error, ValueError):
+                continue
+    return None, trackers
+
+
+def build_magnet(info_hash, name, trackers):
+    """Build magnetic link from infohash, name and trackers."""
+    magnet = "magnet:?xt=urn:btih:%s&dn=%s" % (info_hash, quote(name))
+    for tracker in trackers:
+        magnet += "&tr=" + quote(tracker, safe='')
+    return magnet
+
+
+def more(value, current):
+    """True if count 'value' is larger than 'current' (None = unknown)."""
+    return value is not None and (current is None or value > current)
+
+
+class MergedResult:
+    """
+    MergedResult class.
+
+    One (possibly merged) result: the first TorrentResult found
+    ('result'), with seeds/leeches/magnet updated by duplicates.
+    Other values (category, uploader, ...) are those of 'result'.
+    The site's own record is never modified.
+    """
+
+    def __init__(self, result, module):
+        """Initialisations."""
+        self.result = result
+        self.module = module
+        self.sites = [result.site]
+        self.name = result.name
+        self.size = result.size
+        self.seeds = result.seeds
+        self.leeches = result.leeches
+        self.date = result.date
+        self.magnet = result.magnet
+        self.link = result.link
+        self.category = result.category
+        self.uploader = result.uploader
+        self.comments = result.comments
+        self.status = result.status
+        self.extra = result.extra
+        self.infohash, self.trackers = parse_magnet(result.magnet)
+
+    @property
+    def site(self):
+        """Sites the result was found on (comma-separated)."""
+        return ",".join(self.sites)
+
+    def merge(self, result):
+        """Merge a duplicate (TorrentResult of another site) into this result."""
+        if result.site not in self.sites:
+            self.sites.append(result.site)
+        if more(result.seeds, self.seeds):
+            self.seeds = result.seeds
+        if more(result.leeches, self.leeches):
+            self.leeches = result.leeches
+        if self.size is None:
+            self.size = result.size
+        _, trackers = parse_magnet(result.magnet)
+        known = set(self.trackers)
+        added = [t for t in trackers if t not in known]
+        if added:
+            self.trackers.extend(added)
+            self.magnet = build_magnet(self.infohash, self.name, self.trackers)
+
+
+class ResultIndex:
+    """
+    ResultIndex class.
+
+    Ordered results, de-duplicated on infohash.
+    Results without infohash (no magnetic link) are never merged.
+
+    methods:
+    -- add():: Add a result (merged into existing one, if duplicate).
+    """
+
+    def __init__(self):
+        """Initialisations."""
+        self.results = []
+        self.by_hash = {}
+        self.duplicates = 0
+
+    def add(self, result, module):
+        """
+        Add a result (TorrentResult) found by 'module'.
+
+        Returns True if result is new, False if it was merged.
+        """
+        info_hash, _ = parse_magnet(result.magnet)
+        if info_hash is not None:
+            existing = self.by_hash.get(info_hash)
+            if existing is not None:
+                existing.merge(result)
+                self.duplicates += 1
+                return False
+        merged = MergedResult(result, module)
+        self.results.append(merged)
+        if info_hash is not None:
+            self.by_hash[info_hash] = merged
+        return True
+
+    def __len__(self):
+        return len(self.results)
@@ -0,0 +1,278 @@
+"""
+Meta-search Module.
+
+Searches all enabled sites at once (-a/--all)
+and merges their results into one table.
+Torrents found on several sites are shown once (See merge module).
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import click
+import torrench.modules.distrowatch as distrowatch
+import torrench.modules.kickasstorrent as kat
+import torrench.modules.linuxtracker as linuxtracker
+import torrench.modules.nyaa as nyaa_module
+import torrench.modules.skytorrents as sky
+import torrench.modules.thepiratebay as tpb_module
+import torrench.modules.xbit as xbit_module
+from torrench.utilities.config import Config
+from torrench.utilities.engine import get_engine, run
+from torrench.utilities.merge import ResultIndex
+from torrench.utilities.result import format_size, format_count, index_cell
+from torrench.utilities.session import get_setting
+
+DEFAULT_SEARCH_DEADLINE = 60.0
+
+
+class MetaSearch(Config):
+    """
+    MetaSearch class.
+
+    All enabled sites are searched concurrently on the engine.
+    Results are merged into one table as each site answers.
+    Duplicates (same infohash) are merged into one row, listing
+    every site the torrent was found on.
+    Sites that do not answer within SEARCH_DEADLINE
+    (torrench.ini, default: 60 sec) are cancelled and skipped;
+    they (and sites that fail) are listed in self.failed.
+
+    TPB, KAT, SkyTorrents, Nyaa and XBit are only searched if
+    config file is set up and enabled (same as single-site searches).
+    """
+
+    def __init__(self, title, page_limit, only=None, limits=None):
+        """
+        Initialisations.
+
+        only:: Labels of sites to search (default: all enabled sites).
+        limits:: Per-site limits shared by several searches (See batch.SiteLimits).
+        """
+        Config.__init__(self)
+        self.title = title
+        self.pages = page_limit
+        self.only = only
+        self.limits = limits
+        self.logger = logging.getLogger('log1')
+        self.deadline = get_setting('SEARCH_DEADLINE', DEFAULT_SEARCH_DEADLINE)
+        self.index = 0
+        self.sites = 0
+        self.failed = []
+        self.total_fetch_time = 0
+        self.merged = ResultIndex()
+        self.masterlist = []
+        self.columns = [
+            ('SITE', lambda r, i: ",".join(r.sites)),
+            ('NAME', lambda r, i: r.name),
+            ('INDEX', index_cell),
+            ('SIZE', lambda r, i: format_size(r.size)),
+            ('S', lambda r, i: format_count(r.seeds)),
+            ('L', lambda r, i: format_count(r.leeches)),
+        ]
+
+    def get_sites(self):
+        """
+        Return sites to be searched.
+
+        List of (label, factory, parser); factory creates the module's
+        object, parser parses fetched results without displaying them.
+        """
+        sites = [
+            ('LinuxTracker', lambda: linuxtracker.LinuxTracker(self.title),
+                lambda m: m.parse_results()),
+            ('DistroWatch', lambda: distrowatch.DistroWatch(self.title.lower()),
+                lambda m: m.fetch_results()),
+        ]
+        if self.file_exists():
+            sites = [
+                ('TPB', lambda: tpb_module.ThePirateBay(self.title, self.pages),
+                    lambda m: m.parse_html(show=False)),
+                ('KAT', lambda: kat.KickassTorrents(self.title, self.pages),
+                    lambda m: m.parse_html(show=False)),
+                ('SkyTorrents', lambda: sky.SkyTorrents(self.title, self.pages),
+                    lambda m: m.parse_html(show=False)),
+                ('Nyaa', lambda: nyaa_module.NyaaTracker(self.title),
+                    lambda m: m.fetch_results()),
+                ('XBit', lambda: xbit_module.XBit(self.title),
+                    lambda m: m.parse_data(show=False)),
+            ] + sites
+        else:
+            self.logger.debug("Config file not setup! Searching public sites only.")
+        if self.only is not None:
+            sites = [site for site in sites if site[0] in self.only]
+        return sites
+
+    async def search_site(self, label, factory, parser):
+        """
+        Search one site.
+
+        Returns (module, results). A site that fails (or finds nothing)
+        gives no results; it never stops other sites.
+        The deadline starts once the site's slot (See batch.SiteLimits)
+        is acquired, so waiting for the slot is not counted.
+        """
+        if self.limits is not None:
+            async with self.limits.slot(label):
+                return await self._search_site_deadline(label, factory, parser)
+        return await self._search_site_deadline(label, factory, parser)
+
+    async def _search_site_deadline(self, label, factory, parser):
+        """See search_site()."""
+        try:
+            return await asyncio.wait_for(self._search_site(label, factory, parser), self.deadline)
+        except asyncio.TimeoutError:
+            click.echo(click.style("[%s] no answer within %.1f sec. Skipped." % (
+                label, self.deadline), fg="red"))
+            self.logger.debug("[%s] cancelled (deadline)" % (label))
+            self.failed.append(label)
+            return None, []
+
+    async def _search_site(self, label, factory, parser):
+        """See search_site()."""
+        engine = get_engine()
+        try:
+            module = await engine.call(factory)
+            if not await module.search_async():
+                # No working proxy, or page could not be fetched.
+                return self.site_failed(label)
+            await engine.call(parser, module)
+            return module, module.results()
+        except (Exception, SystemExit) as e:
+            # Modules exit on errors/no results when used standalone.
+            self.logger.exception(e)
+            return self.site_failed(label)
+
+    def site_failed(self, label):
+        """Record that site 'label' could not be searched. Returns (None, [])."""
+        click.echo(click.style("[%s] search failed. Skipped." % (label), fg="red"))
+        self.logger.debug("[%s] search failed" % (label))
+        self.failed.append(label)
+        return None, []
+
+    def add_results(self, label, module, results):
+        """Add results of a site to merged results (de-duplicated on infohash)."""
+        for result in results:
+            self.merged.add(result, module)
+
+    def build_output(self):
+        """
+        Build results list (masterlist, of MergedResult) from merged results.
+
+        Sites filtered their own results; merged results are sorted
+        again (--sort), since merging keeps max. seeds/leeches,
+        and only the best are kept (--top-k).
+        """
+        self.masterlist = self.filter.select(self.merged.results)
+        self.index = len(self.masterlist)
+
+    async def search_async(self):
+        """Search all sites concurrently (each within deadline)."""
+        start_time = time.time()
+        labels = {}
+        for label, factory, parser in self.get_sites():
+            task = asyncio.ensure_future(self.search_site(label, factory, parser))
+            labels[task] = label
+        pending = set(labels)
+        click.echo("Searching %d sites..." % (len(pending)))
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    module, results = task.result()
+                    if module is None:
+                        continue
+                    elapsed = time.time() - start_time
+                    click.echo(click.style("[%s] %d results [in %.2f sec]" % (
+                        labels[task], len(results), elapsed), fg="green"))
+                    self.logger.debug("[%s] %d results in %.2f sec" % (labels[task], len(results), elapsed))
+                    if results:
+                        self.sites += 1
+                    self.add_results(labels[task], module, results)
+        finally:
+            for task in pending:
+                task.cancel()
+        self.total_fetch_time = time.time() - start_time
+        self.build_output()
+
+    def after_output_text(self):
+        """Text to be displayed after results are displayed."""
+        click.echo("\nTotal %d torrents [%d sites]" % (self.index, self.sites))
+        if self.merged.duplicates:
+            click.echo("Merged %d duplicates (found on more than one site)" % (self.merged.duplicates))
+        click.echo("Total time: %.2f sec" % (self.total_fetch_time))
+        self.logger.debug("fetched ALL results in %.2f sec" % (self.total_fetch_time))
+        click.echo("\nEnter torrent's index value (Maximum one index)")
+
+    def select_torrent(self):
+        """
+        To select required torrent.
+
+        Torrents with magnetic link: print magnetic link / load to client.
+        Others (LinuxTracker/DistroWatch): .torrent file is downloaded.
+        """
+        self.logger.debug("Selecting torrent...")
+        temp = 9999
+        while(temp != 0):
+            try:
+                temp = click.prompt("\n(0=exit)\nindex > ", type=int)
+                self.logger.debug("selected index %d" % (temp))
+                if temp == 0:
+                    click.echo("\nBye!")
+                    self.logger.debug("Torrench quit!")
+                    break
+                elif temp < 0:
+                    click.echo("\nBad Input!")
+                    continue
+                result = self.masterlist[temp-1]
+                label, selected_torrent = ",".join(result.sites), result.name
+                magnet, link, module = result.magnet, result.link, result.module
+                click.echo("Selected index [%d] - [%s] %s\n" % (temp, label, click.style(selected_torrent, fg="yellow")))
+                self.logger.debug("selected torrent: [%s] %s ; index: %d" % (label, selected_torrent, temp))
+                if magnet is None:
+                    module.get_torrent(link)
+                    continue
+                temp2 = click.prompt("1. Print magnetic link [p]\n2. Load magnetic link to client [l]\n\nOption [p/l]: ", type=str)
+                temp2 = temp2.lower()
+                self.logger.debug("selected option: [%c]" % (temp2))
+                if temp2 == 'p':
+                    self.logger.debug("printing magnetic link and upstream link")
+                    click.echo("\nMagnetic link - %s" % (click.style(magnet, fg="red")))
+                    self.copy_magnet(magnet)
+                    if link is not None:
+                        click.echo("\n\nUpstream link - %s\n" % (click.style(link, fg="yellow")))
+                elif temp2 == 'l':
+                    try:
+                        self.logger.debug("Loading magnetic link to client")
+                        self.load_torrent(magnet)
+                    except Exception as e:
+                        self.logger.exception(e)
+                        continue
+            except (ValueError, IndexError, TypeError) as e:
+                click.echo("\nBad Input!")
+                self.logger.exception(e)
+                continue
+
+
+def main(title, page_limit):
+    """Execution begins here."""
+    try:
+        click.echo("\n[All sites]\n")
+        meta = MetaSearch(title, page_limit)
+        run(meta.search_async())
+        if meta.index == 0:
+            click.echo("\nNo results found for given input!")
+            meta.logger.debug("No results found for given input! Exiting!")
+            sys.exit(2)
+        meta.show_results(meta.masterlist, meta.columns)
+        if meta.output_format is None:
+            meta.after_output_text()
+            meta.select_torrent()
+    except KeyboardInterrupt:
+        meta.logger.debug("Keyboard interupt! Exiting!")
+        click.echo("\n\nAborted!")
+
+
+if __name__ == "__main__":
+    print("Its a module!")
@@ -0,0 +1,125 @@
+"""
+Normalize Module.
+
+Sizes, dates and counts of results arrive as free text, in a
+different format on every site. They are normalized here, once,
+at parse time:
+    - parse_size():: Size in bytes (int).
+    - parse_date():: Date as epoch timestamp (int, seconds, local time).
+    - parse_int():: Count (seeds, leeches, ...) as int.
+So results are sorted, filtered and merged on plain numbers.
+
+Formats understood:
+    Sizes:: '1.37 GiB', '700 MB', '1.37GB' (LinuxTracker), '1,024 bytes',
+        plain numbers (bytes); non-breaking spaces and ANSI colours are ignored.
+    Dates:: '2017-10-20', '2017-10-20 12:34[:56]' (Nyaa/DistroWatch/XBit),
+        '10-20 2017', '10-20 12:34', 'Today 12:34', 'Y-day 12:34',
+        '5 mins ago' (TPB), '20/10/2017' (LinuxTracker), ages such as
+        '2 days' (KAT) and '1 week ago' (SkyTorrents), epoch numbers.
+
+The same texts repeat across rows and pages (dates of a day, common
+sizes), so parsing is cached (functools.lru_cache, CACHE_SIZE entries).
+Relative dates are cached as ages and resolved against current time
+on every call; 'Today'/'Y-day' are cached per day.
+"""
+import re
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+CACHE_SIZE = 4096
+
+SIZE_UNITS = {
+    'b': 1, 'bytes': 1,
+    'kb': 1000, 'mb': 1000**2, 'gb': 1000**3, 'tb': 1000**4,
+    'kib': 1024, 'mib': 1024**2, 'gib': 1024**3, 'tib': 1024**4,
+}
+AGE_UNITS = {
+    'sec': 1, 'min': 60, 'hour': 3600, 'day': 86400,
+    'week': 7 * 86400, 'month': 30 * 86400, 'year': 365 * 86400,
+}
+
+ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+SIZE_RE = re.compile(r'([\d.,]+)\s*([a-z]*)')
+AGE_RE = re.compile(r'(\d+)\s*(sec|min|hour|day|week|month|year)')
+# (regex, converter of match to datetime); 'today' is given to converters.
+DATE_PATTERNS = [
+    (re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})(?:[ t](\d{1,2}):(\d{2})(?::(\d{2}))?)?'),
+        lambda m, today: datetime(*[int(g or 0) for g in m.groups()])),
+    (re.compile(r'(\d{1,2})-(\d{1,2}) (\d{4})'),
+        lambda m, today: datetime(int(m.group(3)), int(m.group(1)), int(m.group(2)))),
+    (re.compile(r'(\d{1,2})-(\d{1,2}) (\d{1,2}):(\d{2})'),
+        lambda m, today: datetime(today.year, *[int(g) for g in m.groups()])),
+    (re.compile(r'(today|y-day|yesterday) (\d{1,2}):(\d{2})'),
+        lambda m, today: datetime.combine(
+            today if m.group(1) == 'today' else today - timedelta(days=1),
+            datetime.min.time()).replace(hour=int(m.group(2)), minute=int(m.group(3)))),
+    (re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})'),
+        lambda m, today: datetime(int(m.group(3)), int(m.group(2)), int(m.group(1)))),
+]
+
+
+def clean(text):
+    """Text without colours and non-breaking spaces, lower-case and stripped."""
+    return ANSI_RE.sub('', str(text)).replace('\xa0', ' ').strip().lower()
+
+
+def parse_int(text):
+    """Integer out of text ('1,234' -> 1234); None if there is none."""
+    if text is None or isinstance(text, int):
+        return text
+    try:
+        return int(clean(text).replace(',', ''))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_size(text):
+    """Size in bytes out of text ('1.37 GiB' -> 1471026299); None if unknown."""
+    if text is None or isinstance(text, int):
+        return text
+    match = SIZE_RE.search(clean(text))
+    if match is None:
+        return None
+    unit = SIZE_UNITS.get(match.group(2) or 'b')
+    if unit is None:
+        return None
+    try:
+        return int(float(match.group(1).replace(',', '')) * unit)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def date_spec(text, today):
+    """
+    Parse date text (See parse_date()).
+
+    Returns (timestamp, age): timestamp of an absolute date,
+    or age (seconds before now) of a relative one; (None, None) if unknown.
+    """
+    text = clean(text)
+    if text.isdigit():
+        return int(text), None
+    for pattern, convert in DATE_PATTERNS:
+        match = pattern.match(text)
+        if match is not None:
+            try:
+                return int(time.mktime(convert(match, today).timetuple())), None
+            except (ValueError, OverflowError):
+                return None, None
+    match = AGE_RE.search(text)
+    if match is not None:
+        return None, int(match.group(1)) * AGE_UNITS[match.group(2)]
+    return None, None
+
+
+def parse_date(text):
+    """Epoch timestamp out of date text (absolute, or age '2 days ago'); None if unknown."""
+    if text is None or isinstance(text, int):
+        return text
+    timestamp, age = date_spec(text, date.today())
+    if age is not None:
+        return int(time.time()) - age
+    return timestamp
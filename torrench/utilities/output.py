@@ -0,0 +1,142 @@
+"""
+Output Module.
+
+Machine-readable output of results (--format ndjson|json|csv),
+for scripting.
+
+Results are written to stdout one record at a time, as they are
+serialized: no table is built, nothing is coloured, and the
+interactive selection is skipped. Everything else modules print
+(progress, timings, errors) goes to stderr, so stdout only carries
+records (See configure()).
+
+Record fields (FIELDS) are the values of TorrentResult, as parsed:
+size in bytes, date as epoch timestamp, None (null / empty) if unknown.
+'site' of merged results (-a) lists all sites, comma-separated.
+JSON records also carry site-specific values ('extra').
+"""
+import os
+import sys
+import csv
+import json
+import logging
+
+FORMATS = ['ndjson', 'json', 'csv']
+FIELDS = ['site', 'name', 'size', 'seeds', 'leeches', 'date', 'category',
+          'uploader', 'comments', 'status', 'magnet', 'link']
+
+logger = logging.getLogger('log1')
+_format = None
+_stream = None
+
+
+def record(result):
+    """Record (dict) of a result (TorrentResult / MergedResult)."""
+    return dict((field, getattr(result, field, None)) for field in FIELDS)
+
+
+class RecordWriter:
+    """
+    RecordWriter class.
+
+    Writes records in one of FORMATS to 'stream', one at a time.
+    Several batches of results can be written (e.g. one per query,
+    See batch module); the output stays one valid document
+    (one JSON array, one CSV header).
+
+    methods:
+    -- write():: Write results (any iterable); returns count.
+    -- close():: Finish document (closes JSON array).
+    """
+
+    def __init__(self, output_format, stream, query=False):
+        """Initialisations (query=True: records start with the 'query' they answer)."""
+        self.format = output_format
+        self.stream = stream
+        self.fields = (['query'] if query else []) + FIELDS
+        self.count = 0
+        self.csv = None
+
+    def record(self, result, query):
+        """Record of result (with 'query', if set)."""
+        if 'query' in self.fields:
+            return dict([('query', query)] + list(record(result).items()))
+        return record(result)
+
+    def write(self, results, query=None):
+        """Write results (any iterable). Returns count."""
+        count = 0
+        for result in results:
+            data = self.record(result, query)
+            if self.format == 'csv':
+                if self.csv is None:
+                    self.csv = csv.writer(self.stream)
+                    self.csv.writerow(self.fields)
+                self.csv.writerow(['' if data[field] is None else data[field] for field in self.fields])
+            else:
+                data['extra'] = getattr(result, 'extra', None)
+                if self.format == 'json':
+                    self.stream.write((",\n" if self.count else "[\n") + json.dumps(data))
+                else:
+                    self.stream.write(json.dumps(data) + "\n")
+            count += 1
+            self.count += 1
+        self.stream.flush()
+        return count
+
+    def close(self):
+        """Finish document."""
+        if self.format == 'json':
+            self.stream.write("\n]\n" if self.count else "[]\n")
+        elif self.format == 'csv' and self.csv is None:
+            csv.writer(self.stream).writerow(self.fields)
+        self.stream.flush()
+
+
+def configure(output_format=None):
+    """
+    Set output format (None: tables, interactive).
+
+    With a machine format, stdout is kept for records only:
+    sys.stdout is pointed to stderr, so that messages printed by
+    modules (click.echo()) go to stderr.
+    """
+    global _format, _stream
+    _format = output_format
+    if output_format is not None and _stream is None:
+        _stream = sys.stdout
+        sys.stdout = sys.stderr
+        logger.debug("output format: %s" % (output_format))
+
+
+def get_format():
+    """Return output format (None if results are displayed as tables)."""
+    return _format
+
+
+def get_writer(query=False):
+    """Return a RecordWriter to stdout in configured format."""
+    return RecordWriter(_format, _stream, query)
+
+
+def closed_pipe():
+    """
+    Handle reader going away (e.g. '| head'): output stops quietly.
+
+    Further writes (and flush at exit) go nowhere.
+    """
+    logger.debug("stdout closed by reader; %s output stopped" % (_format))
+    os.dup2(os.open(os.devnull, os.O_WRONLY), _stream.fileno())
+
+
+def write_results(results):
+    """Write results (any iterable) to stdout in configured format. Returns count."""
+    writer = get_writer()
+    try:
+        count = writer.write(results)
+        writer.close()
+    except BrokenPipeError:
+        closed_pipe()
+        return 0
+    logger.debug("wrote %d %s records" % (count, _format))
+    return count
@@ -0,0 +1,175 @@
+"""
+Proxy Store Module.
+
+Keeps proxy health across runs, so startup does not have to
+re-probe (and, for TPB, re-scrape) every proxy each time.
+
+For every site/proxy pair the store records:
+    - last_success:: Time of last successful probe.
+    - failures:: Number of consecutive failed probes.
+    - latency:: Time taken by last successful probe (sec).
+It also holds the scraped TPB proxy list.
+
+Store is saved as JSON in the torrench data directory
+($XDG_DATA_HOME/torrench, fallback: $HOME/.local/share/torrench).
+Entries older than PROXY_TTL (torrench.ini, default: 1 hour) are not
+trusted and the proxy is probed again.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from torrench.utilities.logger import log_directory
+from torrench.utilities.session import get_setting
+
+DEFAULT_PROXY_TTL = 3600
+PROXY_LIST_TTL = 86400
+STORE_FILE = os.path.join(log_directory, 'proxies.json')
+
+_lock = threading.Lock()
+_store = None
+
+
+class ProxyStore:
+    """
+    ProxyStore class.
+
+    methods:
+    -- fresh_proxy():: Return recently verified (and fastest) proxy, if any.
+    -- rank():: Order proxies fastest-healthy-first.
+    -- record_success() / record_failure():: Update a proxy's health.
+    -- get_list() / set_list():: Cached proxy list for a site (TPB).
+    -- save():: Write store to disk.
+    """
+
+    def __init__(self, path=STORE_FILE):
+        """Initialisations."""
+        self.path = path
+        self.ttl = get_setting('PROXY_TTL', DEFAULT_PROXY_TTL)
+        self.logger = logging.getLogger('log1')
+        self.lock = threading.Lock()
+        self.data = {}
+        self.touched = set()
+        self.load()
+
+    def load(self):
+        """Load store from disk. A missing/corrupt file gives an empty store."""
+        try:
+            with open(self.path, 'r') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except (ValueError, OSError) as e:
+            self.logger.exception(e)
+            self.data = {}
+
+    def save(self):
+        """
+        Write store to disk (atomically, through a temp file).
+
+        Only sites updated through this store are written; other sites
+        are re-read from disk first, so several stores (one per module,
+        e.g. in meta-search) do not overwrite each other.
+        """
+        with self.lock:
+            temp_path = self.path + '.%d.tmp' % (threading.get_ident())
+            try:
+                try:
+                    with open(self.path, 'r') as f:
+                        data = json.load(f)
+                except (ValueError, OSError):
+                    data = {}
+                for site in self.touched:
+                    data[site] = self.data[site]
+                self.data.update(data)
+                with open(temp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                self.logger.exception(e)
+
+    def _site(self, site, touch=False):
+        if touch:
+            self.touched.add(site)
+        return self.data.setdefault(site, {'proxies': {}, 'list': None})
+
+    def _entry(self, site, proxy):
+        return self._site(site, touch=True)['proxies'].setdefault(proxy, {
+            'last_success': 0, 'failures': 0, 'latency': None})
+
+    def is_fresh(self, entry):
+        """Entry was verified within TTL, and has not failed since."""
+        return entry['failures'] == 0 and time.time() - entry['last_success'] < self.ttl
+
+    def record_success(self, site, proxy, latency):
+        """Record a successful probe."""
+        with self.lock:
+            entry = self._entry(site, proxy)
+            entry['last_success'] = time.time()
+            entry['failures'] = 0
+            entry['latency'] = latency
+
+    def record_failure(self, site, proxy):
+        """Record a failed probe."""
+        with self.lock:
+            entry = self._entry(site, proxy)
+            entry['failures'] += 1
+
+    def fresh_proxy(self, site, proxies):
+        """
+        Return fastest of 'proxies' verified within TTL.
+
+        Returns None if there is no such proxy.
+        """
+        entries = self._site(site)['proxies']
+        fresh = [p for p in proxies if p in entries and self.is_fresh(entries[p])]
+        if not fresh:
+            return None
+        return min(fresh, key=lambda p: entries[p]['latency'])
+
+    def rank(self, site, proxies):
+        """
+        Order proxies fastest-healthy-first.
+
+        Healthy proxies (no failure streak) come first, by latency;
+        then proxies never seen before; then failing proxies, by
+        failure streak (shortest first).
+        """
+        entries = self._site(site)['proxies']
+
+        def key(proxy):
+            entry = entries.get(proxy)
+            if entry is None:
+                return (1, 0)
+            if entry['failures'] == 0 and entry['latency'] is not None:
+                return (0, entry['latency'])
+            return (2, entry['failures'])
+        return sorted(proxies, key=key)
+
+    def get_list(self, site):
+        """Return cached proxy list for 'site', or None if missing/expired."""
+        cached = self._site(site)['list']
+        if cached is None or time.time() - cached['updated'] > PROXY_LIST_TTL:
+            return None
+        return cached['urls']
+
+    def set_list(self, site, urls):
+        """Cache proxy list for 'site'."""
+        with self.lock:
+            self._site(site, touch=True)['list'] = {'updated': time.time(), 'urls': urls}
+
+
+def get_proxy_store():
+    """
+    Return the shared store.
+
+    Store is loaded on first use and shared by all modules, so a proxy
+    verified by one search is re-used by the next ones (e.g. --batch)
+    without probing or re-reading the store.
+    """
+    global _store
+    with _lock:
+        if _store is None:
+            _store = ProxyStore()
+        return _store
@@ -0,0 +1,93 @@
+"""
+Result Module.
+
+TorrentResult - the record every module emits for a search result.
+
+Values are kept typed (seeds/leeches as int, size in bytes, date as
+epoch timestamp; See normalize module); they are only formatted when
+results are displayed (See render()). So results can be sorted,
+filtered and serialized without re-parsing display strings.
+"""
+import time
+
+
+def format_size(size):
+    """Human-readable size ('1.37 GiB'); '-' if unknown."""
+    if size is None:
+        return '-'
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024:
+            return ('%d %s' if unit == 'B' else '%.2f %s') % (size, unit)
+        size /= 1024
+    return '%.2f TiB' % (size)
+
+
+def format_date(timestamp):
+    """Date (epoch timestamp) as YYYY-MM-DD; '-' if unknown."""
+    return time.strftime('%Y-%m-%d', time.localtime(timestamp)) if timestamp is not None else '-'
+
+
+def format_count(count):
+    """Seeds/leeches/comments; '-' if unknown."""
+    return str(count) if count is not None else '-'
+
+
+class TorrentResult:
+    """
+    TorrentResult class.
+
+    One search result. Unknown values are None.
+
+    attributes:
+    -- name, site, category, uploader:: str
+    -- size:: int (bytes)
+    -- seeds, leeches, comments:: int
+    -- date:: Epoch timestamp (int)
+    -- magnet:: Magnetic link (None for sites that only serve .torrent files)
+    -- link:: Upstream link (torrent page / .torrent file)
+    -- status:: Uploader status (e.g. 'VIP', 'Trusted', 'Verified')
+    -- extra:: Site-specific values (dict), e.g. file count, votes.
+    """
+
+    __slots__ = ('name', 'site', 'category', 'uploader', 'size', 'seeds', 'leeches',
+                 'comments', 'date', 'magnet', 'link', 'status', 'extra')
+
+    def __init__(self, name, site, size=None, seeds=None, leeches=None, date=None,
+                 magnet=None, link=None, category=None, uploader=None,
+                 comments=None, status=None, extra=None):
+        """Initialisations."""
+        self.name = name
+        self.site = site
+        self.size = size
+        self.seeds = seeds
+        self.leeches = leeches
+        self.date = date
+        self.magnet = magnet
+        self.link = link
+        self.category = category
+        self.uploader = uploader
+        self.comments = comments
+        self.status = status
+        self.extra = extra
+
+    def __repr__(self):
+        return "TorrentResult(%r, %r)" % (self.site, self.name)
+
+
+def render(results, columns):
+    """
+    Format results for display.
+
+    'columns' is a list of (header, formatter); formatter(result, index)
+    returns the cell of a result (index starts at 1).
+    Returns (table rows, headers); rows are formatted lazily, one at a
+    time, as they are consumed (See table.TableWriter).
+    """
+    rows = ([formatter(result, index) for _, formatter in columns]
+            for index, result in enumerate(results, 1))
+    return rows, [header for header, _ in columns]
+
+
+def index_cell(result, index):
+    """INDEX cell ('--N--')."""
+    return "--%d--" % (index)
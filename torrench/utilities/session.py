@@ -0,0 +1,101 @@
+"""
+Session Module.
+
+This module provides one shared, connection-pooled HTTP session.
+All modules route their requests through it, so consecutive requests
+to the same host (pages of one search, comment pages of a torrent, ...)
+reuse an open (keep-alive) connection instead of paying a fresh
+TCP + TLS handshake each time.
+
+Pool size, default timeout and the number of pages fetched in parallel
+can be set in torrench.ini (POOL_SIZE / TIMEOUT / MAX_WORKERS).
+Defaults are used if not set.
+"""
+import os
+import logging
+import threading
+from configparser import ConfigParser, Error as ConfigError
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_MAX_WORKERS = 5
+DEFAULT_HEADERS = {
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+logger = logging.getLogger('log1')
+_lock = threading.Lock()
+_session = None
+
+
+class PooledSession(requests.Session):
+    """
+    PooledSession class.
+
+    A requests.Session with a per-host connection pool
+    and a default timeout applied to every request.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        """Initialisations."""
+        requests.Session.__init__(self)
+        self.timeout = timeout
+        self.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """Use default timeout if none is given."""
+        kwargs.setdefault('timeout', self.timeout)
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+def get_setting(name, default):
+    """
+    Read optional setting 'name' from torrench.ini.
+
+    Value is converted to the type of 'default'.
+    Missing/blank/bad values fallback to 'default'.
+    """
+    config_dir = os.getenv('XDG_CONFIG_HOME', os.path.expanduser(os.path.join('~', '.config')))
+    config_file = os.path.join(config_dir, 'torrench', 'torrench.ini')
+    if not os.path.isfile(config_file):
+        return default
+    config = ConfigParser()
+    try:
+        config.read(config_file)
+        value = config.get('Torrench-Config', name, fallback='')
+        if value != '':
+            return type(default)(value)
+    except (ValueError, ConfigError) as e:
+        logger.exception(e)
+    return default
+
+
+def get_session():
+    """
+    Return the shared session.
+
+    Session is created on first use and reused afterwards.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            pool_size = get_setting('POOL_SIZE', DEFAULT_POOL_SIZE)
+            timeout = get_setting('TIMEOUT', DEFAULT_TIMEOUT)
+            _session = PooledSession(pool_size, timeout)
+            logger.debug("created session (pool_size: %d ; timeout: %s)" % (pool_size, timeout))
+        return _session
+
+
+def close_session():
+    """Close the shared session (and its pooled connections)."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,113 @@
+"""
+Table Module.
+
+Streaming renderer of result tables (grid layout).
+
+Rows are written one by one as they are formatted; the rendered
+table is never held in memory. Column widths are fixed before the
+first row is written:
+    - Width of a column is the widest of its header and of the cells
+      of the first SAMPLE_ROWS rows (estimate; only these are buffered).
+    - If the table is wider than the terminal, the widest column
+      (e.g. torrent names) is narrowed to fit, down to MIN_WIDTH.
+    - Cells wider than their column are truncated ('...').
+Widths count visible characters only: ANSI colours are ignored
+(and kept) when measuring and truncating cells.
+"""
+import re
+import shutil
+import itertools
+import click
+
+SAMPLE_ROWS = 50
+MIN_WIDTH = 20
+ELLIPSIS = '...'
+ANSI_RE = re.compile(r'(\x1b\[[0-9;]*m)')
+RESET = '\x1b[0m'
+
+
+def visible_len(text):
+    """Length of text as displayed (without ANSI colours)."""
+    return len(ANSI_RE.sub('', text))
+
+
+def fit(text, width):
+    """Return text padded/truncated to 'width' visible characters."""
+    length = visible_len(text)
+    if length <= width:
+        return text + ' ' * (width - length)
+    keep = max(0, width - len(ELLIPSIS))
+    parts = []
+    styled = False
+    for part in ANSI_RE.split(text):
+        if ANSI_RE.match(part):
+            parts.append(part)
+            styled = True
+        elif keep > 0:
+            parts.append(part[:keep])
+            keep -= len(part[:keep])
+    if styled:
+        parts.append(RESET)
+    return ''.join(parts) + ELLIPSIS[:width]
+
+
+class TableWriter:
+    """
+    TableWriter class.
+
+    Writes a grid table, row by row.
+
+    methods:
+    -- write():: Write header and all rows (any iterable, consumed lazily).
+    """
+
+    def __init__(self, headers, widths=None, max_width=None, echo=click.echo):
+        """
+        Initialisations.
+
+        widths:: Fixed column widths (None: estimated, See module docstring).
+        max_width:: Table width limit (default: terminal width).
+        """
+        self.headers = [str(header) for header in headers]
+        self.widths = widths
+        self.max_width = max_width or shutil.get_terminal_size().columns
+        self.echo = echo
+        self.rows = 0
+
+    def estimate_widths(self, sample):
+        """Column widths out of headers and sample rows, narrowed to max_width."""
+        widths = [len(header) for header in self.headers]
+        for row in sample:
+            for column, cell in enumerate(row):
+                widths[column] = max(widths[column], visible_len(cell))
+        # Borders: '| ' + ' | '.join() + ' |'
+        overflow = sum(widths) + 3 * len(widths) + 1 - self.max_width
+        if overflow > 0:
+            widest = widths.index(max(widths))
+            widths[widest] = max(MIN_WIDTH, widths[widest] - overflow)
+        return widths
+
+    def line(self, char='-'):
+        """Separator line."""
+        return '+' + '+'.join(char * (width + 2) for width in self.widths) + '+'
+
+    def row(self, cells):
+        """Rendered row."""
+        return '| ' + ' | '.join(fit(cell, width) for cell, width in zip(cells, self.widths)) + ' |'
+
+    def write(self, rows):
+        """Write table: header, then rows as they come (cells are str)."""
+        rows = iter(rows)
+        sample = []
+        if self.widths is None:
+            sample = [[str(cell) for cell in row] for row in itertools.islice(rows, SAMPLE_ROWS)]
+            self.widths = self.estimate_widths(sample)
+        separator = self.line()
+        self.echo("\n" + separator)
+        self.echo(self.row(self.headers))
+        self.echo(self.line('='))
+        for cells in itertools.chain(sample, rows):
+            self.echo(self.row([str(cell) for cell in cells]))
+            self.echo(separator)
+            self.rows += 1
+        return self.rows